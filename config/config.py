@@ -5,6 +5,11 @@ class Settings(BaseSettings):
     ROCKETMQ_NAME_SERVER: str = "localhost:9876"
     ROCKETMQ_GROUP_ID: str = "vision_engine_group"
     ROCKETMQ_TOPIC: str = "vision_results"
+    ROCKETMQ_BATCH_SIZE: int = 32      # 每批最多发送的消息数
+    ROCKETMQ_LINGER_MS: float = 5      # 有消息正在发送时，新批次最长等待时间（毫秒）
+    ROCKETMQ_SEND_WORKERS: int = 2     # 发送线程数
+    ROCKETMQ_MAX_PENDING: int = 10000  # 等待发送和正在发送的消息数上限
+    ROCKETMQ_MESSAGE_FORMAT: str = "json"  # 消息体编码格式：json、msgpack或protobuf（DetectionResult），写入消息的format属性
     
     # MinIO配置
     MINIO_ENDPOINT: str = "localhost:9000"
@@ -12,21 +17,98 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str = "minioadmin"
     MINIO_BUCKET: str = "vision-alerts"
     MINIO_SECURE: bool = False
+    MINIO_REGION: str = "us-east-1"
+    MINIO_MAX_CONNECTIONS: int = 16     # 上传共享连接池大小
+    MINIO_CONNECT_TIMEOUT: float = 5    # 连接超时时间（秒）
+    MINIO_READ_TIMEOUT: float = 60      # 读取超时时间（秒）
+    MINIO_UPLOAD_WORKERS: int = 8       # 上传线程数
+    MINIO_UPLOAD_QUEUE_SIZE: int = 64   # 未完成上传数上限，达到上限时新的上传等待
+    MINIO_PART_SIZE: int = 10 * 1024 * 1024  # 分片上传的分片大小（字节），超过该大小的对象分片上传
     
     # KServe配置
     KSERVE_NAMESPACE: str = "kserve-models"
+    KSERVE_URL_TEMPLATE: str = "http://{endpoint}.{namespace}.svc.cluster.local"  # 推理服务地址模板
+    KSERVE_PROTOCOL: str = "v1"              # 默认推理协议：v1（JSON+JPEG）或v2（二进制张量，本地预处理）
+    KSERVE_MAX_CONNECTIONS: int = 32         # 每个endpoint的最大连接数
+    KSERVE_MAX_CONCURRENCY: int = 16         # 每个endpoint的最大并发请求数
+    KSERVE_KEEPALIVE_TIMEOUT: float = 60     # 空闲连接保持时间（秒）
+    KSERVE_REQUEST_TIMEOUT: float = 10       # 推理请求超时时间（秒）
+    KSERVE_FAILURE_THRESHOLD: int = 5        # 连续失败多少次后标记endpoint不健康
+    KSERVE_UNHEALTHY_COOLDOWN: float = 5     # 不健康endpoint的冷却时间（秒）
+    INFERENCE_MAX_BATCH_SIZE: int = 1        # 推理请求最大批大小，1表示不批处理；V1协议批处理时请求为instances/predictions格式，需要模型服务支持
+    INFERENCE_MAX_BATCH_WAIT_MS: float = 10  # 批次最长等待时间（毫秒）
     
     # gRPC服务配置
     GRPC_PORT: int = 50051
     GRPC_MAX_WORKERS: int = 10
+    GRPC_WORKERS: int = 1                  # 工作进程数，大于1时各进程通过SO_REUSEPORT共享服务端口
+    GRPC_WORKER_INDEX: int = 0             # 当前工作进程序号，由主进程为各工作进程设置
+    GRPC_WORKER_BASE_PORT: int = 50100     # 工作进程内部端口的起始值，用于将视频流请求转发到所属进程
+    HASH_RING_VNODES: int = 100            # 一致性哈希环上每个节点的虚拟节点数
+    
+    # 集群视频流放置配置
+    PLACEMENT_STORE: str = "none"          # 放置信息存储：none（不启用）、memory（进程内）或sqlite
+    PLACEMENT_SQLITE_PATH: str = "data/placement.db"  # SQLite存储文件路径
+    PLACEMENT_NODE_ID: str = ""            # 节点ID，为空时使用主机名
+    PLACEMENT_NODE_CAPACITY: int = 64      # 节点可处理的最大视频流数
+    PLACEMENT_INTERVAL: float = 5          # 心跳及重新分配的间隔（秒）
+    PLACEMENT_LEASE_TTL: float = 15        # 节点和视频流租约的有效期（秒），节点离开后超过该时间由其他节点接管
+    GRPC_MAX_MESSAGE_MB: int = 64          # 单个gRPC消息的最大大小（MB），批量图片请求需要较大的上限
+    GRPC_MAX_CONCURRENT_IMAGES: int = 64   # 节点上同时处理的图片检测数上限
+    GRPC_STREAM_MAX_INFLIGHT: int = 32     # 图片流接口每个流未返回的响应数上限，达到上限时暂停读取请求
+    GRPC_MAX_BATCH_IMAGES: int = 64        # 批量图片接口单次请求的最大图片数
+    GRPC_SHUTDOWN_GRACE: float = 10        # 收到停止信号后等待进行中请求完成的宽限期（秒）
+    STATS_LOG_INTERVAL: float = 60         # 运行状态（视频流统计、缓冲区和队列占用）的日志间隔（秒），0表示不输出
     
     # 视频处理配置
     DEFAULT_FRAME_INTERVAL: int = 1  # 默认抽帧间隔（秒）
-    VIDEO_CHUNK_DURATION: int = 10   # 视频片段持续时间（秒）
+    VIDEO_CHUNK_DURATION: int = 10   # 预警视频片段中预警前的时长（pre-roll，秒）
+    ALERT_POST_ROLL_SECONDS: int = 5 # 预警视频片段中预警后的时长（post-roll，秒）
+    DECODER_QUEUE_SIZE: int = 30     # 解码线程与处理协程之间的帧队列长度
+    DECODER_OPEN_TIMEOUT: float = 10.0  # 打开视频流的超时时间（秒）
+    DECODE_MODE: str = "full"        # 默认解码方式：full（解码全部帧）、sampled（只转换输出抽样帧，OpenCV仍解码全部帧；packet直通模式下抽样间隔不少于两帧时不解码非参考帧）或keyframe（只解码关键帧，需要packet直通模式，否则按sampled处理）；reencode模式下抽样解码的预警视频片段只包含抽样帧
+    STREAM_PACING: str = "auto"      # 视频流读取方式：auto（按地址协议判断）、live（只对最新的帧推理，积压的旧帧不推理，但已由解码线程写入预警片段缓冲区）或replay（逐帧处理）
+    VIDEO_CLIP_MODE: str = "reencode"  # 预警视频片段生成方式：reencode（解码帧重新编码）或passthrough（压缩数据包直接封装，需要PyAV）
+    TIMER_WHEEL_TICK: float = 1.0    # 调度时间轮的tick（秒），视频流在调度窗口开始后最多延迟一个tick恢复
+    TIMER_WHEEL_SLOTS: int = 3600    # 调度时间轮的槽位数
+    BATCH_JOB_WORKERS: int = 4       # 离线批量视频处理的进程数
+    BATCH_SEGMENT_SECONDS: float = 60  # 离线批量视频处理的分段时长（秒）
+    BATCH_JOB_RETENTION: int = 100   # 内存中保留的已结束批量任务数
+    CLIP_ENCODER_WORKERS: int = 2    # 预警视频片段后台编码线程数
+    CLIP_ENCODER_MAX_PENDING: int = 8  # 同时等待编码的预警视频片段上限
+    
+    # 运动过滤配置
+    MOTION_GATE_THRESHOLD: float = 0          # 默认运动阈值（变化像素比例），画面变化低于该比例时跳过推理，0表示不过滤
+    MOTION_GATE_PIXEL_DIFF: int = 25          # 灰度差超过该值的像素视为变化
+    MOTION_GATE_WIDTH: int = 160              # 帧差比较前缩放到的宽度（像素）
+    MOTION_GATE_MAX_SKIP_SECONDS: float = 30  # 最长连续跳过推理的时间（秒），超过后强制推理一次
+    
+    # 自适应抽帧配置
+    ADAPTIVE_SAMPLING_ENABLED: bool = False     # 是否对所有视频流启用自适应抽帧，未启用时可按视频流指定间隔范围启用
+    ADAPTIVE_MIN_FRAME_INTERVAL: float = 0.2    # 有检测目标时的抽帧间隔（秒）
+    ADAPTIVE_MAX_FRAME_INTERVAL: float = 5      # 空闲时的最大抽帧间隔（秒）
+    ADAPTIVE_SAMPLING_BACKOFF: float = 2        # 每次无检测结果后抽帧间隔的放大倍数
+    ADAPTIVE_INFERENCE_BUDGET: float = 0        # 节点上所有视频流每秒的推理次数上限，0表示不限制
+    
+    # 帧缓冲区配置
+    FRAME_BUFFER_MEMORY_BUDGET_MB: int = 2048  # 节点所有帧缓冲区的内存预算（MB），0表示不限制
+    FRAME_BUFFER_COMPRESSION: str = "none"     # 缓冲帧压缩方式：none、jpeg（有损）或png（无损）
+    FRAME_BUFFER_JPEG_QUALITY: int = 90        # JPEG压缩质量
+    FRAME_BUFFER_MIN_DURATION: int = 2         # 超出预算时缓冲区可缩减到的最小时长（秒）
     
     # 存储配置
     ALERT_RETENTION_DAYS: int = 30   # 预警数据保留天数
     
+    # 本地预写队列配置
+    SPOOL_DIR: str = "data/spool"    # 待上传数据和待发送消息的本地存储目录
+    SPOOL_MAX_MB: int = 1024         # 队列最大磁盘占用（MB），超出时丢弃最旧的数据
+    SPOOL_SEGMENT_MB: int = 64       # 单个段文件大小（MB）
+    SPOOL_RETRY_INITIAL_DELAY: float = 0.5  # 投递失败后的首次重试间隔（秒）
+    SPOOL_RETRY_MAX_DELAY: float = 30       # 投递失败后的最大重试间隔（秒）
+    SPOOL_MAX_ATTEMPTS: int = 12            # 单条记录的最大投递次数，超过后移入死信文件
+    SPOOL_DELIVERY_CONCURRENCY: int = 8     # 每种记录类型（上传、消息）的并发投递数
+    SPOOL_MAX_IN_FLIGHT: int = 1024         # 已读出、尚未完成投递的最大记录数
+    
     class Config:
         env_file = ".env"
 
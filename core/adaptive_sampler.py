@@ -0,0 +1,77 @@
+import time
+from typing import Dict
+
+from config.config import settings
+
+class AdaptiveSampler:
+    """按检测活跃度调整技能的抽帧间隔
+    
+    检测到目标时立即切换到最小间隔，连续无检测时按倍数逐步放宽到最大间隔。
+    """
+    
+    def __init__(self, min_interval: float, max_interval: float, initial_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min(max(initial_interval, self.min_interval), self.max_interval)
+        self.backoff = settings.ADAPTIVE_SAMPLING_BACKOFF
+    
+    def update(self, active: bool) -> float:
+        """根据本次处理结果更新抽帧间隔
+        
+        Args:
+            active: 本次结果是否有检测目标
+        
+        Returns:
+            float: 新的抽帧间隔（秒）
+        """
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+    
+    def get_stats(self) -> Dict:
+        return {
+            "interval": self.interval,
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval
+        }
+
+class InferenceBudget:
+    """节点级视频推理预算（令牌桶）
+    
+    限制节点上所有视频流每秒的技能推理次数，允许最多一秒（至少一次）的突发。
+    """
+    
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate: 每秒允许的推理次数，0表示不限制
+        """
+        self.rate = rate
+        # 突发上限至少为一次推理，避免预算小于1时始终拿不到令牌
+        self.burst = max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.deferred = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+    
+    def acquire(self, count: int) -> int:
+        """申请推理次数，返回实际获得的次数"""
+        if not self.enabled:
+            return count
+        
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        
+        granted = min(count, int(self._tokens))
+        self._tokens -= granted
+        self.deferred += count - granted
+        return granted
+
+# 全局视频推理预算实例，多进程模式下由各工作进程平分
+inference_budget = InferenceBudget(settings.ADAPTIVE_INFERENCE_BUDGET / settings.GRPC_WORKERS)
@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import math
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+def probe_duration(video_path: str) -> float:
+    """读取视频文件的时长（秒）"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video file: {video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        if fps <= 0 or frame_count <= 0:
+            raise ValueError(f"Cannot determine duration of video file: {video_path}")
+        return frame_count / fps
+    finally:
+        cap.release()
+
+def split_segments(duration: float, segment_seconds: float) -> List[Tuple[float, float]]:
+    """将时长切分为 [start, end) 时间段"""
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(start + segment_seconds, duration)
+        segments.append((start, end))
+        start = end
+    return segments
+
+# 抽样网格计算中吸收浮点误差的容差（以抽帧间隔为单位）
+_GRID_EPSILON = 1e-6
+
+def sample_grid_time(timestamp: float, frame_interval: float, after: bool = False) -> float:
+    """timestamp之后的第一个抽样网格时间
+    
+    抽样时间为frame_interval的整数倍，对整个视频文件统一，不随时间段的切分位置变化。
+    
+    Args:
+        after: 为False时返回不早于timestamp的网格时间，为True时返回晚于timestamp的网格时间
+    """
+    if frame_interval <= 0:
+        return timestamp
+    position = timestamp / frame_interval
+    if after:
+        return (math.floor(position + _GRID_EPSILON) + 1) * frame_interval
+    return math.ceil(position - _GRID_EPSILON) * frame_interval
+
+# 工作进程内复用的事件循环，KServe连接和推理批处理在同一进程的各时间段之间共用
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _init_worker():
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+def _process_segment(
+    video_path: str,
+    skill_names: List[str],
+    start: float,
+    end: float,
+    frame_interval: float
+) -> Dict:
+    """工作进程中处理视频文件的一个时间段"""
+    return _worker_loop.run_until_complete(
+        _run_segment(video_path, skill_names, start, end, frame_interval)
+    )
+
+async def _run_segment(
+    video_path: str,
+    skill_names: List[str],
+    start: float,
+    end: float,
+    frame_interval: float
+) -> Dict:
+    """定位到时间段起点后逐帧grab()，只对抽样帧retrieve()并推理
+    
+    Returns:
+        Dict: frames为读取的帧数，inferred为推理的帧数，results为有检测结果的帧，按时间戳排序
+    """
+    # 技能管理在导入时初始化推理客户端，只在工作进程中导入
+    from core.skill_manager import skill_manager
+    
+    requires_image = any(skill_manager.requires_image(name) for name in skill_names)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video file: {video_path}")
+    
+    frames = 0
+    inferred = 0
+    results = []
+    try:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+        # 按全局抽样网格抽帧，抽中的帧与时间段的切分方式无关
+        next_due = sample_grid_time(start, frame_interval)
+        while cap.grab():
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if timestamp >= end:
+                break
+            # 定位可能落在起点之前的关键帧上
+            if timestamp < start:
+                continue
+            frames += 1
+            if timestamp < next_due:
+                continue
+            
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            next_due = sample_grid_time(timestamp, frame_interval, after=True)
+            inferred += 1
+            
+            input_data = {"frame": frame}
+            if requires_image:
+                _, buffer = cv2.imencode('.jpg', frame)
+                input_data["image"] = buffer.tobytes()
+            
+            shared_results = {}
+            skill_results = await asyncio.gather(
+                *(
+                    skill_manager.invoke_skill(name, input_data, shared_results)
+                    for name in skill_names
+                )
+            )
+            for name, result in zip(skill_names, skill_results):
+                if result.get("detections"):
+                    results.append({
+                        "skill_name": name,
+                        "timestamp": timestamp,
+                        "detections": result["detections"]
+                    })
+    finally:
+        cap.release()
+    
+    return {"frames": frames, "inferred": inferred, "results": results}
+
+class BatchJob:
+    """离线批量视频处理任务"""
+    
+    def __init__(
+        self,
+        job_id: str,
+        video_path: str,
+        skill_names: List[str],
+        frame_interval: float,
+        segment_seconds: float
+    ):
+        self.job_id = job_id
+        self.video_path = video_path
+        self.skill_names = skill_names
+        self.frame_interval = frame_interval
+        self.segment_seconds = segment_seconds
+        self.status = "pending"
+        self.message = ""
+        self.segments_total = 0
+        self.segments_done = 0
+        self.frames = 0
+        self.inferred_frames = 0
+        self.elapsed = 0.0
+        self.results: List[Dict] = []
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def frames_per_second(self) -> float:
+        """已读取帧数相对任务耗时的吞吐量"""
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+    
+    def get_stats(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "message": self.message,
+            "segments_total": self.segments_total,
+            "segments_done": self.segments_done,
+            "frames": self.frames,
+            "inferred_frames": self.inferred_frames,
+            "elapsed": self.elapsed,
+            "frames_per_second": self.frames_per_second,
+            "results": len(self.results)
+        }
+
+class BatchJobManager:
+    """离线批量视频处理
+    
+    视频文件按时间切分为多个时间段，由进程池并行处理：各工作进程定位到时间段起点解码，
+    只对抽样帧做像素转换和推理。各时间段的结果按时间戳归并为任务结果。
+    """
+    
+    def __init__(self):
+        self.jobs: Dict[str, BatchJob] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # 首次提交任务时创建进程池，工作进程使用spawn方式启动，不继承事件循环和连接
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.BATCH_JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._executor
+    
+    def submit(
+        self,
+        video_path: str,
+        skill_names: List[str],
+        frame_interval: float = None,
+        segment_seconds: float = None,
+        job_id: str = None
+    ) -> BatchJob:
+        """提交任务，在后台执行"""
+        if not skill_names:
+            raise ValueError("At least one skill is required")
+        
+        job_id = job_id or str(uuid.uuid4())
+        if job_id in self.jobs:
+            raise ValueError(f"Batch job {job_id} already exists")
+        
+        job = BatchJob(
+            job_id,
+            video_path,
+            list(skill_names),
+            frame_interval or settings.DEFAULT_FRAME_INTERVAL,
+            segment_seconds or settings.BATCH_SEGMENT_SECONDS
+        )
+        self.jobs[job_id] = job
+        self._trim()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+    
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        """获取任务"""
+        return self.jobs.get(job_id)
+    
+    async def run(self, *args, **kwargs) -> BatchJob:
+        """提交任务并等待完成"""
+        job = self.submit(*args, **kwargs)
+        await job.task
+        return job
+    
+    def _trim(self):
+        """只保留最近的已结束任务"""
+        finished = [
+            job_id for job_id, job in self.jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        for job_id in finished[:max(len(finished) - settings.BATCH_JOB_RETENTION, 0)]:
+            del self.jobs[job_id]
+    
+    async def _run(self, job: BatchJob):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        job.status = "running"
+        futures = []
+        try:
+            duration = await loop.run_in_executor(None, probe_duration, job.video_path)
+            segments = split_segments(duration, job.segment_seconds)
+            job.segments_total = len(segments)
+            
+            executor = self._get_executor()
+            futures = [
+                loop.run_in_executor(
+                    executor,
+                    _process_segment,
+                    job.video_path,
+                    job.skill_names,
+                    start,
+                    end,
+                    job.frame_interval
+                )
+                for start, end in segments
+            ]
+            for future in asyncio.as_completed(futures):
+                segment = await future
+                job.segments_done += 1
+                job.frames += segment["frames"]
+                job.inferred_frames += segment["inferred"]
+                job.elapsed = time.monotonic() - started
+            
+            # 各时间段的结果已按时间戳排序，按段顺序归并
+            segment_results = [(await future)["results"] for future in futures]
+            job.results = list(heapq.merge(
+                *segment_results,
+                key=lambda result: result["timestamp"]
+            ))
+            for index, result in enumerate(job.results):
+                result["id"] = f"{job.job_id}_{index}"
+                result["stream_id"] = job.video_path
+            
+            job.status = "completed"
+        except Exception as e:
+            # 取消尚未开始的时间段
+            for future in futures:
+                future.cancel()
+            job.status = "failed"
+            job.message = str(e)
+            logger.error(
+                "Batch job failed",
+                extra={"job_id": job.job_id, "error": str(e)}
+            )
+        finally:
+            job.elapsed = time.monotonic() - started
+        
+        logger.info(
+            "Batch job finished",
+            extra={
+                "job_id": job.job_id,
+                "status": job.status,
+                "frames": job.frames,
+                "frames_per_second": job.frames_per_second
+            }
+        )
+    
+    def close(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+# 全局批量任务管理实例
+batch_job_manager = BatchJobManager()
+
+def main():
+    """命令行入口：python -m core.batch_job VIDEO --skill NAME [--skill NAME ...]"""
+    parser = argparse.ArgumentParser(description="Offline batch video detection")
+    parser.add_argument("video_path")
+    parser.add_argument("--skill", dest="skills", action="append", required=True)
+    parser.add_argument("--frame-interval", type=float, default=None)
+    parser.add_argument("--segment-seconds", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write results as JSON lines")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    if args.workers:
+        settings.BATCH_JOB_WORKERS = args.workers
+    
+    async def run() -> BatchJob:
+        try:
+            return await batch_job_manager.run(
+                args.video_path,
+                args.skills,
+                args.frame_interval,
+                args.segment_seconds
+            )
+        finally:
+            batch_job_manager.close()
+    
+    job = asyncio.run(run())
+    if args.output:
+        with open(args.output, "w") as f:
+            for result in job.results:
+                f.write(json.dumps(result) + "\n")
+    print(json.dumps(job.get_stats()))
+    if job.status != "completed":
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PendingClip:
+    """等待post-roll采集完成的预警视频片段
+    
+    post-roll期间同一视频流上各技能的后续预警共用该片段，
+    片段生成后为其中每条预警消息发送更新。
+    """
+    
+    def __init__(self, stream_url: str, alert_type: str, fps: int, due_time: float):
+        self.stream_url = stream_url
+        self.alert_type = alert_type
+        self.fps = fps
+        self.due_time = due_time  # post-roll结束时的流内时间戳（秒）
+        self.messages: List[Tuple[Dict, Dict]] = []  # (预警消息, 消息字段到上传记录标识的映射)
+
+class ClipWriter:
+    """预警视频片段编码器
+    
+    视频片段的编码或封装在有界的后台线程池中执行，不占用检测所在的事件循环；
+    待处理的片段数超过上限时新的片段被丢弃，预警消息不受影响。
+    """
+    
+    def __init__(self):
+        self.max_pending = settings.CLIP_ENCODER_MAX_PENDING
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.CLIP_ENCODER_WORKERS,
+            thread_name_prefix="clip-encoder"
+        )
+        self._pending = 0
+    
+    @property
+    def pending(self) -> int:
+        """正在编码或等待编码的片段数"""
+        return self._pending
+    
+    def try_acquire(self) -> bool:
+        """申请一个片段编码名额，已达上限时返回False"""
+        if self._pending >= self.max_pending:
+            logger.warning(
+                "Clip encoder queue is full, dropping clip",
+                extra={"pending": self._pending}
+            )
+            return False
+        self._pending += 1
+        return True
+    
+    def release(self):
+        """归还片段编码名额"""
+        self._pending -= 1
+    
+    async def run(self, func: Callable[..., Optional[bytes]], *args) -> Optional[bytes]:
+        """在编码线程池中执行片段生成函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+def encode_frames(frames: Iterable[np.ndarray], fps: float) -> Optional[bytes]:
+    """将帧序列编码为MP4数据
+    
+    Args:
+        frames: 按时间顺序排列的视频帧
+        fps: 视频帧率
+    
+    Returns:
+        Optional[bytes]: MP4数据，没有帧时返回None
+    """
+    # 创建临时视频文件
+    fd, temp_path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    
+    out = None
+    try:
+        for frame in frames:
+            if out is None:
+                # 创建视频写入器
+                height, width = frame.shape[:2]
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                out = cv2.VideoWriter(temp_path, fourcc, fps, (width, height))
+            out.write(frame)
+        
+        if out is None:
+            return None
+        
+        # 释放视频写入器
+        out.release()
+        out = None
+        
+        # 读取临时文件
+        with open(temp_path, 'rb') as f:
+            return f.read()
+    
+    finally:
+        if out is not None:
+            out.release()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# 全局视频片段编码器实例
+clip_writer = ClipWriter()
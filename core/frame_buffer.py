@@ -0,0 +1,564 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+class FrameRingBuffer:
+    """固定容量的帧环形缓冲区
+    
+    底层为一块预分配的 (capacity, H, W, 3) 数组，新帧原地写入最旧的槽位，
+    追加操作为O(1)且不会为每帧分配新的数组。每帧的流内时间戳保存在并行的数组中，
+    抽帧间隔变化后帧间隔不均匀，预警视频片段的帧率按时间戳计算。
+    
+    帧由解码线程写入，快照和调整容量在事件循环中执行，内部使用锁保护。
+    """
+    
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError(f"Invalid frame buffer capacity: {capacity}")
+        
+        self.capacity = capacity
+        self._frames: Optional[np.ndarray] = None
+        self._timestamps = np.zeros(capacity)
+        self._start = 0  # 最旧帧所在槽位
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def append(self, frame: np.ndarray, timestamp: float) -> int:
+        """写入一帧及其流内时间戳，缓冲区已满时覆盖最旧的帧，返回已分配内存的变化量（字节）"""
+        with self._lock:
+            before = self.nbytes
+            if self._frames is None or self._frames.shape[1:] != frame.shape:
+                # 首帧或分辨率变化时按帧尺寸分配存储
+                self._frames = np.empty(
+                    (self.capacity,) + frame.shape,
+                    dtype=frame.dtype
+                )
+                self._start = 0
+                self._size = 0
+            
+            index = (self._start + self._size) % self.capacity
+            np.copyto(self._frames[index], frame)
+            self._timestamps[index] = timestamp
+            
+            if self._size < self.capacity:
+                self._size += 1
+            else:
+                self._start = (self._start + 1) % self.capacity
+            return self.nbytes - before
+    
+    def resize(self, capacity: int) -> int:
+        """调整容量，保留最新的帧并重新分配存储，返回已分配内存的变化量（字节）"""
+        if capacity <= 0:
+            raise ValueError(f"Invalid frame buffer capacity: {capacity}")
+        
+        with self._lock:
+            if capacity == self.capacity:
+                return 0
+            
+            before = self.nbytes
+            timestamps = np.zeros(capacity)
+            if self._frames is not None:
+                kept = self._ordered()[-capacity:]
+                frames = np.empty(
+                    (capacity,) + self._frames.shape[1:],
+                    dtype=self._frames.dtype
+                )
+                for i, frame in enumerate(kept):
+                    frames[i] = frame
+                timestamps[:len(kept)] = self._ordered_timestamps()[-capacity:]
+                self._frames = frames
+                self._size = len(kept)
+            self._timestamps = timestamps
+            self._start = 0
+            self.capacity = capacity
+            return self.nbytes - before
+    
+    @property
+    def frame_shape(self) -> Optional[tuple]:
+        """缓冲帧的尺寸 (H, W, C)"""
+        return None if self._frames is None else self._frames.shape[1:]
+    
+    @property
+    def nbytes(self) -> int:
+        """已分配的内存大小（字节）"""
+        return 0 if self._frames is None else self._frames.nbytes
+    
+    @property
+    def frame_nbytes(self) -> int:
+        """单帧占用的内存大小（字节）"""
+        return 0 if self._frames is None else self._frames[0].nbytes
+    
+    def snapshot(self, max_frames: Optional[int] = None) -> Iterable[np.ndarray]:
+        """按时间顺序复制当前缓冲帧，供后台编码使用
+        
+        Args:
+            max_frames: 最多复制的帧数，超出时只复制最新的帧
+        """
+        with self._lock:
+            size = self._size if max_frames is None else min(self._size, max_frames)
+            if size <= 0:
+                return []
+            
+            start = (self._start + self._size - size) % self.capacity
+            end = start + size
+            if end <= self.capacity:
+                return self._frames[start:end].copy()
+            return np.concatenate((
+                self._frames[start:],
+                self._frames[:end - self.capacity]
+            ))
+    
+    def frame_rate(self, max_frames: Optional[int] = None) -> float:
+        """按缓冲帧（指定max_frames时为最新的帧）的时间戳计算的平均帧率，少于两帧时返回0"""
+        with self._lock:
+            return _frame_rate(_newest(self._ordered_timestamps(), max_frames))
+    
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        """最新缓冲帧的流内时间戳，缓冲区为空时为None"""
+        with self._lock:
+            if not self._size:
+                return None
+            return float(self._timestamps[(self._start + self._size - 1) % self.capacity])
+    
+    def frame_at(self, timestamp: float) -> Optional[np.ndarray]:
+        """复制流内时间戳不晚于timestamp的最新缓冲帧，没有这样的帧时返回None"""
+        with self._lock:
+            index = int(np.searchsorted(self._ordered_timestamps(), timestamp, side="right")) - 1
+            if index < 0:
+                return None
+            return self._frames[(self._start + index) % self.capacity].copy()
+    
+    def _ordered(self) -> List[np.ndarray]:
+        """按时间顺序返回缓冲帧的视图，调用方需持有锁"""
+        return [
+            self._frames[(self._start + i) % self.capacity]
+            for i in range(self._size)
+        ]
+    
+    def _ordered_timestamps(self) -> np.ndarray:
+        """按时间顺序返回缓冲帧的时间戳，调用方需持有锁"""
+        return np.roll(self._timestamps, -self._start)[:self._size]
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """按时间顺序返回缓冲帧，不复制数据；解码线程仍在写入时应使用snapshot()"""
+        with self._lock:
+            frames = self._ordered()
+        return iter(frames)
+
+class CompressedFrameBuffer:
+    """压缩存储的帧缓冲区
+    
+    帧以JPEG（有损）或PNG（无损）编码后保存，读取时按需解码，每帧同时保存流内时间戳。
+    帧的编码在写入线程（解码线程）中完成，只有入队操作持有锁。
+    """
+    
+    def __init__(self, capacity: int, codec: str = "jpeg", quality: int = 90):
+        if capacity <= 0:
+            raise ValueError(f"Invalid frame buffer capacity: {capacity}")
+        
+        if codec == "jpeg":
+            self._ext = ".jpg"
+            self._params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        elif codec == "png":
+            # 无损压缩，使用较低的压缩级别以降低CPU开销
+            self._ext = ".png"
+            self._params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        else:
+            raise ValueError(f"Unsupported frame buffer codec: {codec}")
+        
+        self.capacity = capacity
+        self._frames: deque = deque()  # (编码数据, 流内时间戳)
+        self._nbytes = 0
+        self._frame_shape: Optional[tuple] = None
+        self._lock = threading.Lock()
+    
+    def encode(self, frame: np.ndarray) -> bytes:
+        """编码单帧，无共享状态"""
+        ok, buffer = cv2.imencode(self._ext, frame, self._params)
+        if not ok:
+            raise ValueError("Failed to encode frame")
+        return buffer.tobytes()
+    
+    def append(self, frame: np.ndarray, timestamp: float) -> int:
+        """编码并写入一帧及其流内时间戳，返回占用内存的变化量（字节）"""
+        encoded = self.encode(frame)
+        
+        with self._lock:
+            before = self._nbytes
+            self._frames.append((encoded, timestamp))
+            self._nbytes += len(encoded)
+            self._frame_shape = frame.shape
+            self._trim()
+            return self._nbytes - before
+    
+    def resize(self, capacity: int) -> int:
+        """调整容量，丢弃超出容量的最旧帧，返回占用内存的变化量（字节）"""
+        if capacity <= 0:
+            raise ValueError(f"Invalid frame buffer capacity: {capacity}")
+        
+        with self._lock:
+            before = self._nbytes
+            self.capacity = capacity
+            self._trim()
+            return self._nbytes - before
+    
+    def _trim(self):
+        while len(self._frames) > self.capacity:
+            self._nbytes -= len(self._frames.popleft()[0])
+    
+    @property
+    def frame_shape(self) -> Optional[tuple]:
+        """缓冲帧的尺寸 (H, W, C)"""
+        return self._frame_shape
+    
+    @property
+    def nbytes(self) -> int:
+        """已占用的内存大小（字节）"""
+        return self._nbytes
+    
+    @property
+    def frame_nbytes(self) -> int:
+        """单帧平均占用的内存大小（字节）"""
+        with self._lock:
+            return self._nbytes // len(self._frames) if self._frames else 0
+    
+    def snapshot(self, max_frames: Optional[int] = None) -> Iterable[np.ndarray]:
+        """返回当前缓冲帧的快照，帧在迭代时才解码
+        
+        Args:
+            max_frames: 最多包含的帧数，超出时只包含最新的帧
+        """
+        with self._lock:
+            frames = [encoded for encoded, _ in self._frames]
+        return map(_decode_frame, _newest(frames, max_frames))
+    
+    def frame_rate(self, max_frames: Optional[int] = None) -> float:
+        """按缓冲帧（指定max_frames时为最新的帧）的时间戳计算的平均帧率，少于两帧时返回0"""
+        with self._lock:
+            return _frame_rate(_newest([timestamp for _, timestamp in self._frames], max_frames))
+    
+    @property
+    def last_timestamp(self) -> Optional[float]:
+        """最新缓冲帧的流内时间戳，缓冲区为空时为None"""
+        with self._lock:
+            return self._frames[-1][1] if self._frames else None
+    
+    def frame_at(self, timestamp: float) -> Optional[np.ndarray]:
+        """解码流内时间戳不晚于timestamp的最新缓冲帧，没有这样的帧时返回None"""
+        with self._lock:
+            encoded = next(
+                (data for data, frame_time in reversed(self._frames) if frame_time <= timestamp),
+                None
+            )
+        return None if encoded is None else _decode_frame(encoded)
+    
+    def __len__(self) -> int:
+        return len(self._frames)
+    
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """按时间顺序解码返回缓冲帧"""
+        return iter(self.snapshot())
+
+def _decode_frame(encoded: bytes) -> np.ndarray:
+    return cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def _newest(items, count: Optional[int]):
+    """序列中最新的count项，count为空时返回全部"""
+    if count is None:
+        return items
+    return items[max(len(items) - count, 0):]
+
+def _frame_rate(timestamps) -> float:
+    if len(timestamps) < 2:
+        return 0.0
+    duration = timestamps[-1] - timestamps[0]
+    return (len(timestamps) - 1) / duration if duration > 0 else 0.0
+
+FrameBuffer = Union[FrameRingBuffer, CompressedFrameBuffer]
+
+class FrameSnapshot:
+    """预警视频片段截取的缓冲帧
+    
+    快照在编码完成前一直占用内存，计入帧缓冲区的内存预算，编码完成后调用release()归还。
+    """
+    
+    def __init__(self, manager: "FrameBufferManager", nbytes: int):
+        self.frames: Iterable[np.ndarray] = []
+        self.fps = 0.0
+        self.nbytes = nbytes
+        self._manager = manager
+    
+    def release(self):
+        """释放快照，归还占用的内存预算"""
+        if self._manager is not None:
+            self.frames = []
+            self._manager._release_snapshot(self.nbytes)
+            self._manager = None
+
+class FrameBufferManager:
+    """帧缓冲区管理器
+    
+    管理所有视频流的帧缓冲区，并在节点级内存预算内分配缓冲深度：
+    总占用超过预算时按比例缩减各缓冲区的容量（不低于最小深度），
+    有视频流释放缓冲区后再逐步恢复。等待编码的预警视频片段快照同样计入预算，
+    预算不足时快照只截取最新的部分帧，不足最小深度时不生成片段。
+    
+    帧由各视频流的解码线程直接写入缓冲区槽位，事件循环不做逐帧的拷贝或编码；
+    缓冲区的创建、释放和内存记账使用锁保护。
+    """
+    
+    def __init__(self):
+        self._buffers: Dict[str, FrameBuffer] = {}
+        self._target_capacity: Dict[str, int] = {}
+        self._min_capacity: Dict[str, int] = {}
+        # 各缓冲区已计入总占用的内存大小
+        self._nbytes: Dict[str, int] = {}
+        # 等待编码的快照占用的内存大小，已计入总占用
+        self._snapshot_nbytes = 0
+        self._total_nbytes = 0
+        self._lock = threading.RLock()
+        self._budget_warned = False
+        # 多进程模式下节点内存预算由各工作进程平分
+        self.budget = settings.FRAME_BUFFER_MEMORY_BUDGET_MB * 1024 * 1024 // settings.GRPC_WORKERS
+        self.compression = settings.FRAME_BUFFER_COMPRESSION
+    
+    def create(self, stream_id: str, fps: int) -> FrameBuffer:
+        """为视频流创建帧缓冲区"""
+        self.release(stream_id)
+        
+        capacity, min_capacity = self._capacity(fps)
+        if self.compression == "none":
+            buffer = FrameRingBuffer(capacity)
+        else:
+            buffer = CompressedFrameBuffer(
+                capacity,
+                codec=self.compression,
+                quality=settings.FRAME_BUFFER_JPEG_QUALITY
+            )
+        
+        with self._lock:
+            self._buffers[stream_id] = buffer
+            self._target_capacity[stream_id] = capacity
+            self._min_capacity[stream_id] = min_capacity
+            self._nbytes[stream_id] = 0
+        return buffer
+    
+    def set_fps(self, stream_id: str, fps: int):
+        """写入帧率变化（如抽帧间隔变化）时按新的帧率调整缓冲区容量，受内存预算约束"""
+        capacity, min_capacity = self._capacity(fps)
+        with self._lock:
+            buffer = self._buffers.get(stream_id)
+            if buffer is None or self._target_capacity[stream_id] == capacity:
+                return
+            
+            self._target_capacity[stream_id] = capacity
+            self._min_capacity[stream_id] = min_capacity
+            capacity = max(min_capacity, int(capacity * self._budget_scale()))
+            self._resize(stream_id, buffer, capacity)
+            if self.budget and self._total_nbytes > self.budget:
+                self._shrink()
+    
+    def _capacity(self, fps: int) -> Tuple[int, int]:
+        """按帧率计算缓冲区的目标容量和最小容量"""
+        fps = max(fps, 1)
+        # 缓冲区需同时容纳预警前后的视频（pre-roll + post-roll）
+        capacity = fps * (settings.VIDEO_CHUNK_DURATION + settings.ALERT_POST_ROLL_SECONDS)
+        return capacity, min(capacity, max(fps * settings.FRAME_BUFFER_MIN_DURATION, 1))
+    
+    def get(self, stream_id: str) -> Optional[FrameBuffer]:
+        """获取视频流的帧缓冲区"""
+        return self._buffers.get(stream_id)
+    
+    def release(self, stream_id: str):
+        """释放视频流的帧缓冲区"""
+        with self._lock:
+            buffer = self._buffers.pop(stream_id, None)
+            if buffer is None:
+                return
+            
+            self._total_nbytes -= self._nbytes.pop(stream_id)
+            del self._target_capacity[stream_id]
+            del self._min_capacity[stream_id]
+            self._regrow()
+    
+    def snapshot(self, stream_id: str) -> Optional[FrameSnapshot]:
+        """截取视频流的缓冲帧用于生成预警视频片段
+        
+        各缓冲区保留最小深度，快照使用其余的预算，超出时只截取最新的帧；
+        可截取的帧数不足最小深度时返回None。
+        """
+        with self._lock:
+            buffer = self._buffers.get(stream_id)
+            if buffer is None or not len(buffer):
+                return None
+            
+            frame_nbytes = buffer.frame_nbytes
+            frames = len(buffer)
+            if self.budget and frame_nbytes:
+                reserved = self._snapshot_nbytes + sum(
+                    b.frame_nbytes * self._min_capacity[sid]
+                    for sid, b in self._buffers.items()
+                )
+                frames = min(frames, max(self.budget - reserved, 0) // frame_nbytes)
+                if frames < self._min_capacity[stream_id]:
+                    logger.warning(
+                        "Frame buffer memory budget exhausted, dropping clip",
+                        extra={
+                            "stream_id": stream_id,
+                            "budget_bytes": self.budget,
+                            "snapshot_bytes": self._snapshot_nbytes
+                        }
+                    )
+                    return None
+            
+            # 先占用预算，复制在锁外进行
+            snapshot = FrameSnapshot(self, frames * frame_nbytes)
+            self._snapshot_nbytes += snapshot.nbytes
+            self._total_nbytes += snapshot.nbytes
+            if self.budget and self._total_nbytes > self.budget:
+                self._shrink()
+        
+        snapshot.frames = buffer.snapshot(frames)
+        snapshot.fps = buffer.frame_rate(frames)
+        return snapshot
+    
+    def _release_snapshot(self, nbytes: int):
+        with self._lock:
+            self._snapshot_nbytes -= nbytes
+            self._total_nbytes -= nbytes
+            self._regrow()
+    
+    def writer(self, stream_id: str) -> Callable[[np.ndarray, float], None]:
+        """返回写入视频流当前缓冲区的函数，由解码线程以 (帧, 流内时间戳) 调用
+        
+        写入函数绑定调用时的缓冲区，缓冲区释放后的写入被忽略，
+        不会写入同一视频流重新创建的缓冲区。
+        """
+        buffer = self._buffers.get(stream_id)
+        
+        def write(frame: np.ndarray, timestamp: float):
+            if buffer is not None:
+                self._append(stream_id, buffer, frame, timestamp)
+        
+        return write
+    
+    def _append(self, stream_id: str, buffer: FrameBuffer, frame: np.ndarray, timestamp: float):
+        # 拷贝或编码在缓冲区自身的锁内完成，不阻塞其他视频流的写入
+        delta = buffer.append(frame, timestamp)
+        if not delta:
+            return
+        
+        with self._lock:
+            if self._buffers.get(stream_id) is not buffer:
+                # 缓冲区已释放
+                return
+            self._nbytes[stream_id] += delta
+            self._total_nbytes += delta
+            
+            if self.budget and self._total_nbytes > self.budget:
+                self._shrink()
+    
+    def get_usage(self, stream_id: str = None) -> Dict:
+        """查询缓冲区内存占用
+        
+        Args:
+            stream_id: 视频流ID，为空时返回所有视频流及节点总量
+        
+        Returns:
+            Dict: 内存占用信息
+        """
+        with self._lock:
+            if stream_id is not None:
+                buffer = self._buffers.get(stream_id)
+                if buffer is None:
+                    raise ValueError(f"Frame buffer for stream {stream_id} not found")
+                return self._buffer_usage(stream_id, buffer)
+            
+            return {
+                "budget_bytes": self.budget,
+                "total_bytes": self._total_nbytes,
+                "snapshot_bytes": self._snapshot_nbytes,
+                "compression": self.compression,
+                "streams": {
+                    sid: self._buffer_usage(sid, buffer)
+                    for sid, buffer in self._buffers.items()
+                }
+            }
+    
+    def _buffer_usage(self, stream_id: str, buffer: FrameBuffer) -> Dict:
+        return {
+            "bytes": buffer.nbytes,
+            "frames": len(buffer),
+            "capacity": buffer.capacity,
+            "target_capacity": self._target_capacity[stream_id]
+        }
+    
+    def _shrink(self):
+        """总占用超过预算时按比例缩减各缓冲区容量，快照占用的部分不能缩减"""
+        scale = max(self.budget - self._snapshot_nbytes, 0) / max(
+            self._total_nbytes - self._snapshot_nbytes, 1
+        )
+        for stream_id, buffer in self._buffers.items():
+            capacity = max(
+                self._min_capacity[stream_id],
+                int(buffer.capacity * scale)
+            )
+            self._resize(stream_id, buffer, capacity)
+        
+        if self._total_nbytes <= self.budget:
+            self._budget_warned = False
+        elif not self._budget_warned:
+            # 所有缓冲区均已缩减到最小深度仍超出预算，只记录一次
+            logger.warning(
+                "Frame buffer memory budget exceeded at minimum depth",
+                extra={
+                    "budget_bytes": self.budget,
+                    "total_bytes": self._total_nbytes
+                }
+            )
+            self._budget_warned = True
+    
+    def _regrow(self):
+        """释放缓冲区后，在预算允许的范围内恢复其他缓冲区的容量"""
+        if not self._buffers:
+            return
+        
+        scale = self._budget_scale()
+        for stream_id, buffer in self._buffers.items():
+            capacity = max(
+                self._min_capacity[stream_id],
+                int(self._target_capacity[stream_id] * scale)
+            )
+            if capacity > buffer.capacity:
+                self._resize(stream_id, buffer, capacity)
+    
+    def _budget_scale(self) -> float:
+        """按当前单帧大小估算所有缓冲区达到目标容量后的总占用，返回快照以外的预算内的容量比例"""
+        estimated = sum(
+            buffer.frame_nbytes * self._target_capacity[stream_id]
+            for stream_id, buffer in self._buffers.items()
+        )
+        available = max(self.budget - self._snapshot_nbytes, 0)
+        if self.budget and estimated > available:
+            return available / estimated
+        return 1.0
+    
+    def _resize(self, stream_id: str, buffer: FrameBuffer, capacity: int):
+        delta = buffer.resize(capacity)
+        self._nbytes[stream_id] += delta
+        self._total_nbytes += delta
+
+# 全局帧缓冲区管理器实例
+frame_buffer_manager = FrameBufferManager()
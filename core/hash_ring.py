@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+from typing import Dict, Hashable, Iterable, List
+
+class HashRing:
+    """一致性哈希环
+    
+    每个节点在环上放置多个虚拟节点，键映射到顺时针方向的第一个虚拟节点。
+    节点增减时只有相邻区间的键改变归属。
+    """
+    
+    def __init__(self, nodes: Iterable[Hashable] = (), vnodes: int = 100):
+        self.vnodes = vnodes
+        self._ring: Dict[int, Hashable] = {}
+        self._keys: List[int] = []
+        for node in nodes:
+            self.add(node)
+    
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+    
+    def add(self, node: Hashable):
+        """添加节点"""
+        for i in range(self.vnodes):
+            h = self._hash(f"{node}#{i}")
+            if h not in self._ring:
+                bisect.insort(self._keys, h)
+            self._ring[h] = node
+    
+    def remove(self, node: Hashable):
+        """移除节点"""
+        for i in range(self.vnodes):
+            h = self._hash(f"{node}#{i}")
+            if self._ring.get(h) == node:
+                del self._ring[h]
+                self._keys.remove(h)
+    
+    @property
+    def nodes(self) -> set:
+        """环上的所有节点"""
+        return set(self._ring.values())
+    
+    def get(self, key: str) -> Hashable:
+        """获取键所属的节点"""
+        if not self._keys:
+            raise LookupError("Hash ring is empty")
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[self._keys[index]]
+    
+    def __len__(self) -> int:
+        return len(self.nodes)
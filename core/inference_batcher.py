@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+from config.config import settings
+from core.skills.base import Model
+
+logger = logging.getLogger(__name__)
+
+class InferenceBatcher:
+    """推理请求批处理调度器
+    
+    按模型的推理标识汇集来自所有视频流和图片请求的推理请求，
+    达到最大批大小或最长等待时间时合并为一次批量推理，再将结果分发给各调用方。
+    """
+    
+    def __init__(self, predict_batch: Callable[[Model, List[Dict]], Awaitable[List[Dict]]]):
+        """
+        Args:
+            predict_batch: 批量推理函数，按输入顺序返回每个请求的结果
+        """
+        self._predict_batch = predict_batch
+        self.max_batch_size = settings.INFERENCE_MAX_BATCH_SIZE
+        self.max_wait = settings.INFERENCE_MAX_BATCH_WAIT_MS / 1000.0
+        self._pending: Dict[Tuple, List[Tuple[Dict, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple, asyncio.TimerHandle] = {}
+        # 正在执行的批次，保持引用直到完成，避免任务在执行中被回收
+        self._running: Set[asyncio.Task] = set()
+    
+    async def submit(self, model: Model, data: Dict) -> Dict:
+        """提交单个推理请求，等待所在批次完成后返回该请求的结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # 预处理配置不同的请求不能合并为一个批次
+        key = model.inference_key()
+        
+        batch = self._pending.setdefault(key, [])
+        batch.append((data, future))
+        
+        if len(batch) >= (model.max_batch_size or self.max_batch_size):
+            self._flush(key, model)
+        elif len(batch) == 1:
+            # 批次的第一个请求开始计时
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key, model)
+        
+        return await future
+    
+    def _flush(self, key: Tuple, model: Model):
+        """发出当前批次"""
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        
+        # 丢弃调用方已放弃（超过截止时间或被取消）的请求
+        batch = [
+            (data, future)
+            for data, future in self._pending.pop(key, [])
+            if not future.done()
+        ]
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(model, batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+    
+    async def _run_batch(self, model: Model, batch: List[Tuple[Dict, asyncio.Future]]):
+        """执行批量推理并将结果分发给各请求"""
+        try:
+            results = await self._predict_batch(model, [data for data, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Model {model.name} returned {len(results)} predictions "
+                    f"for a batch of {len(batch)}"
+                )
+        except asyncio.CancelledError:
+            # 批次被取消（如服务关闭）时同样结束等待中的请求
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            logger.error(
+                "Batch inference failed",
+                extra={"model": model.name, "batch_size": len(batch), "error": str(e)}
+            )
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        # 调用方可能已取消等待
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,239 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Open Inference Protocol（V2）数据类型与NumPy类型的对应关系
+_V2_DATATYPES = {
+    "BOOL": np.bool_,
+    "UINT8": np.uint8,
+    "INT8": np.int8,
+    "INT16": np.int16,
+    "INT32": np.int32,
+    "INT64": np.int64,
+    "FP16": np.float16,
+    "FP32": np.float32,
+    "FP64": np.float64
+}
+_NUMPY_DATATYPES = {np.dtype(v): k for k, v in _V2_DATATYPES.items()}
+
+# 二进制张量扩展中JSON头的长度
+_HEADER_LENGTH = "Inference-Header-Content-Length"
+
+class EndpointClient:
+    """单个KServe推理endpoint的长连接客户端
+    
+    复用一个带keep-alive连接池的HTTP会话，并限制对该endpoint的并发请求数。
+    连续失败达到阈值后标记为不健康：冷却期内请求直接失败，
+    冷却结束后丢弃可能已失效的连接并重建会话。
+    """
+    
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.base_url = settings.KSERVE_URL_TEMPLATE.format(
+            endpoint=endpoint,
+            namespace=settings.KSERVE_NAMESPACE
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(settings.KSERVE_MAX_CONCURRENCY)
+        self._consecutive_failures = 0
+        self._unhealthy_until = 0.0
+    
+    @property
+    def healthy(self) -> bool:
+        """endpoint当前是否可用"""
+        return time.monotonic() >= self._unhealthy_until
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.KSERVE_MAX_CONNECTIONS,
+                keepalive_timeout=settings.KSERVE_KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.KSERVE_REQUEST_TIMEOUT)
+            )
+        return self._session
+    
+    async def predict(self, name: str, data: Dict, version: str = None) -> Dict:
+        """调用V1协议推理接口
+        
+        Args:
+            name: 模型名称
+            data: 请求数据，bytes类型的值按KServe约定以{"b64": ...}编码
+            version: 模型版本，V1协议的URL中不包含版本
+        
+        Returns:
+            Dict: 推理结果
+        """
+        url = f"{self.base_url}/v1/models/{name}:predict"
+        return await self._post(url, json=_to_json(data))
+    
+    async def infer(
+        self,
+        name: str,
+        version: str,
+        inputs: Dict[str, np.ndarray],
+        outputs: List[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """调用Open Inference Protocol（V2）推理接口，张量以二进制数据传输
+        
+        Args:
+            name: 模型名称
+            version: 模型版本
+            inputs: 输入张量，键为输入名称
+            outputs: 需要返回的输出名称，为空时返回模型的所有输出
+        
+        Returns:
+            Dict[str, np.ndarray]: 输出张量，键为输出名称
+        """
+        header = {"inputs": []}
+        blobs = []
+        for input_name, array in inputs.items():
+            array = np.ascontiguousarray(array)
+            blob = array.tobytes()
+            header["inputs"].append({
+                "name": input_name,
+                "shape": list(array.shape),
+                "datatype": _NUMPY_DATATYPES[array.dtype],
+                "parameters": {"binary_data_size": len(blob)}
+            })
+            blobs.append(blob)
+        if outputs:
+            header["outputs"] = [
+                {"name": output_name, "parameters": {"binary_data": True}}
+                for output_name in outputs
+            ]
+        else:
+            header["parameters"] = {"binary_data_output": True}
+        
+        header_bytes = json.dumps(header).encode("utf-8")
+        url = f"{self.base_url}/v2/models/{name}/versions/{version}/infer"
+        return await self._post(
+            url,
+            data=b"".join([header_bytes] + blobs),
+            headers={
+                "Content-Type": "application/octet-stream",
+                _HEADER_LENGTH: str(len(header_bytes))
+            },
+            parse=_parse_v2_response
+        )
+    
+    async def _post(self, url: str, parse=None, **kwargs) -> Any:
+        """发送推理请求并记录endpoint健康状态"""
+        if not self.healthy:
+            raise RuntimeError(f"KServe endpoint {self.endpoint} is unhealthy")
+        
+        async with self._semaphore:
+            try:
+                session = self._get_session()
+                async with session.post(url, **kwargs) as response:
+                    response.raise_for_status()
+                    if parse:
+                        result = parse(response.headers, await response.read())
+                    else:
+                        result = await response.json()
+            except aiohttp.ClientResponseError as e:
+                # 请求本身有误（4xx）不影响endpoint的健康状态
+                if e.status >= 500:
+                    await self._record_failure()
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await self._record_failure()
+                raise
+        
+        self._consecutive_failures = 0
+        return result
+    
+    async def _record_failure(self):
+        self._consecutive_failures += 1
+        if self._consecutive_failures < settings.KSERVE_FAILURE_THRESHOLD:
+            return
+        
+        logger.warning(
+            "KServe endpoint marked unhealthy",
+            extra={
+                "endpoint": self.endpoint,
+                "failures": self._consecutive_failures
+            }
+        )
+        self._consecutive_failures = 0
+        self._unhealthy_until = time.monotonic() + settings.KSERVE_UNHEALTHY_COOLDOWN
+        # 关闭现有连接，冷却结束后重新建立
+        await self.close()
+    
+    async def close(self):
+        """关闭HTTP会话及其连接"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class KServeClientPool:
+    """KServe推理客户端池，每个模型endpoint一个长期复用的客户端"""
+    
+    def __init__(self):
+        self._clients: Dict[str, EndpointClient] = {}
+    
+    def get(self, endpoint: str) -> EndpointClient:
+        """获取endpoint的客户端，不存在时创建"""
+        client = self._clients.get(endpoint)
+        if client is None:
+            client = EndpointClient(endpoint)
+            self._clients[endpoint] = client
+        return client
+    
+    async def close(self):
+        """关闭所有客户端"""
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+def _parse_v2_response(headers, body: bytes) -> Dict[str, np.ndarray]:
+    """解析V2推理响应，支持二进制张量扩展和纯JSON两种格式"""
+    header_length = headers.get(_HEADER_LENGTH)
+    if header_length is None:
+        header, binary = json.loads(body), b""
+    else:
+        header_length = int(header_length)
+        header, binary = json.loads(body[:header_length]), body[header_length:]
+    
+    results = {}
+    offset = 0
+    for output in header.get("outputs", []):
+        dtype = _V2_DATATYPES[output["datatype"]]
+        size = output.get("parameters", {}).get("binary_data_size")
+        if size is not None:
+            array = np.frombuffer(
+                binary,
+                dtype=dtype,
+                count=size // np.dtype(dtype).itemsize,
+                offset=offset
+            )
+            offset += size
+        else:
+            array = np.asarray(output["data"], dtype=dtype)
+        results[output["name"]] = array.reshape(output["shape"])
+    return results
+
+def _to_json(value: Any) -> Any:
+    """将请求数据中的bytes转换为KServe V1约定的base64格式"""
+    if isinstance(value, (bytes, bytearray)):
+        return {"b64": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+# 全局KServe客户端池实例
+kserve_client_pool = KServeClientPool()
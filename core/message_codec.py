@@ -0,0 +1,81 @@
+import json
+from typing import Callable, Dict, List
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖，仅msgpack编码需要
+    msgpack = None
+
+try:
+    import vision_service_pb2
+except ImportError:  # 需要将protos目录加入模块搜索路径
+    vision_service_pb2 = None
+
+# 标识消息体编码格式的消息属性名
+FORMAT_PROPERTY = "format"
+
+def encode_json(result: Dict) -> bytes:
+    """JSON编码"""
+    return json.dumps(result).encode("utf-8")
+
+def encode_msgpack(result: Dict) -> bytes:
+    """msgpack编码，字段与JSON格式相同"""
+    return msgpack.packb(result, use_bin_type=True)
+
+def encode_protobuf(result: Dict) -> bytes:
+    """按vision_service.proto的DetectionResult编码"""
+    return to_detection_result(result).SerializeToString()
+
+def to_detection_result(result: Dict):
+    """将结果字典转换为DetectionResult消息，时间戳转换为毫秒"""
+    message = vision_service_pb2.DetectionResult(
+        id=result.get("id", ""),
+        skill_name=result.get("skill_name", ""),
+        image_url=result.get("image_url", ""),
+        video_url=result.get("video_url", ""),
+        alert_level=result.get("alert_level", ""),
+        timestamp=int(result.get("timestamp", 0) * 1000),
+        stream_id=result.get("stream_id", ""),
+        clip_status=result.get("clip_status", "")
+    )
+    add_detections(message.detections, result.get("detections", []))
+    return message
+
+def add_detections(target, detections: List[Dict]):
+    """将检测结果添加到repeated Detection字段，attributes的值转换为字符串"""
+    for detection in detections:
+        item = target.add(
+            class_name=detection.get("class_name", ""),
+            confidence=detection.get("confidence", 0.0)
+        )
+        bbox = detection.get("bbox")
+        if bbox:
+            item.bbox.x = bbox.get("x", 0.0)
+            item.bbox.y = bbox.get("y", 0.0)
+            item.bbox.width = bbox.get("width", 0.0)
+            item.bbox.height = bbox.get("height", 0.0)
+        for key, value in (detection.get("attributes") or {}).items():
+            item.attributes[key] = str(value)
+
+_ENCODERS = {
+    "json": encode_json,
+    "msgpack": encode_msgpack,
+    "protobuf": encode_protobuf
+}
+
+def get_encoder(message_format: str) -> Callable[[Dict], bytes]:
+    """获取消息编码函数
+    
+    Args:
+        message_format: 编码格式，json、msgpack或protobuf
+    
+    Returns:
+        Callable: 将结果字典编码为消息体的函数
+    """
+    if message_format not in _ENCODERS:
+        raise ValueError(f"Unsupported message format: {message_format}")
+    if message_format == "msgpack" and msgpack is None:
+        raise RuntimeError("msgpack is required for msgpack message encoding")
+    if message_format == "protobuf" and vision_service_pb2 is None:
+        raise RuntimeError("vision_service_pb2 is required for protobuf message encoding")
+    return _ENCODERS[message_format]
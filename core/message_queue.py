@@ -1,33 +1,178 @@
-import json
-from typing import Dict
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from rocketmq.client import Producer, Message
+from rocketmq.exceptions import ffi_check
+from rocketmq.ffi import dll
 from config.config import settings
+from core.message_codec import FORMAT_PROPERTY, get_encoder
+
+logger = logging.getLogger(__name__)
 
 class MessageQueue:
+    """RocketMQ批量异步生产者
+    
+    消息按批大小或最长等待时间汇集成批，在后台线程中发送，不阻塞事件循环。
+    没有正在发送的消息时立即发送，避免空闲时的等待延迟。
+    RocketMQ Python客户端没有批量发送接口，一个批次在发送线程中依次同步发送，
+    多个批次可由不同线程并行发送。
+    
+    消息体的编码格式由ROCKETMQ_MESSAGE_FORMAT配置，并写入消息的format属性。
+    """
+    
     def __init__(self):
         self.producer = Producer(settings.ROCKETMQ_GROUP_ID)
         self.producer.set_name_server_address(settings.ROCKETMQ_NAME_SERVER)
         self.producer.start()
+        self.message_format = settings.ROCKETMQ_MESSAGE_FORMAT
+        self._encode = get_encoder(self.message_format)
+        
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.ROCKETMQ_SEND_WORKERS,
+            thread_name_prefix="rocketmq-send"
+        )
+        self._batch: List[Tuple[Message, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = 0
+        self._sending = set()
+    
+    @property
+    def queued(self) -> int:
+        """等待发送的消息数"""
+        return len(self._batch)
+    
+    @property
+    def in_flight(self) -> int:
+        """正在发送的消息数"""
+        return self._in_flight
+    
+    def get_stats(self) -> Dict:
+        """生产者的发送队列状态"""
+        return {"queued": self.queued, "in_flight": self.in_flight}
+    
+    def submit(self, result: Dict) -> asyncio.Future:
+        """提交检测结果，立即返回发送结果的future
+        
+        需要确认投递的调用方可以等待该future，发送失败时future携带异常。
+        等待发送的消息数达到上限时抛出异常。
+        """
+        if self.queued + self.in_flight >= settings.ROCKETMQ_MAX_PENDING:
+            raise RuntimeError("RocketMQ producer queue is full")
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((self._build_message(result), future))
+        
+        if len(self._batch) >= settings.ROCKETMQ_BATCH_SIZE or self._in_flight == 0:
+            self._flush()
+        elif self._timer is None:
+            # 批次的第一条消息开始计时
+            self._timer = loop.call_later(
+                settings.ROCKETMQ_LINGER_MS / 1000.0,
+                self._flush
+            )
+        return future
     
     async def send_detection_result(self, result: Dict):
-        """发送检测结果到消息队列"""
+        """发送检测结果到消息队列，等待消息发送完成"""
+        await self.submit(result)
+    
+    async def send_many(self, results: List[Dict]) -> List[Optional[Exception]]:
+        """提交多条检测结果后一起等待发送完成
+        
+        所有消息先进入批次并立即发出，不等待ROCKETMQ_LINGER_MS；
+        按输入顺序返回每条消息的发送异常，发送成功时为None。
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        for result in results:
+            try:
+                futures.append(self.submit(result))
+            except Exception as e:
+                future = loop.create_future()
+                future.set_exception(e)
+                futures.append(future)
+        self._flush()
+        
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+        return [
+            outcome if isinstance(outcome, BaseException) else None
+            for outcome in outcomes
+        ]
+    
+    def _build_message(self, result: Dict) -> Message:
+        # 按配置的格式编码结果
+        message_body = self._encode(result)
+        
+        # 创建消息
+        msg = Message(settings.ROCKETMQ_TOPIC)
+        msg.set_keys(result.get("id", ""))
+        msg.set_tags(result.get("skill_name", ""))
+        msg.set_property(FORMAT_PROPERTY, self.message_format)
+        # set_body按C字符串写入，二进制消息体需要指定长度
+        ffi_check(dll.SetByteMessageBody(msg._handle, message_body, len(message_body)))
+        return msg
+    
+    def _flush(self):
+        """将当前批次交给发送线程"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._batch = self._batch, []
+        if batch:
+            # 在提交发送前计数，使同一轮事件循环中的后续消息进入下一批次
+            self._in_flight += len(batch)
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+    
+    async def _send(self, batch: List[Tuple[Message, asyncio.Future]]):
+        """在发送线程中发送一个批次，并设置各消息的发送结果"""
         try:
-            # 将结果转换为JSON字符串
-            message_body = json.dumps(result)
-            
-            # 创建消息
-            msg = Message(settings.ROCKETMQ_TOPIC)
-            msg.set_keys(result.get("id", ""))
-            msg.set_tags(result.get("skill_name", ""))
-            msg.set_body(message_body)
-            
-            # 发送消息
-            self.producer.send_sync(msg)
-            
+            loop = asyncio.get_running_loop()
+            errors = await loop.run_in_executor(
+                self._executor,
+                self._send_batch,
+                [msg for msg, _ in batch]
+            )
         except Exception as e:
-            # 这里应该添加proper logging
-            print(f"Error sending message to RocketMQ: {str(e)}")
-            raise
+            errors = [e] * len(batch)
+        finally:
+            self._in_flight -= len(batch)
+        
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        
+        failed = [error for error in errors if error is not None]
+        if failed:
+            logger.error(
+                "Error sending messages to RocketMQ",
+                extra={"failed": len(failed), "batch_size": len(batch), "error": str(failed[0])}
+            )
+    
+    def _send_batch(self, messages: List[Message]) -> List[Optional[Exception]]:
+        """依次同步发送一个批次，返回每条消息的发送异常"""
+        errors = []
+        for msg in messages:
+            try:
+                self.producer.send_sync(msg)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+    
+    async def close(self):
+        """发送剩余的消息并等待发送完成"""
+        self._flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
     
     def __del__(self):
         """确保在对象销毁时关闭producer"""
@@ -35,4 +180,4 @@ class MessageQueue:
             self.producer.shutdown()
 
 # 全局消息队列实例
-message_queue = MessageQueue() 
\ No newline at end of file
+message_queue = MessageQueue()
\ No newline at end of file
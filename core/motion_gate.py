@@ -0,0 +1,73 @@
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from config.config import settings
+
+def motion_signature(frame: np.ndarray) -> np.ndarray:
+    """计算用于帧差比较的缩略灰度图"""
+    height, width = frame.shape[:2]
+    target_width = settings.MOTION_GATE_WIDTH
+    target_height = max(1, int(height * target_width / width))
+    small = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    # 平滑噪声，避免传感器噪声和压缩伪影被当作运动
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+class MotionGate:
+    """基于下采样帧差的推理前置过滤
+    
+    将当前帧与上次推理时的帧比较，变化像素比例低于阈值时跳过推理，
+    沿用上次的推理结果。与上次推理帧比较而不是与相邻帧比较，缓慢的变化累积后也会触发推理；
+    超过最长跳过时间后强制推理一次。
+    """
+    
+    def __init__(self, threshold: float):
+        """
+        Args:
+            threshold: 触发推理的变化像素比例（0~1）
+        """
+        self.threshold = threshold
+        self.max_skip = settings.MOTION_GATE_MAX_SKIP_SECONDS
+        self.reference: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+        self.checked = 0
+        self.skipped = 0
+    
+    def should_infer(self, signature: np.ndarray, timestamp: float) -> bool:
+        """判断当前帧是否需要推理
+        
+        Args:
+            signature: 当前帧的缩略灰度图
+            timestamp: 当前帧的流内时间戳（秒）
+        """
+        self.checked += 1
+        if (
+            self.reference is None
+            or self.reference.shape != signature.shape
+            or timestamp - self._reference_time >= self.max_skip
+        ):
+            return True
+        
+        diff = cv2.absdiff(signature, self.reference)
+        changed = np.count_nonzero(diff > settings.MOTION_GATE_PIXEL_DIFF) / diff.size
+        if changed >= self.threshold:
+            return True
+        
+        self.skipped += 1
+        return False
+    
+    def update(self, signature: np.ndarray, timestamp: float):
+        """推理完成后以当前帧作为比较基准"""
+        self.reference = signature
+        self._reference_time = timestamp
+    
+    def get_stats(self) -> Dict:
+        """跳过推理的统计"""
+        return {
+            "threshold": self.threshold,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.checked if self.checked else 0.0
+        }
@@ -0,0 +1,56 @@
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+from config.config import settings
+
+# 实时视频流的地址协议，其他协议及本地文件按回放处理
+LIVE_SCHEMES = ("rtsp", "rtsps", "rtmp", "rtmps", "srt", "udp", "rtp")
+
+def is_live_source(stream_url: str) -> bool:
+    """判断视频流是否按实时视频流读取
+    
+    实时视频流只对最新的帧推理，积压的旧帧不推理；旧帧在入队前已由解码线程写入
+    预警片段的帧缓冲区（或数据包缓冲区），预警视频片段仍然完整。回放（本地文件、HTTP点播等）
+    逐帧处理，由解码队列反压，读取速度只受处理能力限制。
+    """
+    if settings.STREAM_PACING == "live":
+        return True
+    if settings.STREAM_PACING == "replay":
+        return False
+    return urlparse(stream_url).scheme.lower() in LIVE_SCHEMES
+
+class FrameLagMonitor:
+    """视频流的端到端帧延迟统计
+    
+    帧延迟为帧解码完成到该帧处理结束的时间，包括解码队列中的等待和推理耗时。
+    """
+    
+    # 平均延迟的指数平滑系数
+    _SMOOTHING = 0.1
+    
+    def __init__(self):
+        self.last = 0.0
+        self.average = 0.0
+        self.max = 0.0
+        self.frames = 0
+        self.stale = 0
+    
+    def record(self, captured_at: float):
+        """记录一帧处理完成"""
+        lag = max(time.time() - captured_at, 0.0)
+        self.last = lag
+        self.average = lag if not self.frames else (
+            self.average + (lag - self.average) * self._SMOOTHING
+        )
+        self.max = max(self.max, lag)
+        self.frames += 1
+    
+    def get_stats(self) -> Dict:
+        return {
+            "lag": self.last,
+            "average_lag": self.average,
+            "max_lag": self.max,
+            "frames": self.frames,
+            "stale": self.stale
+        }
@@ -0,0 +1,229 @@
+import io
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    import av
+except ImportError:  # PyAV为可选依赖，仅packet直通模式需要
+    av = None
+
+class PacketRingBuffer:
+    """压缩数据包环形缓冲区
+    
+    按GOP保存视频流的原始压缩数据包（H.264/H.265等），始终从关键帧开始，
+    超出缓冲时长时整组丢弃最旧的GOP。预警时直接将数据包封装为MP4，
+    无需解码和重新编码。
+    
+    数据包由解码线程写入，封装在线程池中执行，内部使用锁保护。
+    
+    封装时的流参数模板取自输入视频流，输入容器关闭后不能再访问。缓冲区持有输入容器，
+    解码线程不再读取（detach()）、缓冲区被释放（close()）且已截取的片段都封装完成后才关闭容器，
+    视频流结束或停止后仍可生成尚未完成的片段。
+    """
+    
+    def __init__(self, duration: float):
+        if av is None:
+            raise RuntimeError("PyAV is required for packet passthrough clips")
+        
+        self.duration = duration
+        self._gops: deque = deque()
+        self._stream = None  # 输入视频流，用作封装时的流参数模板
+        self._container = None
+        # 解码时使用的编码参数快照，不访问输入视频流
+        self._codec_name: Optional[str] = None
+        self._extradata: Optional[bytes] = None
+        # 正在使用输入容器的解码线程和封装任务数
+        self._users = 0
+        self._closed = False
+        self._nbytes = 0
+        self._lock = threading.Lock()
+    
+    def set_stream(self, stream, container=None):
+        """设置输入视频流，数据包的编码参数取自该流
+        
+        指定container时缓冲区持有输入容器，调用方（解码线程）读取结束后调用detach()，
+        容器由缓冲区关闭。
+        """
+        with self._lock:
+            self._stream = stream
+            self._container = container
+            self._codec_name = stream.codec_context.name
+            self._extradata = stream.codec_context.extradata
+            if container is not None:
+                self._users += 1
+    
+    def detach(self):
+        """解码线程结束读取输入容器"""
+        self._release()
+    
+    def close(self):
+        """释放缓冲区，已截取的片段封装完成后关闭输入容器"""
+        with self._lock:
+            self._closed = True
+            self._gops.clear()
+            self._nbytes = 0
+            container = self._take_container()
+        if container is not None:
+            container.close()
+    
+    def _release(self):
+        with self._lock:
+            self._users -= 1
+            container = self._take_container()
+        if container is not None:
+            container.close()
+    
+    def _take_container(self):
+        """缓冲区已释放且没有使用者时取出输入容器，调用方需持有锁"""
+        if not self._closed or self._users > 0 or self._container is None:
+            return None
+        container = self._container
+        self._container = None
+        self._stream = None
+        return container
+    
+    def append(self, packet):
+        """写入一个数据包，第一个关键帧之前的数据包被丢弃"""
+        if packet.dts is None or packet.size == 0:
+            # 解复用结束时的空数据包
+            return
+        
+        with self._lock:
+            if packet.is_keyframe:
+                self._gops.append([])
+            elif not self._gops:
+                return
+            
+            self._gops[-1].append(packet)
+            self._nbytes += packet.size
+            self._trim()
+    
+    def _trim(self):
+        """丢弃超出缓冲时长的最旧GOP，至少保留最近的一个GOP"""
+        while len(self._gops) > 1:
+            start = self._gops[1][0]
+            end = self._gops[-1][-1]
+            if (end.dts - start.dts) * end.time_base < self.duration:
+                break
+            dropped = self._gops.popleft()
+            self._nbytes -= sum(p.size for p in dropped)
+    
+    def snapshot(self) -> List:
+        """按解码顺序返回当前缓冲的数据包"""
+        with self._lock:
+            return [packet for gop in self._gops for packet in gop]
+    
+    @property
+    def nbytes(self) -> int:
+        """已缓冲的数据大小（字节）"""
+        return self._nbytes
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(gop) for gop in self._gops)
+    
+    def decode_frame(self, timestamp: float) -> Optional[np.ndarray]:
+        """解码缓冲区中时间戳不晚于timestamp的最后一帧
+        
+        从该帧所在GOP的关键帧开始解码，用于主码流只缓冲数据包时生成预警图片。
+        解码耗时与GOP长度成正比，应在线程池中执行。
+        
+        Returns:
+            Optional[np.ndarray]: BGR图像，缓冲区为空时返回None
+        """
+        with self._lock:
+            gop = None
+            for candidate in self._gops:
+                if gop is not None and _packet_time(candidate[0]) > timestamp:
+                    break
+                gop = candidate
+            # 最新的GOP仍在被写入，复制后在锁外解码
+            packets = list(gop) if gop else []
+        
+        if not packets or self._codec_name is None:
+            return None
+        
+        codec = av.CodecContext.create(self._codec_name, "r")
+        codec.extradata = self._extradata
+        
+        selected = None
+        for source in packets + [None]:
+            packet = None
+            if source is not None:
+                packet = av.Packet(bytes(source))
+                packet.pts = source.pts
+                packet.dts = source.dts
+                packet.time_base = source.time_base
+            # 解码器按显示顺序输出帧，超过目标时间戳后不再继续
+            for frame in codec.decode(packet):
+                if selected is not None and frame.pts is not None and (
+                    float(frame.pts * packets[0].time_base) > timestamp
+                ):
+                    return selected.to_ndarray(format="bgr24")
+                selected = frame
+        
+        return selected.to_ndarray(format="bgr24") if selected is not None else None
+    
+    def remux_job(self) -> Optional[Callable[[], Optional[bytes]]]:
+        """截取当前缓冲的数据包，返回将其封装为MP4的函数，供线程池执行
+        
+        截取时即持有输入容器，封装函数执行完成前容器不会关闭。
+        
+        Returns:
+            Optional[Callable]: 封装函数，缓冲区为空或已释放时返回None
+        """
+        with self._lock:
+            if self._closed or self._stream is None:
+                return None
+            packets = [packet for gop in self._gops for packet in gop]
+            if not packets:
+                return None
+            self._users += 1
+        
+        def remux() -> Optional[bytes]:
+            try:
+                return self._remux(packets)
+            finally:
+                self._release()
+        
+        return remux
+    
+    def remux_to_mp4(self) -> Optional[bytes]:
+        """将缓冲的数据包在内存中封装为MP4，不重新编码
+        
+        Returns:
+            Optional[bytes]: MP4数据，缓冲区为空时返回None
+        """
+        job = self.remux_job()
+        return job() if job else None
+    
+    def _remux(self, packets: List) -> bytes:
+        output_buffer = io.BytesIO()
+        with av.open(output_buffer, mode="w", format="mp4") as output:
+            # PyAV 14起使用add_stream_from_template
+            if hasattr(output, "add_stream_from_template"):
+                stream = output.add_stream_from_template(self._stream)
+            else:
+                stream = output.add_stream(template=self._stream)
+            
+            # 时间戳从0开始；缓冲的数据包可能正被其他片段使用，封装时复制
+            offset = packets[0].dts
+            for source in packets:
+                packet = av.Packet(bytes(source))
+                packet.pts = None if source.pts is None else source.pts - offset
+                packet.dts = source.dts - offset
+                packet.time_base = source.time_base
+                packet.duration = source.duration
+                packet.is_keyframe = source.is_keyframe
+                packet.stream = stream
+                output.mux(packet)
+        
+        return output_buffer.getvalue()
+
+def _packet_time(packet) -> float:
+    """数据包的显示时间（秒）"""
+    pts = packet.pts if packet.pts is not None else packet.dts
+    return float(pts * packet.time_base)
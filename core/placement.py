@@ -0,0 +1,485 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, validator
+
+from config.config import settings
+from core.skill_manager import skill_manager
+from core.video_processor import DECODE_MODES, video_processor
+from core.schedule import compile_schedule
+
+logger = logging.getLogger(__name__)
+
+# 启动失败的技能订阅的最长重试间隔（秒）
+_MAX_RETRY_DELAY = 300
+
+class StreamDefinition(BaseModel):
+    """视频流上一个技能订阅的持久化定义"""
+    stream_id: str
+    stream_url: str
+    skill_name: str
+    alert_level: str
+    frame_interval: Optional[int] = None
+    roi: Optional[List[str]] = None
+    schedule: Optional[str] = None
+    motion_threshold: Optional[float] = None
+    min_frame_interval: Optional[float] = None
+    max_frame_interval: Optional[float] = None
+    decode_mode: Optional[str] = None
+    detection_url: Optional[str] = None
+    
+    @validator("decode_mode")
+    def check_decode_mode(cls, value):
+        # 在保存定义时校验，避免无效定义被各节点反复协调
+        if value is not None and value not in DECODE_MODES:
+            raise ValueError(f"Unsupported decode mode: {value}")
+        return value
+    
+    @validator("schedule")
+    def check_schedule(cls, value):
+        compile_schedule(value)
+        return value
+
+class PlacementStore(ABC):
+    """视频流放置信息的存储接口
+    
+    保存视频流定义、存活节点及视频流租约。租约以stream_url为键，
+    同一视频流的所有技能订阅放置在同一节点上，共用一个解码器。
+    时间均为Unix时间戳，集群各节点需要保持时钟同步。
+    """
+    
+    @abstractmethod
+    def put_stream(self, definition: StreamDefinition):
+        """保存视频流定义"""
+        pass
+    
+    @abstractmethod
+    def delete_stream(self, stream_id: str):
+        """删除视频流定义"""
+        pass
+    
+    @abstractmethod
+    def get_stream(self, stream_id: str) -> Optional[StreamDefinition]:
+        """获取视频流定义"""
+        pass
+    
+    @abstractmethod
+    def list_streams(self) -> List[StreamDefinition]:
+        """列出所有视频流定义"""
+        pass
+    
+    @abstractmethod
+    def heartbeat(self, node_id: str, capacity: int, ttl: float):
+        """注册或续期节点"""
+        pass
+    
+    @abstractmethod
+    def remove_node(self, node_id: str):
+        """移除节点"""
+        pass
+    
+    @abstractmethod
+    def list_nodes(self) -> Dict[str, int]:
+        """列出存活节点及其容量"""
+        pass
+    
+    @abstractmethod
+    def acquire(self, key: str, node_id: str, ttl: float) -> bool:
+        """获取或续期租约，租约由其他节点持有且未过期时返回False"""
+        pass
+    
+    @abstractmethod
+    def release(self, key: str, node_id: str):
+        """释放节点持有的租约"""
+        pass
+    
+    @abstractmethod
+    def list_leases(self) -> Dict[str, str]:
+        """列出未过期的租约及其持有节点"""
+        pass
+
+class MemoryPlacementStore(PlacementStore):
+    """进程内存储，用于单节点部署和测试，重启后数据丢失"""
+    
+    def __init__(self):
+        self._streams: Dict[str, StreamDefinition] = {}
+        self._nodes: Dict[str, tuple] = {}
+        self._leases: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def put_stream(self, definition: StreamDefinition):
+        with self._lock:
+            self._streams[definition.stream_id] = definition
+    
+    def delete_stream(self, stream_id: str):
+        with self._lock:
+            self._streams.pop(stream_id, None)
+    
+    def get_stream(self, stream_id: str) -> Optional[StreamDefinition]:
+        with self._lock:
+            return self._streams.get(stream_id)
+    
+    def list_streams(self) -> List[StreamDefinition]:
+        with self._lock:
+            return list(self._streams.values())
+    
+    def heartbeat(self, node_id: str, capacity: int, ttl: float):
+        with self._lock:
+            self._nodes[node_id] = (capacity, time.time() + ttl)
+    
+    def remove_node(self, node_id: str):
+        with self._lock:
+            self._nodes.pop(node_id, None)
+    
+    def list_nodes(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            return {
+                node_id: capacity
+                for node_id, (capacity, expires) in self._nodes.items()
+                if expires > now
+            }
+    
+    def acquire(self, key: str, node_id: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] != node_id and lease[1] > now:
+                return False
+            self._leases[key] = (node_id, now + ttl)
+            return True
+    
+    def release(self, key: str, node_id: str):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease[0] == node_id:
+                del self._leases[key]
+    
+    def list_leases(self) -> Dict[str, str]:
+        now = time.time()
+        with self._lock:
+            return {
+                key: node_id
+                for key, (node_id, expires) in self._leases.items()
+                if expires > now
+            }
+
+class SQLitePlacementStore(PlacementStore):
+    """SQLite存储，同一主机上的多个进程可共享，视频流定义在重启后保留"""
+    
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS streams ("
+                "stream_id TEXT PRIMARY KEY, definition TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes ("
+                "node_id TEXT PRIMARY KEY, capacity INTEGER NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, node_id TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+    
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+    
+    def put_stream(self, definition: StreamDefinition):
+        self._execute(
+            "INSERT OR REPLACE INTO streams (stream_id, definition) VALUES (?, ?)",
+            (definition.stream_id, definition.json())
+        )
+    
+    def delete_stream(self, stream_id: str):
+        self._execute("DELETE FROM streams WHERE stream_id = ?", (stream_id,))
+    
+    def get_stream(self, stream_id: str) -> Optional[StreamDefinition]:
+        rows = self._execute(
+            "SELECT definition FROM streams WHERE stream_id = ?",
+            (stream_id,)
+        )
+        return StreamDefinition(**json.loads(rows[0][0])) if rows else None
+    
+    def list_streams(self) -> List[StreamDefinition]:
+        rows = self._execute("SELECT definition FROM streams")
+        return [StreamDefinition(**json.loads(row[0])) for row in rows]
+    
+    def heartbeat(self, node_id: str, capacity: int, ttl: float):
+        self._execute(
+            "INSERT OR REPLACE INTO nodes (node_id, capacity, expires) VALUES (?, ?, ?)",
+            (node_id, capacity, time.time() + ttl)
+        )
+    
+    def remove_node(self, node_id: str):
+        self._execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+    
+    def list_nodes(self) -> Dict[str, int]:
+        rows = self._execute(
+            "SELECT node_id, capacity FROM nodes WHERE expires > ?",
+            (time.time(),)
+        )
+        return dict(rows)
+    
+    def acquire(self, key: str, node_id: str, ttl: float) -> bool:
+        now = time.time()
+        # 租约不存在、已过期或由本节点持有时写入，在同一事务中完成检查和写入
+        self._execute(
+            "INSERT INTO leases (key, node_id, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET node_id = excluded.node_id, expires = excluded.expires "
+            "WHERE leases.node_id = excluded.node_id OR leases.expires <= ?",
+            (key, node_id, now + ttl, now)
+        )
+        rows = self._execute("SELECT node_id FROM leases WHERE key = ?", (key,))
+        return bool(rows) and rows[0][0] == node_id
+    
+    def release(self, key: str, node_id: str):
+        self._execute(
+            "DELETE FROM leases WHERE key = ? AND node_id = ?",
+            (key, node_id)
+        )
+    
+    def list_leases(self) -> Dict[str, str]:
+        rows = self._execute(
+            "SELECT key, node_id FROM leases WHERE expires > ?",
+            (time.time(),)
+        )
+        return dict(rows)
+
+class PlacementManager:
+    """集群视频流放置
+    
+    视频流定义保存在共享存储中，各节点定期发送心跳，并按容量比例领取视频流的租约，
+    只处理自己持有租约的视频流：
+    - 新节点加入后各节点的目标数量降低，超出目标的节点释放多余的视频流由新节点领取；
+    - 节点离开后其租约过期，视频流由其他节点接管；
+    - 节点重启后从存储中恢复视频流定义，重新领取并继续处理。
+    """
+    
+    def __init__(self, store: PlacementStore, node_id: str, capacity: int):
+        self.store = store
+        self.node_id = node_id
+        self.capacity = capacity
+        self.interval = settings.PLACEMENT_INTERVAL
+        self.ttl = settings.PLACEMENT_LEASE_TTL
+        # 本节点已启动的技能订阅
+        self._running: Dict[str, StreamDefinition] = {}
+        # 启动失败的技能订阅：(下次重试的时间, 重试间隔)
+        self._failed: Dict[str, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._reconcile_lock = asyncio.Lock()
+    
+    async def add_stream(self, definition: StreamDefinition) -> str:
+        """保存视频流定义，由持有租约的节点启动处理"""
+        if await self._call(self.store.get_stream, definition.stream_id):
+            raise ValueError(f"Stream {definition.stream_url} is already being processed")
+        if not skill_manager.get_skill(definition.skill_name):
+            raise ValueError(f"Skill {definition.skill_name} not found")
+        await self._call(self.store.put_stream, definition)
+        await self.reconcile()
+        return definition.stream_id
+    
+    async def remove_stream(self, stream_id: str):
+        """删除视频流定义，持有租约的节点停止处理"""
+        await self._call(self.store.delete_stream, stream_id)
+        await self.reconcile()
+    
+    def start(self):
+        """启动后台协调任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """停止协调任务并释放租约，视频流由其他节点接管"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        for stream_id in list(self._running):
+            await video_processor.stop_stream(stream_id)
+        for key in {d.stream_url for d in self._running.values()}:
+            await self._call(self.store.release, key, self.node_id)
+        self._running.clear()
+        await self._call(self.store.remove_node, self.node_id)
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(
+                    "Error reconciling stream placement",
+                    extra={"node_id": self.node_id, "error": str(e)}
+                )
+            await asyncio.sleep(self.interval)
+    
+    async def reconcile(self):
+        """按当前的租约启动或停止本节点的视频流"""
+        async with self._reconcile_lock:
+            desired = await self._call(self._plan)
+            
+            for stream_id in list(self._running):
+                # 视频流已删除或租约已转移
+                if stream_id not in desired:
+                    await video_processor.stop_stream(stream_id)
+                    del self._running[stream_id]
+            for stream_id in list(self._failed):
+                if stream_id not in desired:
+                    del self._failed[stream_id]
+            
+            for stream_id, definition in desired.items():
+                if stream_id in video_processor.active_streams:
+                    # 已由本进程处理（包括通过接口直接启动的订阅），运行超过一个协调周期后清除退避
+                    if stream_id in self._running:
+                        self._failed.pop(stream_id, None)
+                    self._running[stream_id] = definition
+                    continue
+                retry_at, delay = self._failed.get(stream_id, (0.0, 0.0))
+                if stream_id in self._running:
+                    # 处理任务已退出（视频流读取出错或结束），按退避间隔重新启动
+                    del self._running[stream_id]
+                    self._retry_later(stream_id, delay, "Placed stream exited, restarting later")
+                    continue
+                if time.monotonic() < retry_at:
+                    continue
+                try:
+                    await video_processor.process_stream(
+                        stream_url=definition.stream_url,
+                        skill_name=definition.skill_name,
+                        alert_level=definition.alert_level,
+                        frame_interval=definition.frame_interval,
+                        roi=definition.roi,
+                        schedule=definition.schedule,
+                        motion_threshold=definition.motion_threshold,
+                        min_frame_interval=definition.min_frame_interval,
+                        max_frame_interval=definition.max_frame_interval,
+                        decode_mode=definition.decode_mode,
+                        detection_url=definition.detection_url
+                    )
+                except Exception as e:
+                    # 定义无效（如技能不存在）或视频流无法打开时不标记为运行中，
+                    # 保留租约并退避重试，避免视频流在节点间反复转移
+                    self._retry_later(stream_id, delay, "Error starting placed stream, retrying later", e)
+                    continue
+                # 退避在视频流持续运行后才清除，打开后很快退出的视频流继续增加重试间隔
+                self._running[stream_id] = definition
+    
+    def _retry_later(
+        self,
+        stream_id: str,
+        delay: float,
+        message: str,
+        error: Optional[Exception] = None
+    ):
+        """按指数退避安排技能订阅的下次启动"""
+        delay = min(max(delay * 2, self.interval), _MAX_RETRY_DELAY)
+        self._failed[stream_id] = (time.monotonic() + delay, delay)
+        extra = {"stream_id": stream_id, "retry_in": delay}
+        if error is not None:
+            extra["error"] = str(error)
+        logger.error(message, extra=extra)
+    
+    def _plan(self) -> Dict[str, StreamDefinition]:
+        """计算本节点应处理的技能订阅，在线程池中执行"""
+        self.store.heartbeat(self.node_id, self.capacity, self.ttl)
+        nodes = self.store.list_nodes()
+        leases = self.store.list_leases()
+        
+        streams: Dict[str, List[StreamDefinition]] = {}
+        for definition in self.store.list_streams():
+            streams.setdefault(definition.stream_url, []).append(definition)
+        
+        # 按容量比例计算本节点的目标视频流数
+        total_capacity = sum(nodes.values()) or self.capacity
+        target = min(
+            self.capacity,
+            math.ceil(len(streams) * self.capacity / total_capacity)
+        )
+        
+        owned = sorted(
+            key for key, node_id in leases.items()
+            if node_id == self.node_id
+        )
+        for key in owned:
+            if key not in streams:
+                self.store.release(key, self.node_id)
+        owned = [key for key in owned if key in streams]
+        
+        # 超出目标时释放多余的视频流，由其他节点领取
+        if len(owned) > target:
+            for key in owned[target:]:
+                self.store.release(key, self.node_id)
+            logger.info(
+                "Released streams for rebalancing",
+                extra={"node_id": self.node_id, "released": len(owned) - target}
+            )
+            owned = owned[:target]
+        
+        # 续期已持有的租约，续期失败说明租约已过期并被其他节点领取
+        owned = [
+            key for key in owned
+            if self.store.acquire(key, self.node_id, self.ttl)
+        ]
+        
+        # 领取无主的视频流
+        for key in sorted(streams):
+            if len(owned) >= target:
+                break
+            if key not in leases and self.store.acquire(key, self.node_id, self.ttl):
+                owned.append(key)
+        
+        if sum(nodes.values()) < len(streams):
+            logger.warning(
+                "Cluster capacity is insufficient for all streams",
+                extra={"streams": len(streams), "capacity": sum(nodes.values())}
+            )
+        
+        return {
+            definition.stream_id: definition
+            for key in owned
+            for definition in streams[key]
+        }
+    
+    async def _call(self, func, *args):
+        """在线程池中执行存储操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+def create_placement_manager() -> Optional[PlacementManager]:
+    """按配置创建放置管理器，未启用时返回None"""
+    if settings.PLACEMENT_STORE == "none":
+        return None
+    if settings.PLACEMENT_STORE == "memory":
+        store = MemoryPlacementStore()
+    elif settings.PLACEMENT_STORE == "sqlite":
+        store = SQLitePlacementStore(settings.PLACEMENT_SQLITE_PATH)
+    else:
+        raise ValueError(f"Unsupported placement store: {settings.PLACEMENT_STORE}")
+    
+    # 多进程模式下每个工作进程作为独立节点参与放置
+    node_id = settings.PLACEMENT_NODE_ID or socket.gethostname()
+    if settings.GRPC_WORKERS > 1:
+        node_id = f"{node_id}-{settings.GRPC_WORKER_INDEX}"
+    capacity = max(1, settings.PLACEMENT_NODE_CAPACITY // settings.GRPC_WORKERS)
+    return PlacementManager(store, node_id, capacity)
+
+# 全局视频流放置管理器实例，未启用时为None
+placement_manager = create_placement_manager()
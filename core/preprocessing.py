@@ -0,0 +1,146 @@
+from typing import Dict, List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+from core.skills.base import Model
+
+class PreprocessMeta(NamedTuple):
+    """预处理的几何变换参数，用于将模型输出坐标映射回原图"""
+    scale_x: float
+    scale_y: float
+    pad_x: int
+    pad_y: int
+    width: int   # 原图宽度
+    height: int  # 原图高度
+
+def letterbox(
+    image: np.ndarray,
+    height: int,
+    width: int,
+    color: int = 114
+) -> Tuple[np.ndarray, float, int, int]:
+    """等比缩放并居中填充到目标尺寸
+    
+    Returns:
+        Tuple: (填充后的图像, 缩放比例, 水平填充, 垂直填充)
+    """
+    h, w = image.shape[:2]
+    scale = min(height / h, width / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    
+    pad_x = (width - new_w) // 2
+    pad_y = (height - new_h) // 2
+    canvas = np.full((height, width, image.shape[2]), color, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return canvas, scale, pad_x, pad_y
+
+def center_crop(
+    image: np.ndarray,
+    height: int,
+    width: int
+) -> Tuple[np.ndarray, float, int, int]:
+    """等比缩放到覆盖目标尺寸后居中裁剪
+    
+    Returns:
+        Tuple: (裁剪后的图像, 缩放比例, 水平裁剪偏移, 垂直裁剪偏移)
+    """
+    h, w = image.shape[:2]
+    scale = max(height / h, width / w)
+    new_w, new_h = max(int(round(w * scale)), width), max(int(round(h * scale)), height)
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    
+    crop_x = (new_w - width) // 2
+    crop_y = (new_h - height) // 2
+    return image[crop_y:crop_y + height, crop_x:crop_x + width], scale, crop_x, crop_y
+
+def preprocess(frame: np.ndarray, model: Model) -> Tuple[np.ndarray, PreprocessMeta]:
+    """按模型的预处理配置将BGR帧转换为CHW float32输入张量
+    
+    支持的配置：resize_mode（letterbox、resize或crop）、mean、std，
+    输入尺寸取自model.input_shape [H, W, C]。
+    """
+    config = model.preprocessing_config
+    height, width = model.input_shape[:2]
+    orig_h, orig_w = frame.shape[:2]
+    
+    resize_mode = config.get("resize_mode", "letterbox")
+    if resize_mode == "letterbox":
+        image, scale, pad_x, pad_y = letterbox(frame, height, width)
+        meta = PreprocessMeta(scale, scale, pad_x, pad_y, orig_w, orig_h)
+    elif resize_mode == "resize":
+        image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LINEAR)
+        meta = PreprocessMeta(width / orig_w, height / orig_h, 0, 0, orig_w, orig_h)
+    elif resize_mode == "crop":
+        # 裁剪偏移按负的填充量记录，坐标映射与letterbox相同
+        image, scale, crop_x, crop_y = center_crop(frame, height, width)
+        meta = PreprocessMeta(scale, scale, -crop_x, -crop_y, orig_w, orig_h)
+    else:
+        raise ValueError(f"Unsupported resize mode for tensor input: {resize_mode}")
+    
+    # BGR -> RGB，HWC -> CHW，归一化到[0, 1]后按通道标准化
+    tensor = image[:, :, ::-1].transpose(2, 0, 1).astype(np.float32)
+    tensor *= 1.0 / 255.0
+    if "mean" in config:
+        tensor -= np.asarray(config["mean"], dtype=np.float32)[:, None, None]
+    if "std" in config:
+        tensor /= np.asarray(config["std"], dtype=np.float32)[:, None, None]
+    
+    return np.ascontiguousarray(tensor), meta
+
+def postprocess(output: np.ndarray, model: Model, meta: PreprocessMeta) -> Dict:
+    """将检测模型的输出张量转换为检测结果
+    
+    输出张量每行为 (x1, y1, x2, y2, score, class_id)，坐标为模型输入尺寸下的像素坐标，
+    转换后的边界框为原图像素坐标。类别名称取自postprocessing_config的class_names。
+    
+    配置了nms_threshold时按类别做非极大值抑制，模型输出已经过NMS时不影响结果；
+    未配置时要求模型输出已经过NMS。输出不是每行6列时抛出ValueError。
+    """
+    output = np.asarray(output, dtype=np.float32)
+    if output.size % 6 != 0 or (output.ndim > 1 and output.shape[-1] != 6):
+        raise ValueError(
+            f"Model {model.name} output of shape {output.shape} is not (N, 6) detections"
+        )
+    rows = output.reshape(-1, 6)
+    # 去掉批量输出中用于补齐的空行
+    rows = rows[rows[:, 4] > 0]
+    
+    x1 = np.clip((rows[:, 0] - meta.pad_x) / meta.scale_x, 0, meta.width)
+    y1 = np.clip((rows[:, 1] - meta.pad_y) / meta.scale_y, 0, meta.height)
+    x2 = np.clip((rows[:, 2] - meta.pad_x) / meta.scale_x, 0, meta.width)
+    y2 = np.clip((rows[:, 3] - meta.pad_y) / meta.scale_y, 0, meta.height)
+    
+    keep = range(len(rows))
+    nms_threshold = model.postprocessing_config.get("nms_threshold")
+    if nms_threshold is not None and len(rows) > 1:
+        # 置信度阈值由各技能在共享结果上分别应用，这里不按置信度过滤
+        boxes = np.stack((x1, y1, x2 - x1, y2 - y1), axis=1).tolist()
+        keep = sorted(np.asarray(cv2.dnn.NMSBoxesBatched(
+            boxes,
+            rows[:, 4].tolist(),
+            rows[:, 5].astype(np.int32).tolist(),
+            0.0,
+            float(nms_threshold)
+        )).reshape(-1).tolist())
+    
+    class_names: List[str] = model.postprocessing_config.get("class_names", [])
+    detections = []
+    for i in keep:
+        class_id = int(rows[i, 5])
+        detections.append({
+            "class_name": class_names[class_id] if class_id < len(class_names) else str(class_id),
+            "confidence": float(rows[i, 4]),
+            "bbox": {
+                "x": float(x1[i]),
+                "y": float(y1[i]),
+                "width": float(x2[i] - x1[i]),
+                "height": float(y2[i] - y1[i])
+            },
+            "attributes": {}
+        })
+    
+    return {"detections": detections}
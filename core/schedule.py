@@ -0,0 +1,141 @@
+import bisect
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+_WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+class Schedule:
+    """编译后的每周处理调度
+    
+    调度文本由分号分隔的多个时间窗口组成，每个窗口为可选的星期加时间范围，例如
+    "Mon-Fri 08:00-18:00; Sat,Sun 10:00-16:00; 22:00-06:00"。不指定星期时每天生效；
+    结束时间不晚于开始时间时跨越午夜，星期指窗口开始的那一天。
+    
+    编译为一周内按分钟计的有序不重叠区间，查询当前状态和下次状态变化均为二分查找。
+    时间使用本地时间。
+    """
+    
+    def __init__(self, intervals: List[Tuple[int, int]]):
+        self.intervals = _merge(intervals)
+        self._starts = [start for start, _ in self.intervals]
+    
+    @property
+    def always_active(self) -> bool:
+        return self.intervals == [(0, MINUTES_PER_WEEK)]
+    
+    def is_active(self, now: datetime) -> bool:
+        """now是否在调度窗口内"""
+        minute = _minute_of_week(now)
+        index = bisect.bisect_right(self._starts, minute) - 1
+        return index >= 0 and minute < self.intervals[index][1]
+    
+    def next_change(self, now: datetime) -> Optional[datetime]:
+        """下次进入或离开调度窗口的时间，状态不会变化时返回None"""
+        if not self.intervals or self.always_active:
+            return None
+        
+        minute = _minute_of_week(now)
+        index = bisect.bisect_right(self._starts, minute) - 1
+        if index >= 0 and minute < self.intervals[index][1]:
+            end = self.intervals[index][1]
+            # 周末结束的区间与下周开始的区间相连
+            if end == MINUTES_PER_WEEK and self.intervals[0][0] == 0:
+                end += self.intervals[0][1]
+            target = end
+        elif index + 1 < len(self.intervals):
+            target = self.intervals[index + 1][0]
+        else:
+            target = self.intervals[0][0] + MINUTES_PER_WEEK
+        return now + timedelta(minutes=target - minute)
+    
+    def next_start(self, now: datetime) -> Optional[datetime]:
+        """下次进入调度窗口的时间，当前已在窗口内时返回now"""
+        if self.is_active(now):
+            return now
+        return self.next_change(now)
+
+@lru_cache(maxsize=256)
+def compile_schedule(text: Optional[str]) -> Optional[Schedule]:
+    """编译调度文本，为空时返回None（始终处理），格式错误时抛出ValueError"""
+    if not text or not text.strip():
+        return None
+    
+    intervals = []
+    for window in text.split(";"):
+        window = window.strip()
+        if not window:
+            continue
+        days_text, _, range_text = window.rpartition(" ")
+        try:
+            days = _parse_days(days_text) if days_text.strip() else range(7)
+            start, end = _parse_range(range_text)
+        except ValueError:
+            raise ValueError(f"Invalid schedule: {text}") from None
+        
+        for day in days:
+            window_start = day * MINUTES_PER_DAY + start
+            window_end = day * MINUTES_PER_DAY + end
+            if window_end > MINUTES_PER_WEEK:
+                # 周日跨午夜的部分落到周一
+                intervals.append((window_start, MINUTES_PER_WEEK))
+                intervals.append((0, window_end - MINUTES_PER_WEEK))
+            else:
+                intervals.append((window_start, window_end))
+    
+    if not intervals:
+        raise ValueError(f"Invalid schedule: {text}")
+    return Schedule(intervals)
+
+def _parse_days(text: str) -> List[int]:
+    """解析星期，如"Mon-Fri"、"Sat,Sun"，范围可以跨周末"""
+    days = []
+    for part in text.replace(" ", "").lower().split(","):
+        first, _, last = part.partition("-")
+        start = _WEEKDAYS[first[:3]] if first[:3] in _WEEKDAYS else _invalid(part)
+        end = start
+        if last:
+            end = _WEEKDAYS[last[:3]] if last[:3] in _WEEKDAYS else _invalid(part)
+        days.extend((start + i) % 7 for i in range((end - start) % 7 + 1))
+    return sorted(set(days))
+
+def _parse_range(text: str) -> Tuple[int, int]:
+    """解析"HH:MM-HH:MM"，返回一天内的开始和结束分钟数，跨午夜时结束分钟数加一天"""
+    start_text, end_text = text.split("-")
+    start = _parse_time(start_text)
+    end = _parse_time(end_text)
+    if start >= MINUTES_PER_DAY:
+        _invalid(text)
+    if end <= start:
+        end += MINUTES_PER_DAY
+    return start, end
+
+def _parse_time(text: str) -> int:
+    hour, minute = map(int, text.split(":"))
+    if not (0 <= hour <= 24 and 0 <= minute < 60) or (hour == 24 and minute):
+        _invalid(text)
+    return hour * 60 + minute
+
+def _invalid(text: str):
+    raise ValueError(text)
+
+def _merge(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """合并重叠或相邻的区间"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _minute_of_week(now: datetime) -> float:
+    return (
+        now.weekday() * MINUTES_PER_DAY
+        + now.hour * 60
+        + now.minute
+        + (now.second + now.microsecond / 1e6) / 60
+    )
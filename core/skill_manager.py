@@ -1,11 +1,44 @@
+import asyncio
+import copy
 from typing import Dict, List, Optional
-import kserve
+import cv2
+import numpy as np
 from kubernetes import client, config
 from core.skills import BaseSkill, available_skills
+from core.skills.base import Model
+from core.inference_batcher import InferenceBatcher
+from core.kserve_client import kserve_client_pool
+from core.preprocessing import preprocess, postprocess
+from config.config import settings
+
+class _SharedCall:
+    """同一帧上多个技能共享的推理请求
+    
+    记录等待结果的调用方数量，单个调用方取消时不影响其他调用方，
+    所有调用方都放弃等待（如超过截止时间）时取消推理请求。
+    """
+    
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+        # 已因所有调用方放弃而取消
+        self.abandoned = False
+    
+    async def wait(self) -> Dict:
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if not self.waiters and not self.task.done():
+                self.abandoned = True
+                self.task.cancel()
 
 class SkillManager:
     def __init__(self):
         self._skills: Dict[str, BaseSkill] = {}
+        # 跨视频流的推理请求批处理
+        self.batcher = InferenceBatcher(self._call_model_batch)
         self._init_kserve_client()
         self._register_available_skills()
     
@@ -34,8 +67,33 @@ class SkillManager:
         """列出所有可用技能"""
         return list(self._skills.keys())
     
-    async def invoke_skill(self, skill_name: str, input_data: Dict) -> Dict:
-        """调用技能进行推理"""
+    def requires_image(self, skill_name: str) -> bool:
+        """技能是否需要JPEG编码的图片输入
+        
+        使用V1协议的模型以JPEG图片作为输入，V2协议的模型直接使用原始帧。
+        """
+        skill = self.get_skill(skill_name)
+        if not skill:
+            raise ValueError(f"Skill {skill_name} not found")
+        return any(self._protocol(model) != "v2" for model in skill.models)
+    
+    async def invoke_skill(
+        self,
+        skill_name: str,
+        input_data: Dict,
+        shared_results: Optional[Dict] = None
+    ) -> Dict:
+        """调用技能进行推理
+        
+        Args:
+            skill_name: 技能名称
+            input_data: 输入数据
+            shared_results: 同一帧的共享推理结果表，由调用方为每帧创建；
+                多个技能对同一帧调用相同模型时只请求一次KServe
+            
+        Returns:
+            Dict: 技能处理后的结果
+        """
         skill = self.get_skill(skill_name)
         if not skill:
             raise ValueError(f"Skill {skill_name} not found")
@@ -49,12 +107,11 @@ class SkillManager:
             current_input = input_data
             
             for model in skill.models:
-                # 调用KServe推理服务
-                kserve_client = kserve.KServeClient()
-                response = await kserve_client.predict(
-                    name=model.name,
-                    data=current_input,
-                    version=model.version
+                # 调用KServe推理服务，只有原始输入的请求可以共享
+                response = await self._predict(
+                    model,
+                    current_input,
+                    shared_results if current_input is input_data else None
                 )
                 results.append(response)
                 
@@ -83,12 +140,11 @@ class SkillManager:
                 else:
                     current_input = input_data
                 
-                # 调用KServe推理服务
-                kserve_client = kserve.KServeClient()
-                response = await kserve_client.predict(
-                    name=model.name,
-                    data=current_input,
-                    version=model.version
+                # 调用KServe推理服务，只有原始输入的请求可以共享
+                response = await self._predict(
+                    model,
+                    current_input,
+                    shared_results if current_input is input_data else None
                 )
                 results.append(response)
                 
@@ -99,20 +155,12 @@ class SkillManager:
             return skill.process_results(results)
             
         elif pipeline_type == "parallel":
-            # 并行执行所有模型
-            import asyncio
-            
-            async def call_model(model):
-                kserve_client = kserve.KServeClient()
-                return await kserve_client.predict(
-                    name=model.name,
-                    data=input_data,
-                    version=model.version
-                )
-            
             # 并行调用所有模型
             results = await asyncio.gather(
-                *(call_model(model) for model in skill.models)
+                *(
+                    self._predict(model, input_data, shared_results)
+                    for model in skill.models
+                )
             )
             
             return skill.process_results(list(results))
@@ -120,6 +168,127 @@ class SkillManager:
         else:
             raise ValueError(f"Unsupported pipeline type: {pipeline_type}")
     
+    async def _predict(
+        self,
+        model: Model,
+        data: Dict,
+        shared_results: Optional[Dict] = None
+    ) -> Dict:
+        """调用模型推理并按模型的后处理配置过滤结果
+        
+        提供shared_results时，同一帧上推理标识（endpoint、模型、版本、协议、输入尺寸和预处理配置）
+        相同的请求只调用一次，各技能在共享的原始结果上应用各自的置信度阈值。
+        """
+        if shared_results is None:
+            response = await self._call_model(model, data)
+        else:
+            key = model.inference_key()
+            call = shared_results.get(key)
+            # 已被所有调用方放弃而取消的请求重新发起
+            if call is None or call.abandoned:
+                call = _SharedCall(asyncio.ensure_future(self._call_model(model, data)))
+                shared_results[key] = call
+            response = await call.wait()
+        
+        return self._apply_postprocessing(model, response)
+    
+    def _protocol(self, model: Model) -> str:
+        """模型使用的推理协议"""
+        return model.protocol or settings.KSERVE_PROTOCOL
+    
+    async def _call_model(self, model: Model, data: Dict) -> Dict:
+        """调用KServe推理服务，启用批处理时由批处理调度器合并请求"""
+        if (model.max_batch_size or settings.INFERENCE_MAX_BATCH_SIZE) > 1:
+            return await self.batcher.submit(model, data)
+        
+        if self._protocol(model) == "v2":
+            return (await self._infer_tensors(model, [data]))[0]
+        
+        kserve_client = kserve_client_pool.get(model.endpoint)
+        return await kserve_client.predict(
+            name=model.name,
+            data=self._v1_payload(data),
+            version=model.version
+        )
+    
+    async def _call_model_batch(self, model: Model, instances: List[Dict]) -> List[Dict]:
+        """批量调用KServe推理服务
+        
+        V1协议的批量请求使用instances/predictions格式，与单个请求的格式不同，
+        只有支持该格式的模型服务可以启用批处理（全局配置或模型的max_batch_size）。
+        """
+        if self._protocol(model) == "v2":
+            return await self._infer_tensors(model, instances)
+        
+        # V1协议instances/predictions格式
+        kserve_client = kserve_client_pool.get(model.endpoint)
+        response = await kserve_client.predict(
+            name=model.name,
+            data={"instances": [self._v1_payload(data) for data in instances]},
+            version=model.version
+        )
+        return response["predictions"]
+    
+    async def _infer_tensors(self, model: Model, instances: List[Dict]) -> List[Dict]:
+        """通过V2协议以二进制张量推理
+        
+        在本地按模型的预处理配置完成缩放和归一化，无需JPEG编解码。
+        """
+        # 预处理在线程池中执行，OpenCV和NumPy运算期间释放GIL
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(
+            None, self._prepare_tensors, model, instances
+        )
+        batch = np.stack([tensor for tensor, _ in prepared])
+        
+        input_name = model.preprocessing_config.get("input_name", "images")
+        output_name = model.postprocessing_config.get("output_name", "output0")
+        kserve_client = kserve_client_pool.get(model.endpoint)
+        outputs = await kserve_client.infer(
+            name=model.name,
+            version=model.version,
+            inputs={input_name: batch},
+            outputs=[output_name]
+        )
+        
+        output = outputs[output_name]
+        return [
+            postprocess(output[i], model, meta)
+            for i, (_, meta) in enumerate(prepared)
+        ]
+    
+    def _prepare_tensors(self, model: Model, instances: List[Dict]) -> List:
+        """将输入数据预处理为模型输入张量"""
+        prepared = []
+        for data in instances:
+            frame = data.get("frame")
+            if frame is None:
+                # 图片请求只有JPEG数据
+                frame = cv2.imdecode(
+                    np.frombuffer(data["image"], dtype=np.uint8),
+                    cv2.IMREAD_COLOR
+                )
+            prepared.append(preprocess(frame, model))
+        return prepared
+    
+    def _v1_payload(self, data: Dict) -> Dict:
+        """V1协议请求数据，原始帧不随JSON请求发送"""
+        return {k: v for k, v in data.items() if k != "frame"}
+    
+    def _apply_postprocessing(self, model: Model, response: Dict) -> Dict:
+        """按模型的置信度阈值过滤检测结果
+        
+        返回结果的副本，技能的process_results可以安全地修改检测结果。
+        """
+        response = copy.deepcopy(response)
+        threshold = model.postprocessing_config.get("confidence_threshold")
+        if threshold is not None and "detections" in response:
+            response["detections"] = [
+                d for d in response["detections"]
+                if d.get("confidence", 1.0) >= threshold
+            ]
+        return response
+    
     def _process_intermediate_result(self, result: Dict) -> Dict:
         """处理中间结果，准备作为下一个模型的输入"""
         # 这里可以添加通用的中间结果处理逻辑
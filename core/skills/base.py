@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 from abc import ABC, abstractmethod
 from pydantic import BaseModel
 from core.alert_detector import AlertDetector
@@ -10,6 +10,35 @@ class Model(BaseModel):
     input_shape: List[int]
     preprocessing_config: Dict
     postprocessing_config: Dict
+    max_batch_size: Optional[int] = None  # 最大推理批大小，为空时使用全局配置，1表示不批处理
+    protocol: Optional[str] = None  # 推理协议：v1（JSON）或v2（二进制张量），为空时使用全局配置
+    
+    def inference_key(self) -> Tuple:
+        """推理请求的标识，相同标识的模型对同一输入返回相同的原始结果
+        
+        除(endpoint, 模型, 版本)外包含协议、输入尺寸和预处理配置：V2协议在本地预处理，
+        同一模型使用不同预处理配置时结果不同。后处理配置中只有输出名称、类别名称和NMS阈值
+        在共享之前使用，置信度阈值由各技能在共享结果上分别应用。
+        """
+        return (
+            self.endpoint,
+            self.name,
+            self.version,
+            self.protocol,
+            tuple(self.input_shape),
+            _freeze(self.preprocessing_config),
+            self.postprocessing_config.get("output_name"),
+            _freeze(self.postprocessing_config.get("class_names")),
+            self.postprocessing_config.get("nms_threshold")
+        )
+
+def _freeze(value: Any) -> Any:
+    """将配置转换为可哈希的形式"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
 
 class BaseSkill(ABC):
     """技能基类"""
@@ -38,6 +67,14 @@ class BaseSkill(ABC):
         """技能的异常检测器"""
         pass
     
+    @property
+    def motion_threshold(self) -> Optional[float]:
+        """技能默认的运动阈值（变化像素比例），为空时使用全局配置
+        
+        目标通常静止的技能（如区域入侵后的滞留）可以返回0以禁用运动过滤。
+        """
+        return None
+    
     def process_results(self, results: List[Dict]) -> Dict:
         """处理模型推理结果
         
@@ -0,0 +1,607 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 记录头：JSON头长度、数据长度
+_RECORD_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor"
+_DEAD_LETTER_FILE = "dead_letter"
+# 投递进度的最短保存间隔（秒）
+_CURSOR_SAVE_INTERVAL = 1.0
+# 保留的失败记录标识数，用于告知依赖这些记录的后续记录
+_FAILED_HISTORY = 10000
+
+# 记录标识：(段序号, 段内偏移)
+RecordId = Tuple[int, int]
+Handler = Callable[[Dict, bytes], Awaitable[None]]
+# 批量处理函数按输入顺序返回每条记录的投递异常，成功时为None
+BatchHandler = Callable[[List[Tuple[Dict, bytes]]], Awaitable[List[Optional[Exception]]]]
+
+class SpoolRecord:
+    """已读出、等待投递的记录，数据在投递时才从段文件读取"""
+    
+    def __init__(
+        self,
+        record_id: RecordId,
+        kind: str,
+        header: Dict,
+        payload_length: int,
+        next_cursor: RecordId
+    ):
+        self.record_id = record_id
+        self.kind = kind
+        self.header = header
+        self.payload_length = payload_length
+        self.next_cursor = next_cursor  # 记录之后的位置，记录完成后投递进度推进到这里
+        self.attempts = 0
+        self.settled = asyncio.Event()  # 投递成功或失败后设置
+
+class Spool:
+    """本地磁盘预写队列
+    
+    待上传的图片、视频片段和待发送的消息先追加写入本地段文件，
+    由后台任务按写入顺序读出，分发到各类型（kind）的投递通道；每个通道以有限的并发
+    投递，某一后端（如MinIO）不可用时不阻塞其他类型的记录。检测流程只等待本地写盘，
+    不受MinIO或RocketMQ的延迟影响。
+    
+    每条记录由JSON头和可选的二进制数据组成，记录的kind决定由哪个处理函数投递。
+    处理函数通过register_handler注册，可替换为本地实现用于测试；
+    通过register_batch_handler注册的类型由通道一次取出多条已就绪的记录一起投递。
+    写入时可以指定依赖的记录（如消息依赖其引用的图片上传），依赖完成后才投递，
+    失败的依赖通过记录头的failed_after告知处理函数。
+    
+    投递失败时按指数退避重试，超过SPOOL_MAX_ATTEMPTS次或没有对应的处理函数时
+    记录被移入死信文件，不再阻塞投递进度。投递进度只推进到按写入顺序全部完成的位置，
+    保存在cursor文件中，重启后从该位置继续投递，投递语义为至少一次。
+    队列总大小超过上限时丢弃最旧的段文件。
+    """
+    
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        segment_bytes: int
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._handlers: Dict[str, Handler] = {}
+        self._batch_handlers: Dict[str, Tuple[BatchHandler, int]] = {}
+        # 所有文件读写在同一线程中顺序执行，无需加锁
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool-io")
+        self._segments: List[int] = []
+        self._write_file = None
+        self._write_size = 0
+        self._cursor: RecordId = (0, 0)
+        self._read_pos: RecordId = (0, 0)
+        self._cursor_saved_at = 0.0
+        self._total_bytes = 0
+        self._dropped = 0
+        self._dead_lettered = 0
+        self._opened = False
+        # 已读出、尚未完成的记录，按写入顺序排列
+        self._window: "OrderedDict[RecordId, SpoolRecord]" = OrderedDict()
+        self._failed: "OrderedDict[RecordId, None]" = OrderedDict()
+        self._lanes: Dict[str, asyncio.Queue] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._drainer: Optional[asyncio.Task] = None
+    
+    def register_handler(self, kind: str, handler: Handler):
+        """注册记录类型的投递处理函数，处理函数抛出异常时记录被重试"""
+        self._handlers[kind] = handler
+    
+    def register_batch_handler(self, kind: str, handler: BatchHandler, batch_size: int):
+        """注册记录类型的批量投递处理函数，每次最多投递batch_size条记录
+        
+        处理函数返回的异常只使对应的记录被重试；处理函数本身抛出异常时整批记录被重试。
+        """
+        self._batch_handlers[kind] = (handler, batch_size)
+    
+    async def put(
+        self,
+        kind: str,
+        header: Dict,
+        payload: bytes = b"",
+        after: Optional[List[RecordId]] = None
+    ) -> RecordId:
+        """追加一条记录，写入本地磁盘后返回记录标识
+        
+        Args:
+            after: 依赖的记录标识，这些记录投递成功或失败后才投递本记录
+        """
+        if after:
+            header = {**header, "_after": [list(record_id) for record_id in after]}
+        loop = asyncio.get_running_loop()
+        record_id = await loop.run_in_executor(self._io, self._append, kind, header, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return record_id
+    
+    def start(self):
+        """启动后台投递任务"""
+        if self._drainer is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._drainer = asyncio.create_task(self._drain())
+    
+    async def stop(self):
+        """停止后台投递任务，未投递完成的记录保留在磁盘上"""
+        tasks = list(self._tasks)
+        if self._drainer is not None:
+            tasks.append(self._drainer)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._drainer = None
+        self._tasks.clear()
+        self._lanes.clear()
+        self._window.clear()
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io, self._close)
+    
+    def get_usage(self) -> Dict:
+        """队列的磁盘占用和投递情况"""
+        return {
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "segments": len(self._segments),
+            "in_flight_records": len(self._window),
+            "dropped_records": self._dropped,
+            "dead_lettered_records": self._dead_lettered
+        }
+    
+    async def _drain(self):
+        """按写入顺序读出记录并分发到投递通道，在途记录数达到上限时等待"""
+        loop = asyncio.get_running_loop()
+        delay = settings.SPOOL_RETRY_INITIAL_DELAY
+        while True:
+            try:
+                if len(self._window) >= settings.SPOOL_MAX_IN_FLIGHT:
+                    self._space.clear()
+                    await self._space.wait()
+                    continue
+                
+                self._wakeup.clear()
+                records = await loop.run_in_executor(
+                    self._io,
+                    self._read_records,
+                    settings.SPOOL_MAX_IN_FLIGHT - len(self._window)
+                )
+                if not records:
+                    await self._wakeup.wait()
+                    continue
+                
+                for record in records:
+                    self._dispatch(record)
+                delay = settings.SPOOL_RETRY_INITIAL_DELAY
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 读取失败（如段文件损坏）不能终止投递任务
+                logger.error(
+                    "Error reading spool, retrying",
+                    extra={"retry_in": delay, "error": str(e)}
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, settings.SPOOL_RETRY_MAX_DELAY)
+    
+    def _dispatch(self, record: SpoolRecord):
+        """将记录交给所属类型的投递通道，有未完成的依赖时先等待依赖"""
+        self._window[record.record_id] = record
+        if record.kind not in self._handlers and record.kind not in self._batch_handlers:
+            self._spawn(self._dead_letter(
+                record, f"No spool handler registered for {record.kind}"
+            ))
+            return
+        
+        dependencies = [
+            self._window[tuple(record_id)]
+            for record_id in record.header.get("_after", [])
+            if tuple(record_id) in self._window
+        ]
+        if dependencies:
+            self._spawn(self._wait_dependencies(record, dependencies))
+        else:
+            self._lane(record.kind).put_nowait(record)
+    
+    async def _wait_dependencies(self, record: SpoolRecord, dependencies: List[SpoolRecord]):
+        for dependency in dependencies:
+            await dependency.settled.wait()
+        self._lane(record.kind).put_nowait(record)
+    
+    def _lane(self, kind: str) -> asyncio.Queue:
+        """记录类型的投递通道，由SPOOL_DELIVERY_CONCURRENCY个投递任务并发处理"""
+        lane = self._lanes.get(kind)
+        if lane is None:
+            lane = self._lanes[kind] = asyncio.Queue()
+            for _ in range(settings.SPOOL_DELIVERY_CONCURRENCY):
+                self._spawn(self._deliver_lane(kind, lane))
+        return lane
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """创建后台任务并保持引用，停止时统一取消"""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    async def _deliver_lane(self, kind: str, lane: asyncio.Queue):
+        """投递通道中的一个投递任务，批量类型一次取出通道中已就绪的多条记录"""
+        batch_size = self._batch_handlers[kind][1] if kind in self._batch_handlers else 1
+        while True:
+            records = [await lane.get()]
+            while len(records) < batch_size and not lane.empty():
+                records.append(lane.get_nowait())
+            
+            try:
+                await self._deliver(kind, records)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(
+                    "Unexpected spool delivery error",
+                    extra={"kind": kind, "records": len(records), "error": str(e)}
+                )
+                for record in records:
+                    if not record.settled.is_set():
+                        self._spawn(self._retry_later(record, e))
+    
+    async def _deliver(self, kind: str, records: List[SpoolRecord]):
+        """投递一批记录，失败的记录安排重试或移入死信文件"""
+        loop = asyncio.get_running_loop()
+        ready = []
+        for record in records:
+            try:
+                payload = await loop.run_in_executor(self._io, self._read_payload, record)
+            except FileNotFoundError:
+                # 等待投递期间所在的段因队列已满被丢弃，已计入丢弃的记录数
+                self._settle(record, failed=True)
+                continue
+            ready.append((record, self._handler_header(record), payload))
+        if not ready:
+            return
+        
+        try:
+            if kind in self._batch_handlers:
+                errors = await self._batch_handlers[kind][0](
+                    [(header, payload) for _, header, payload in ready]
+                )
+            else:
+                _, header, payload = ready[0]
+                await self._handlers[kind](header, payload)
+                errors = [None]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            errors = [e] * len(ready)
+        
+        for (record, _, _), error in zip(ready, errors):
+            if error is None:
+                self._settle(record, failed=False)
+            else:
+                self._spawn(self._retry_later(record, error))
+    
+    def _handler_header(self, record: SpoolRecord) -> Dict:
+        """传给处理函数的记录头，失败的依赖记录在failed_after中"""
+        header = {
+            key: value for key, value in record.header.items() if key != "_after"
+        }
+        failed_after = [
+            record_id for record_id in record.header.get("_after", [])
+            if tuple(record_id) in self._failed
+        ]
+        if failed_after:
+            header["failed_after"] = failed_after
+        return header
+    
+    async def _retry_later(self, record: SpoolRecord, error: Exception):
+        """退避后将记录放回投递通道，超过最大尝试次数时移入死信文件"""
+        record.attempts += 1
+        if record.attempts >= settings.SPOOL_MAX_ATTEMPTS:
+            await self._dead_letter(record, str(error))
+            return
+        
+        delay = min(
+            settings.SPOOL_RETRY_INITIAL_DELAY * 2 ** (record.attempts - 1),
+            settings.SPOOL_RETRY_MAX_DELAY
+        )
+        logger.warning(
+            "Spool delivery failed, retrying",
+            extra={
+                "kind": record.kind,
+                "attempts": record.attempts,
+                "retry_in": delay,
+                "error": str(error)
+            }
+        )
+        await asyncio.sleep(delay)
+        self._lane(record.kind).put_nowait(record)
+    
+    async def _dead_letter(self, record: SpoolRecord, error: str):
+        """将无法投递的记录移入死信文件"""
+        logger.error(
+            "Spool record moved to dead letter",
+            extra={
+                "kind": record.kind,
+                "record": record.record_id,
+                "attempts": record.attempts,
+                "error": error
+            }
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._io, self._write_dead_letter, record, error)
+        except Exception as e:
+            logger.error(
+                "Error writing spool dead letter",
+                extra={"kind": record.kind, "record": record.record_id, "error": str(e)}
+            )
+        self._dead_lettered += 1
+        self._settle(record, failed=True)
+    
+    def _settle(self, record: SpoolRecord, failed: bool):
+        """标记记录完成，投递进度推进到按写入顺序全部完成的位置"""
+        if failed:
+            self._failed[record.record_id] = None
+            if len(self._failed) > _FAILED_HISTORY:
+                self._failed.popitem(last=False)
+        record.settled.set()
+        
+        cursor = None
+        while self._window:
+            first = next(iter(self._window.values()))
+            if not first.settled.is_set():
+                break
+            self._window.popitem(last=False)
+            cursor = first.next_cursor
+        
+        if cursor is not None:
+            # 单线程的文件线程按提交顺序保存进度
+            self._io.submit(self._commit, cursor)
+            self._space.set()
+    
+    def _open(self):
+        """加载已有的段文件和投递进度，新的记录写入新段"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        self._total_bytes = sum(
+            os.path.getsize(self._segment_path(seq)) for seq in self._segments
+        )
+        
+        try:
+            with open(os.path.join(self.directory, _CURSOR_FILE)) as f:
+                seq, offset = f.read().split()
+                self._cursor = (int(seq), int(offset))
+        except (OSError, ValueError):
+            self._cursor = (self._segments[0], 0) if self._segments else (0, 0)
+        self._read_pos = self._cursor
+        
+        self._roll_segment()
+        self._opened = True
+    
+    def _close(self):
+        if self._opened:
+            self._save_cursor()
+        if self._write_file is not None:
+            self._write_file.close()
+            self._write_file = None
+        self._opened = False
+    
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}{_SEGMENT_SUFFIX}")
+    
+    def _roll_segment(self):
+        """关闭当前写入的段，开始新的段文件"""
+        if self._write_file is not None:
+            self._write_file.close()
+        seq = self._segments[-1] + 1 if self._segments else 1
+        self._segments.append(seq)
+        self._write_file = open(self._segment_path(seq), "ab")
+        self._write_size = 0
+    
+    def _append(self, kind: str, header: Dict, payload: bytes) -> RecordId:
+        if not self._opened:
+            self._open()
+        
+        record_id = (self._segments[-1], self._write_size)
+        header_bytes = json.dumps({"kind": kind, **header}).encode("utf-8")
+        record = _RECORD_HEADER.pack(len(header_bytes), len(payload)) + header_bytes
+        self._write_file.write(record)
+        self._write_file.write(payload)
+        self._write_file.flush()
+        size = len(record) + len(payload)
+        self._write_size += size
+        self._total_bytes += size
+        
+        if self._write_size >= self.segment_bytes:
+            self._roll_segment()
+        self._enforce_limit()
+        return record_id
+    
+    def _enforce_limit(self):
+        """超过大小上限时丢弃最旧的段，至少保留正在写入的段"""
+        while self._total_bytes > self.max_bytes and len(self._segments) > 1:
+            seq = self._segments.pop(0)
+            path = self._segment_path(seq)
+            # 只统计尚未投递的记录
+            if self._cursor[0] == seq:
+                dropped = self._count_records(path, self._cursor[1])
+            else:
+                dropped = self._count_records(path, 0) if self._cursor[0] < seq else 0
+            self._total_bytes -= os.path.getsize(path)
+            os.remove(path)
+            if self._cursor[0] <= seq:
+                self._cursor = (self._segments[0], 0)
+            if self._read_pos[0] <= seq:
+                self._read_pos = (self._segments[0], 0)
+            
+            if dropped:
+                self._dropped += dropped
+                logger.warning(
+                    "Spool is full, dropped oldest records",
+                    extra={"segment": seq, "records": dropped, "max_bytes": self.max_bytes}
+                )
+    
+    def _count_records(self, path: str, offset: int) -> int:
+        """统计段文件中从offset开始的记录数"""
+        count = 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while True:
+                prefix = f.read(_RECORD_HEADER.size)
+                if len(prefix) < _RECORD_HEADER.size:
+                    return count
+                header_length, payload_length = _RECORD_HEADER.unpack(prefix)
+                f.seek(header_length + payload_length, os.SEEK_CUR)
+                count += 1
+    
+    def _read_records(self, limit: int) -> List[SpoolRecord]:
+        """读取最多limit条记录的头，已写入的记录一次读出，由投递通道合并投递"""
+        records = []
+        while len(records) < limit:
+            try:
+                record = self._read_next()
+            except Exception:
+                # 已读出的记录先投递，读取错误在下次读取时再抛出
+                if records:
+                    break
+                raise
+            if record is None:
+                break
+            records.append(record)
+        return records
+    
+    def _read_next(self) -> Optional[SpoolRecord]:
+        """读取下一条记录的头，没有时返回None
+        
+        段末尾不完整的记录（进程退出时写入中断）被跳过；记录头无法解析时记录被丢弃，
+        不阻塞后续记录。已读过的段在投递进度越过后才删除。
+        """
+        if not self._opened:
+            self._open()
+        
+        while True:
+            seq, offset = self._read_pos
+            if seq < self._segments[0]:
+                # 所在的段已被丢弃
+                seq, offset = self._segments[0], 0
+                self._read_pos = (seq, offset)
+            
+            try:
+                with open(self._segment_path(seq), "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    f.seek(offset)
+                    prefix = f.read(_RECORD_HEADER.size)
+                    if len(prefix) == _RECORD_HEADER.size:
+                        header_length, payload_length = _RECORD_HEADER.unpack(prefix)
+                        header_bytes = f.read(header_length)
+                        next_offset = offset + _RECORD_HEADER.size + header_length + payload_length
+                        if len(header_bytes) == header_length and next_offset <= size:
+                            self._read_pos = (seq, next_offset)
+                            try:
+                                header = json.loads(header_bytes)
+                                kind = header.pop("kind")
+                            except (ValueError, KeyError, AttributeError) as e:
+                                self._dropped += 1
+                                logger.error(
+                                    "Corrupt spool record, skipping",
+                                    extra={"segment": seq, "offset": offset, "error": str(e)}
+                                )
+                                continue
+                            return SpoolRecord(
+                                (seq, offset), kind, header, payload_length, (seq, next_offset)
+                            )
+            except FileNotFoundError:
+                logger.error("Spool segment is missing, skipping", extra={"segment": seq})
+            
+            if seq == self._segments[-1]:
+                return None
+            # 当前段已读完，继续读取下一个段
+            self._read_pos = (next(s for s in self._segments if s > seq), 0)
+    
+    def _read_payload(self, record: SpoolRecord) -> bytes:
+        """读取记录的二进制数据"""
+        seq, offset = record.record_id
+        header_length = record.next_cursor[1] - offset - _RECORD_HEADER.size - record.payload_length
+        with open(self._segment_path(seq), "rb") as f:
+            f.seek(offset + _RECORD_HEADER.size + header_length)
+            payload = f.read(record.payload_length)
+        if len(payload) != record.payload_length:
+            raise ValueError(f"Spool record {record.record_id} is truncated")
+        return payload
+    
+    def _write_dead_letter(self, record: SpoolRecord, error: str):
+        """以段文件的记录格式追加到死信文件，超过段大小时轮换为dead_letter.1"""
+        try:
+            payload = self._read_payload(record)
+        except (OSError, ValueError):
+            payload = b""
+        
+        header_bytes = json.dumps({
+            "kind": record.kind,
+            **record.header,
+            "error": error,
+            "attempts": record.attempts,
+            "failed_at": time.time()
+        }).encode("utf-8")
+        path = os.path.join(self.directory, _DEAD_LETTER_FILE)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            os.replace(path, path + ".1")
+        with open(path, "ab") as f:
+            f.write(_RECORD_HEADER.pack(len(header_bytes), len(payload)) + header_bytes)
+            f.write(payload)
+    
+    def _commit(self, cursor: RecordId):
+        """更新投递进度，删除投递进度之前的段，按间隔保存到磁盘"""
+        try:
+            if cursor[0] < self._segments[0]:
+                # 投递期间所在的段已被丢弃
+                cursor = (self._segments[0], 0)
+            self._cursor = cursor
+            
+            while self._segments[0] < cursor[0]:
+                seq = self._segments.pop(0)
+                path = self._segment_path(seq)
+                if os.path.exists(path):
+                    self._total_bytes -= os.path.getsize(path)
+                    os.remove(path)
+            
+            if time.monotonic() - self._cursor_saved_at >= _CURSOR_SAVE_INTERVAL:
+                self._save_cursor()
+        except OSError as e:
+            logger.error("Error saving spool cursor", extra={"error": str(e)})
+    
+    def _save_cursor(self):
+        """保存投递进度，进程异常退出时最近未保存的记录会被重新投递"""
+        cursor = self._cursor
+        self._cursor_saved_at = time.monotonic()
+        path = os.path.join(self.directory, _CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{cursor[0]} {cursor[1]}")
+        os.replace(path + ".tmp", path)
+
+# 全局预警数据预写队列实例，多进程模式下各工作进程使用独立的目录和容量
+alert_spool = Spool(
+    os.path.join(settings.SPOOL_DIR, f"worker-{settings.GRPC_WORKER_INDEX}")
+    if settings.GRPC_WORKERS > 1 else settings.SPOOL_DIR,
+    max_bytes=settings.SPOOL_MAX_MB * 1024 * 1024 // settings.GRPC_WORKERS,
+    segment_bytes=settings.SPOOL_SEGMENT_MB * 1024 * 1024
+)
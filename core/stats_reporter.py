@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from config.config import settings
+from core.frame_buffer import frame_buffer_manager
+from core.message_queue import message_queue
+from core.spool import alert_spool
+from core.video_processor import video_processor
+
+logger = logging.getLogger(__name__)
+
+class StatsReporter:
+    """运行状态的定期日志
+    
+    按STATS_LOG_INTERVAL输出本工作进程的视频流处理统计（解码和抽帧跳过比例、帧延迟、
+    运动过滤及自适应抽帧）、帧缓冲区内存占用、预写队列和消息队列状态，
+    多进程模式下各工作进程分别输出。
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+    
+    def get_stats(self) -> Dict:
+        """当前的运行状态"""
+        return {
+            "worker_index": settings.GRPC_WORKER_INDEX,
+            "streams": video_processor.get_stream_stats(),
+            "frame_buffer": frame_buffer_manager.get_usage(),
+            "spool": alert_spool.get_usage(),
+            "message_queue": message_queue.get_stats()
+        }
+    
+    def start(self):
+        """启动定期输出，间隔为0时不启用"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                logger.info("Vision AI Engine stats", extra=self.get_stats())
+            except Exception as e:
+                logger.error("Error collecting stats", extra={"error": str(e)})
+
+# 全局运行状态日志实例
+stats_reporter = StatsReporter(settings.STATS_LOG_INTERVAL)
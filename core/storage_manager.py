@@ -1,16 +1,47 @@
 from datetime import datetime
+import asyncio
+import io
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import urllib3
 from minio import Minio
 from config.config import settings
 
+logger = logging.getLogger(__name__)
+
 class StorageManager:
     def __init__(self):
+        # 上传线程共享的HTTP连接池
+        http_client = urllib3.PoolManager(
+            maxsize=settings.MINIO_MAX_CONNECTIONS,
+            timeout=urllib3.Timeout(
+                connect=settings.MINIO_CONNECT_TIMEOUT,
+                read=settings.MINIO_READ_TIMEOUT
+            ),
+            retries=urllib3.Retry(
+                total=3,
+                backoff_factor=0.2,
+                status_forcelist=[500, 502, 503, 504]
+            )
+        )
         self.client = Minio(
             settings.MINIO_ENDPOINT,
             access_key=settings.MINIO_ACCESS_KEY,
             secret_key=settings.MINIO_SECRET_KEY,
-            secure=settings.MINIO_SECURE
+            secure=settings.MINIO_SECURE,
+            # 指定region后生成预签名URL无需访问MinIO
+            region=settings.MINIO_REGION,
+            http_client=http_client
+        )
+        
+        # 有界的上传线程池，上传不阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.MINIO_UPLOAD_WORKERS,
+            thread_name_prefix="minio-upload"
         )
+        self._upload_slots: Optional[asyncio.Semaphore] = None
         
         # 确保bucket存在
         if not self.client.bucket_exists(settings.MINIO_BUCKET):
@@ -39,35 +70,56 @@ class StorageManager:
         now = datetime.now()
         return f"{alert_type}/{now.year}/{now.month:02d}/{now.day:02d}/{now.timestamp()}"
     
-    async def save_image(self, image_data: bytes, alert_type: str = "image") -> str:
-        """保存图片数据"""
-        object_path = f"{self._generate_object_path(alert_type)}.jpg"
-        
-        # 上传图片
-        self.client.put_object(
-            bucket_name=settings.MINIO_BUCKET,
-            object_name=object_path,
-            data=image_data,
-            length=len(image_data),
-            content_type="image/jpeg"
-        )
+    def new_object_path(self, alert_type: str, extension: str) -> str:
+        """生成新对象的存储路径，用于先确定路径、稍后上传的场景"""
+        return f"{self._generate_object_path(alert_type)}.{extension}"
+    
+    async def upload(self, object_path: str, data: bytes, content_type: str):
+        """上传对象到指定路径并等待上传完成，上传失败时抛出异常
         
-        return object_path
+        上传在后台线程池中进行，超过MINIO_PART_SIZE的对象以分片方式上传；
+        调用方取消等待时上传继续进行。
+        """
+        upload = await self._submit_upload(object_path, data, content_type)
+        await asyncio.shield(upload)
     
-    async def save_video(self, video_data: bytes, alert_type: str = "video") -> str:
-        """保存视频数据"""
-        object_path = f"{self._generate_object_path(alert_type)}.mp4"
+    async def _submit_upload(self, object_path: str, data: bytes, content_type: str) -> asyncio.Future:
+        """提交后台上传，待上传数达到上限时等待空位"""
+        if self._upload_slots is None:
+            self._upload_slots = asyncio.Semaphore(settings.MINIO_UPLOAD_QUEUE_SIZE)
+        await self._upload_slots.acquire()
         
-        # 上传视频
+        loop = asyncio.get_running_loop()
+        upload = loop.run_in_executor(
+            self._executor,
+            self._put_object,
+            object_path,
+            data,
+            content_type
+        )
+        upload.add_done_callback(
+            lambda future: self._on_upload_done(object_path, future)
+        )
+        return upload
+    
+    def _on_upload_done(self, object_path: str, future: asyncio.Future):
+        self._upload_slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                "Error uploading object to MinIO",
+                extra={"object_path": object_path, "error": str(future.exception())}
+            )
+    
+    def _put_object(self, object_path: str, data: bytes, content_type: str):
+        """上传对象，在上传线程中执行"""
         self.client.put_object(
             bucket_name=settings.MINIO_BUCKET,
             object_name=object_path,
-            data=video_data,
-            length=len(video_data),
-            content_type="video/mp4"
+            data=io.BytesIO(data),
+            length=len(data),
+            content_type=content_type,
+            part_size=settings.MINIO_PART_SIZE
         )
-        
-        return object_path
     
     def get_object_url(self, object_path: str) -> str:
         """获取对象的访问URL"""
@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError as FutureCancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config.config import settings
+from core.packet_buffer import PacketRingBuffer, av
+
+class DecodedFrame(NamedTuple):
+    """解码后的视频帧"""
+    image: np.ndarray
+    timestamp: float    # 流内时间戳（秒）
+    captured_at: float  # 解码完成时的系统时间（秒）
+
+class StreamDecoder:
+    """视频流解码器
+    
+    每路视频流使用独立的解码线程执行阻塞的 cv2.VideoCapture.grab()/retrieve()，
+    解码后的帧通过有界队列交给事件循环侧消费。队列满时解码线程阻塞等待，
+    单路慢速或卡顿的摄像头不会影响其他视频流和gRPC请求的处理。
+    设置frame_sink时解码线程在入队前以 (帧, 流内时间戳) 将帧写入预警帧缓冲区
+    （原地拷贝或压缩编码），事件循环侧不做逐帧的大块内存拷贝。
+    
+    drop_stale为True时（实时视频流）解码线程不等待队列空位，队列满时丢弃最旧的帧，
+    解码不会因处理变慢而积压延迟。丢弃只发生在交给事件循环的队列上：frame_sink在入队前调用，
+    被丢弃的帧仍已写入帧缓冲区。
+    
+    sample_interval大于0时只输出间隔不小于该值的抽样帧：其余帧只grab()推进，
+    不做retrieve()的像素格式转换和拷贝。OpenCV的FFmpeg后端在grab()中已完成解码，
+    抽样不减少解码量，只节省转换；OpenCV无法区分关键帧，keyframes_only按抽样解码处理。
+    统计中converted为转换输出的帧数，skipped为已解码但未转换的帧数。
+    """
+    
+    # 解码线程等待队列空位时检查停止标志的间隔（秒）
+    _PUT_TIMEOUT = 0.5
+    
+    def __init__(
+        self,
+        stream_url: str,
+        queue_size: int = None,
+        frame_sink: Callable[[np.ndarray, float], None] = None,
+        drop_stale: bool = False
+    ):
+        self.stream_url = stream_url
+        self.frame_sink = frame_sink
+        self.drop_stale = drop_stale
+        self.dropped = 0
+        self.fps = 0
+        self.width = 0
+        self.height = 0
+        # 最近读取到的流内时间戳及读取时的系统时间，用于多路视频流之间的时间对齐
+        self.position = 0.0
+        self.position_at = 0.0
+        self._queue_size = queue_size or settings.DECODER_QUEUE_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cap = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        # 抽样解码参数，由处理协程按订阅更新，解码线程每帧读取
+        self.sample_interval = 0.0
+        self.keyframes_only = False
+        self._last_sample: Optional[float] = None
+        self.converted = 0
+        self.skipped = 0
+    
+    async def start(self):
+        """打开视频流并启动解码线程"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        
+        # 打开网络流可能耗时数秒，同样放到线程中执行
+        await self._loop.run_in_executor(None, self._open)
+        
+        self._thread = threading.Thread(
+            target=self._decode_loop,
+            name=f"decoder-{self.stream_url}",
+            daemon=True
+        )
+        self._thread.start()
+    
+    def stop(self):
+        """通知解码线程退出，视频流由解码线程自行关闭"""
+        self._stop_event.set()
+    
+    async def read(self) -> Optional[DecodedFrame]:
+        """读取下一帧，视频流结束时返回None"""
+        return await self._queue.get()
+    
+    def drain(self) -> List[Optional[DecodedFrame]]:
+        """取出队列中已解码的全部帧，不等待"""
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+    
+    def get_stats(self) -> Dict:
+        """解码统计"""
+        total = self.converted + self.skipped
+        return {
+            "sample_interval": self.sample_interval,
+            "keyframes_only": self.keyframes_only,
+            "converted": self.converted,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / total if total else 0.0,
+            "dropped": self.dropped
+        }
+    
+    def _advance(self, timestamp: float):
+        """记录读取位置"""
+        self.position = timestamp
+        self.position_at = time.time()
+    
+    def _sample_due(self, timestamp: float) -> bool:
+        """判断时间戳为timestamp的帧是否需要解码输出"""
+        if (
+            self.sample_interval > 0
+            and self._last_sample is not None
+            and 0 <= timestamp - self._last_sample < self.sample_interval
+        ):
+            self.skipped += 1
+            return False
+        
+        self._last_sample = timestamp
+        self.converted += 1
+        return True
+    
+    def _open(self):
+        """打开视频流并读取帧率，失败时抛出ValueError"""
+        self._cap = cv2.VideoCapture(self.stream_url)
+        if not self._cap.isOpened():
+            self._cap.release()
+            raise ValueError(f"Cannot open video stream: {self.stream_url}")
+        
+        self.fps = int(self._cap.get(cv2.CAP_PROP_FPS))
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    def _frames(self) -> Iterator[Tuple[np.ndarray, float]]:
+        """逐帧解码，返回 (图像, 流内时间戳)
+        
+        未抽中的帧不返回，每次grab()前检查停止标志，抽帧间隔较长时也能及时退出。
+        """
+        while not self._stop_event.is_set():
+            if not self._cap.grab():
+                return
+            timestamp = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            self._advance(timestamp)
+            if not self._sample_due(timestamp):
+                continue
+            
+            ret, frame = self._cap.retrieve()
+            if not ret:
+                return
+            yield frame, timestamp
+    
+    def _close(self):
+        """关闭视频流"""
+        self._cap.release()
+    
+    def _decode_loop(self):
+        """解码线程主循环"""
+        try:
+            for frame, timestamp in self._frames():
+                if self._stop_event.is_set():
+                    return
+                
+                captured_at = time.time()
+                frame_sink = self.frame_sink
+                if frame_sink:
+                    frame_sink(frame, timestamp)
+                if not self._put(DecodedFrame(frame, timestamp, captured_at)):
+                    return
+        finally:
+            self._close()
+        
+        # 通知消费侧视频流已结束
+        self._put(None)
+    
+    def _put(self, item: Optional[DecodedFrame]) -> bool:
+        """将帧放入事件循环侧的队列，队列满时阻塞，返回是否成功"""
+        if self.drop_stale:
+            try:
+                self._loop.call_soon_threadsafe(self._put_latest, item)
+            except RuntimeError:
+                # 事件循环已关闭
+                return False
+            return True
+        
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._queue.put(item), self._loop
+            )
+        except RuntimeError:
+            # 事件循环已关闭
+            return False
+        
+        while True:
+            try:
+                future.result(timeout=self._PUT_TIMEOUT)
+                return True
+            except FutureCancelledError:
+                # 事件循环关闭时未完成的写入被取消
+                return False
+            except FutureTimeoutError:
+                if self._stop_event.is_set():
+                    future.cancel()
+                    return False
+
+    def _put_latest(self, item: Optional[DecodedFrame]):
+        """在事件循环中写入帧，队列满时丢弃最旧的帧"""
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+class PacketStreamDecoder(StreamDecoder):
+    """基于PyAV的视频流解码器
+    
+    解复用得到的压缩数据包在解码前写入PacketRingBuffer，
+    预警视频片段可直接由数据包封装生成，无需重新编码。
+    
+    抽样解码时未抽中的帧不转换为ndarray；抽样间隔不少于两帧时解码器跳过不被参考的帧
+    （skip_frame=NONREF，通常为B帧），实际抽样帧可能顺延到下一个参考帧；
+    keyframes_only时解码器丢弃非关键帧（NONKEY），不再解码参考帧链。
+    数据包仍全部写入缓冲区，跳过解码的帧不计入统计。
+    decode_frames为False时只解复用和缓冲数据包，不解码也不输出帧（双码流接入时的主码流）。
+    
+    输入容器由packet_buffer持有，使用方不再需要缓冲区时调用packet_buffer.close()。
+    """
+    
+    def __init__(
+        self,
+        stream_url: str,
+        queue_size: int = None,
+        frame_sink: Callable[[np.ndarray, float], None] = None,
+        drop_stale: bool = False,
+        decode_frames: bool = True
+    ):
+        super().__init__(stream_url, queue_size, frame_sink, drop_stale)
+        self.decode_frames = decode_frames
+        self.packet_buffer = PacketRingBuffer(
+            settings.VIDEO_CHUNK_DURATION + settings.ALERT_POST_ROLL_SECONDS
+        )
+        self._container = None
+        self._stream = None
+    
+    def _open(self):
+        options = {}
+        if self.stream_url.startswith("rtsp://"):
+            options["rtsp_transport"] = "tcp"
+        
+        try:
+            self._container = av.open(
+                self.stream_url,
+                options=options,
+                timeout=settings.DECODER_OPEN_TIMEOUT
+            )
+        except av.error.FFmpegError as e:
+            raise ValueError(f"Cannot open video stream: {self.stream_url}") from e
+        
+        if not self._container.streams.video:
+            self._container.close()
+            raise ValueError(f"No video track in stream: {self.stream_url}")
+        
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = "AUTO"
+        self.fps = int(self._stream.average_rate or 0)
+        self.width = self._stream.codec_context.width
+        self.height = self._stream.codec_context.height
+        # 输入容器交给缓冲区持有，预警视频片段封装完成前不关闭
+        self.packet_buffer.set_stream(self._stream, self._container)
+    
+    def _frames(self) -> Iterator[Tuple[np.ndarray, float]]:
+        codec_context = self._stream.codec_context
+        for packet in self._container.demux(self._stream):
+            # 跳过解码或不输出帧时解码循环无法检查停止标志，每个数据包都检查
+            if self._stop_event.is_set():
+                return
+            self.packet_buffer.append(packet)
+            if packet.pts is not None:
+                self._advance(float(packet.pts * packet.time_base))
+            if not self.decode_frames:
+                continue
+            
+            skip_frame = self._skip_frame()
+            if str(codec_context.skip_frame) != skip_frame:
+                codec_context.skip_frame = skip_frame
+            
+            for frame in packet.decode():
+                timestamp = float(frame.time) if frame.time is not None else 0.0
+                if not self._sample_due(timestamp):
+                    continue
+                yield frame.to_ndarray(format="bgr24"), timestamp
+    
+    def _skip_frame(self) -> str:
+        """按抽样参数选择解码器跳过的帧类型"""
+        if self.keyframes_only:
+            return "NONKEY"
+        if self.fps and self.sample_interval * self.fps >= 2:
+            return "NONREF"
+        return "DEFAULT"
+    
+    def get_stats(self) -> Dict:
+        return {**super().get_stats(), "skip_frame": self._skip_frame()}
+    
+    def _close(self):
+        # 容器在缓冲区释放且片段封装完成后由缓冲区关闭
+        self.packet_buffer.detach()
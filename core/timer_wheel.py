@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+from config.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TimerHandle:
+    """时间轮上的定时任务"""
+    
+    def __init__(self, deadline: float, callback: Callable[[], None]):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+    
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    """哈希时间轮
+    
+    定时任务按到期时间（Unix时间戳）放入对应的槽位，一个后台任务每个tick推进一个槽位，
+    只检查该槽位上的任务，超过一圈的任务留在槽位中等待后续圈次。
+    大量视频流按调度休眠时共用一个后台任务唤醒，不需要为每路视频流保留计时协程。
+    """
+    
+    def __init__(self, tick: float = None, slots: int = None):
+        self.tick = tick or settings.TIMER_WHEEL_TICK
+        self.slots: List[List[TimerHandle]] = [[] for _ in range(slots or settings.TIMER_WHEEL_SLOTS)]
+        self._count = 0
+        self._current: Optional[int] = None  # 下一个待处理的tick序号
+        self._task: Optional[asyncio.Task] = None
+    
+    def schedule(self, deadline: float, callback: Callable[[], None]) -> TimerHandle:
+        """在deadline时刻调用callback，需要在事件循环中调用"""
+        handle = TimerHandle(deadline, callback)
+        # 已过期的任务放到下一个待处理的槽位
+        current = self._current if self._current is not None else int(time.time() // self.tick)
+        tick = max(int(deadline // self.tick), current)
+        self.slots[tick % len(self.slots)].append(handle)
+        self._count += 1
+        
+        if self._task is None or self._task.done():
+            self._current = None
+            self._task = asyncio.create_task(self._run())
+        return handle
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    async def _run(self):
+        """推进时间轮，没有定时任务时退出"""
+        self._current = int(time.time() // self.tick)
+        while self._count:
+            now = time.time()
+            # 槽位对应的时间段结束后处理该槽位；事件循环繁忙时一次推进多个槽位
+            while (self._current + 1) * self.tick <= now:
+                self._expire(self._current % len(self.slots), now)
+                self._current += 1
+            await asyncio.sleep((self._current + 1) * self.tick - time.time())
+    
+    def _expire(self, index: int, now: float):
+        """执行槽位上到期的任务"""
+        pending = []
+        for handle in self.slots[index]:
+            if handle.cancelled:
+                self._count -= 1
+            elif handle.deadline <= now:
+                self._count -= 1
+                try:
+                    handle.callback()
+                except Exception as e:
+                    logger.error(
+                        "Timer callback failed",
+                        extra={"error": str(e)}
+                    )
+            else:
+                pending.append(handle)
+        self.slots[index] = pending
+
+# 全局时间轮实例
+timer_wheel = TimerWheel()
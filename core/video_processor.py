@@ -1,19 +1,176 @@
 import cv2
 import asyncio
+import logging
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Optional
-import io
+from typing import Dict, List, Optional, Tuple
+import time
 
 from core.skill_manager import skill_manager
 from core.storage_manager import storage_manager
 from core.message_queue import message_queue
+from core.stream_decoder import StreamDecoder, PacketStreamDecoder
+from core.frame_buffer import FrameSnapshot, frame_buffer_manager
+from core.clip_writer import PendingClip, clip_writer, encode_frames
+from core.spool import alert_spool
+from core.motion_gate import MotionGate, motion_signature
+from core.adaptive_sampler import AdaptiveSampler, inference_budget
+from core.pacing import FrameLagMonitor, is_live_source
+from core.schedule import compile_schedule
+from core.timer_wheel import TimerHandle, timer_wheel
 from config.config import settings
 
+logger = logging.getLogger(__name__)
+
+# 解码方式，按解码的完整程度从高到低排列
+DECODE_MODES = ("full", "sampled", "keyframe")
+
+class Subscription:
+    """视频流上的一个技能订阅"""
+    
+    def __init__(
+        self,
+        stream_id: str,
+        stream_url: str,
+        skill_name: str,
+        alert_level: str,
+        frame_interval: float,
+        roi: Optional[List[str]],
+        schedule: Optional[str],
+        motion_threshold: float = 0,
+        sampler: Optional[AdaptiveSampler] = None,
+        decode_mode: str = "full"
+    ):
+        self.stream_id = stream_id
+        self.stream_url = stream_url
+        self.skill_name = skill_name
+        self.alert_level = alert_level
+        self.frame_interval = frame_interval
+        self.roi = roi
+        # 调度在订阅时编译，格式错误时抛出ValueError
+        self.schedule = compile_schedule(schedule)
+        self._active = True
+        self._active_until = 0.0
+        self.last_process_time = 0
+        # 运动过滤，画面变化低于阈值时跳过推理
+        self.motion_gate = MotionGate(motion_threshold) if motion_threshold > 0 else None
+        # 最近一次推理结果，跳过推理时沿用
+        self.last_result: Optional[Dict] = None
+        # 自适应抽帧，启用时frame_interval随检测活跃度变化
+        self.sampler = sampler
+        if sampler:
+            self.frame_interval = sampler.interval
+        self.decode_mode = decode_mode
+    
+    def is_active(self, now: float) -> bool:
+        """当前是否在调度窗口内，状态缓存到下次变化的时间"""
+        if self.schedule is None:
+            return True
+        if now >= self._active_until:
+            moment = datetime.fromtimestamp(now)
+            self._active = self.schedule.is_active(moment)
+            change = self.schedule.next_change(moment)
+            self._active_until = change.timestamp() if change else float("inf")
+        return self._active
+    
+    def next_start(self, now: float) -> float:
+        """下次进入调度窗口的时间（Unix时间戳），当前已在窗口内时返回now"""
+        if self.schedule is None:
+            return now
+        return self.schedule.next_start(datetime.fromtimestamp(now)).timestamp()
+    
+    def reset(self):
+        """视频流重新打开后流内时间戳从头开始，清除按时间戳记录的状态"""
+        self.last_process_time = 0
+        if self.motion_gate:
+            self.motion_gate.reference = None
+    
+    def record_result(self, result: Optional[Dict]):
+        """记录本次抽帧的结果，并按检测活跃度调整抽帧间隔"""
+        self.last_result = result
+        if self.sampler:
+            active = bool(result and result.get("detections"))
+            self.frame_interval = self.sampler.update(active)
+
+class StreamContext:
+    """单路视频流的解码及分发状态
+    
+    同一stream_url只打开一个解码器，每个抽样帧分发给所有订阅的技能。
+    指定detection_url（摄像头子码流）时为双码流接入：抽帧和推理使用子码流，
+    stream_url（主码流）只用于预警视频片段和预警图片。
+    """
+    
+    def __init__(self, stream_url: str, detection_url: Optional[str] = None):
+        self.stream_url = stream_url
+        self.detection_url = detection_url
+        self.task: Optional[asyncio.Task] = None
+        # 处理任务打开视频流的结果，打开失败时为异常，调度窗口外不打开时为None
+        self.opened: Optional[asyncio.Future] = None
+        self.fps = 0
+        self.subscriptions: Dict[str, Subscription] = {}
+        # 抽帧推理使用的解码器
+        self.decoder: Optional[StreamDecoder] = None
+        # 双码流接入时的主码流解码器，以及reencode模式下主码流最新解码的帧
+        self.evidence: Optional[StreamDecoder] = None
+        self.evidence_frame: Optional[np.ndarray] = None
+        self.lag = FrameLagMonitor()
+        # 所有订阅都在调度窗口外时处理任务退出，由时间轮唤醒
+        self.wake_handle: Optional[TimerHandle] = None
+    
+    def is_active(self, now: float) -> bool:
+        """是否有订阅在调度窗口内"""
+        return any(s.is_active(now) for s in self.subscriptions.values())
+    
+    def next_start(self, now: float) -> float:
+        """最早的订阅进入调度窗口的时间"""
+        return min(s.next_start(now) for s in self.subscriptions.values())
+    
+    def evidence_time(self, timestamp: float, captured_at: float) -> float:
+        """检测帧对应的主码流时间戳
+        
+        单码流时即帧的时间戳；双码流时两路视频流的时间戳相互独立，按读取时的系统时间对齐。
+        """
+        if self.evidence is None:
+            return timestamp
+        return self.evidence.position + captured_at - self.evidence.position_at
+    
+    def update_decoder(self):
+        """按订阅设置解码器的抽样参数
+        
+        多个订阅时取解码最完整的方式，抽样间隔取各订阅抽帧间隔的最小值。
+        """
+        subscriptions = list(self.subscriptions.values())
+        mode = min(
+            (s.decode_mode for s in subscriptions),
+            key=DECODE_MODES.index,
+            default="full"
+        )
+        if mode == "full":
+            self.decoder.sample_interval = 0.0
+        else:
+            self.decoder.sample_interval = min(s.frame_interval for s in subscriptions)
+        self.decoder.keyframes_only = mode == "keyframe"
+
 class VideoProcessor:
     def __init__(self):
-        self.active_streams = {}
-        self.frame_buffer = {}  # 用于存储视频帧的缓冲区
+        # 技能订阅，键为stream_id（stream_url + 技能名称）
+        self.active_streams: Dict[str, Subscription] = {}
+        # 视频流解码上下文，键为stream_url
+        self.streams: Dict[str, StreamContext] = {}
+        # 视频帧缓冲区由frame_buffer_manager统一管理，受节点内存预算约束
+        self.frame_buffer = frame_buffer_manager
+        # packet直通模式下各视频流的压缩数据包缓冲区
+        self.packet_buffers = {}
+        # 各视频流正在采集post-roll的预警视频片段
+        self.pending_clips = {}
+        
+        # 预警图片、视频片段和消息经本地预写队列投递到MinIO和RocketMQ
+        alert_spool.register_handler("upload", self._deliver_upload)
+        alert_spool.register_batch_handler(
+            "message",
+            self._deliver_messages,
+            settings.ROCKETMQ_BATCH_SIZE
+        )
     
     async def process_stream(
         self,
@@ -22,124 +179,402 @@ class VideoProcessor:
         alert_level: str,
         frame_interval: int = None,
         roi: List[str] = None,
-        schedule: str = None
+        schedule: str = None,
+        motion_threshold: Optional[float] = None,
+        min_frame_interval: Optional[float] = None,
+        max_frame_interval: Optional[float] = None,
+        decode_mode: Optional[str] = None,
+        detection_url: Optional[str] = None
     ):
-        """处理视频流"""
-        stream_id = f"{stream_url}_{skill_name}"
+        """处理视频流
+        
+        视频流已在处理时只增加技能订阅，不重新打开视频流。
+        
+        Args:
+            motion_threshold: 运动过滤阈值（变化像素比例），为空时依次使用技能和全局的默认值，
+                小于等于0时不过滤
+            min_frame_interval: 自适应抽帧的最小间隔（秒），与max_frame_interval任一指定时启用自适应抽帧
+            max_frame_interval: 自适应抽帧的最大间隔（秒）
+            decode_mode: 解码方式，full解码全部帧，sampled只解码抽样帧，keyframe只解码关键帧，
+                为空时使用全局默认值；同一视频流上取各订阅中解码最完整的方式
+            detection_url: 用于抽帧推理的子码流地址，为空时直接使用stream_url；
+                同一视频流上的所有订阅需要使用相同的子码流
+        """
+        stream_id = self.stream_id(stream_url, skill_name)
         
         if stream_id in self.active_streams:
             raise ValueError(f"Stream {stream_url} is already being processed")
         
-        # 初始化帧缓冲区
-        self.frame_buffer[stream_id] = []
-        
-        # 创建处理任务
-        task = asyncio.create_task(
-            self._process_stream_task(
-                stream_id,
-                stream_url,
-                skill_name,
-                alert_level,
-                frame_interval or settings.DEFAULT_FRAME_INTERVAL,
-                roi,
-                schedule
+        # 未知技能在订阅时拒绝，避免在共享的处理任务中出错而影响同一视频流上的其他技能
+        skill = skill_manager.get_skill(skill_name)
+        if not skill:
+            raise ValueError(f"Skill {skill_name} not found")
+        
+        decode_mode = decode_mode or settings.DECODE_MODE
+        if decode_mode not in DECODE_MODES:
+            raise ValueError(f"Unsupported decode mode: {decode_mode}")
+        
+        context = self.streams.get(stream_url)
+        if context is not None and context.detection_url != (detection_url or None):
+            raise ValueError(
+                f"Stream {stream_url} is already using detection stream {context.detection_url}"
             )
+        
+        if motion_threshold is None:
+            motion_threshold = skill.motion_threshold
+        if motion_threshold is None:
+            motion_threshold = settings.MOTION_GATE_THRESHOLD
+        
+        frame_interval = frame_interval or settings.DEFAULT_FRAME_INTERVAL
+        sampler = None
+        if settings.ADAPTIVE_SAMPLING_ENABLED or min_frame_interval or max_frame_interval:
+            sampler = AdaptiveSampler(
+                min_frame_interval or settings.ADAPTIVE_MIN_FRAME_INTERVAL,
+                max_frame_interval or settings.ADAPTIVE_MAX_FRAME_INTERVAL,
+                frame_interval
+            )
+        
+        subscription = Subscription(
+            stream_id,
+            stream_url,
+            skill_name,
+            alert_level,
+            frame_interval,
+            roi,
+            schedule,
+            motion_threshold,
+            sampler,
+            decode_mode
         )
         
-        self.active_streams[stream_id] = task
+        if context is None:
+            # 创建处理任务
+            context = StreamContext(stream_url, detection_url or None)
+            context.subscriptions[stream_id] = subscription
+            self.streams[stream_url] = context
+            self._start_task(context)
+        else:
+            context.subscriptions[stream_id] = subscription
+            if context.task.done():
+                # 视频流按调度休眠中，新订阅可能在窗口内或有更早的窗口
+                if context.is_active(time.time()):
+                    self._start_task(context)
+                else:
+                    self._suspend(context)
+        
+        # 等待视频流打开，无法打开时处理任务已退出并移除订阅，向调用方返回错误；
+        # 调用方取消时不影响处理任务
+        error = await asyncio.shield(context.opened)
+        if error is not None:
+            raise error
+        if self.streams.get(stream_url) is not context or stream_id not in context.subscriptions:
+            raise ValueError(f"Stream {stream_url} stopped while opening")
+        
+        self.active_streams[stream_id] = subscription
         return stream_id
     
+    def stream_id(self, stream_url: str, skill_name: str) -> str:
+        """视频流上技能订阅的ID"""
+        return f"{stream_url}_{skill_name}"
+    
+    def get_stream_stats(self) -> Dict[str, Dict]:
+        """各技能订阅的处理统计，键为stream_id"""
+        stats = {}
+        for stream_id, subscription in self.active_streams.items():
+            context = self.streams.get(subscription.stream_url)
+            decoder = context.decoder if context else None
+            stats[stream_id] = {
+                "decoder": decoder.get_stats() if decoder else None,
+                "pacing": context.lag.get_stats() if context else None,
+                "suspended": context.task.done() if context else None,
+                "frame_interval": subscription.frame_interval,
+                "motion_gate": subscription.motion_gate.get_stats()
+                if subscription.motion_gate else None,
+                "sampler": subscription.sampler.get_stats()
+                if subscription.sampler else None
+            }
+        return stats
+    
     async def stop_stream(self, stream_id: str):
-        """停止视频流处理"""
-        if stream_id in self.active_streams:
-            self.active_streams[stream_id].cancel()
-            del self.active_streams[stream_id]
-            if stream_id in self.frame_buffer:
-                del self.frame_buffer[stream_id]
+        """停止视频流处理
+        
+        取消技能订阅，视频流上没有订阅时停止解码。
+        """
+        subscription = self.active_streams.pop(stream_id, None)
+        if not subscription:
+            return
+        
+        context = self.streams.get(subscription.stream_url)
+        if not context:
+            return
+        
+        context.subscriptions.pop(stream_id, None)
+        if not context.subscriptions:
+            # 缓冲区由处理任务退出时释放，以便先生成未完成的预警视频片段
+            context.task.cancel()
+            if context.wake_handle:
+                context.wake_handle.cancel()
+            del self.streams[subscription.stream_url]
     
-    async def _process_stream_task(
-        self,
-        stream_id: str,
-        stream_url: str,
-        skill_name: str,
-        alert_level: str,
-        frame_interval: int,
-        roi: Optional[List[str]],
-        schedule: Optional[str]
-    ):
+    def _start_task(self, context: StreamContext):
+        """启动或恢复视频流处理任务"""
+        if context.wake_handle:
+            context.wake_handle.cancel()
+            context.wake_handle = None
+        for subscription in context.subscriptions.values():
+            subscription.reset()
+        context.opened = asyncio.get_running_loop().create_future()
+        context.task = asyncio.create_task(self._process_stream_task(context))
+    
+    def _suspend(self, context: StreamContext):
+        """所有订阅都在调度窗口外时保持视频流关闭，由时间轮在最早的窗口开始时唤醒"""
+        if context.wake_handle:
+            context.wake_handle.cancel()
+        wake_at = context.next_start(time.time())
+        context.wake_handle = timer_wheel.schedule(wake_at, lambda: self._resume(context))
+        logger.info(
+            "Video stream suspended until schedule window",
+            extra={
+                "stream_url": context.stream_url,
+                "wake_at": datetime.fromtimestamp(wake_at).isoformat()
+            }
+        )
+    
+    def _resume(self, context: StreamContext):
+        """时间轮回调：恢复休眠的视频流"""
+        context.wake_handle = None
+        if self.streams.get(context.stream_url) is not context or not context.task.done():
+            return
+        self._start_task(context)
+    
+    async def _process_stream_task(self, context: StreamContext):
         """视频流处理任务"""
-        cap = cv2.VideoCapture(stream_url)
-        if not cap.isOpened():
-            raise ValueError(f"Cannot open video stream: {stream_url}")
+        stream_url = context.stream_url
+        if not context.is_active(time.time()):
+            # 调度窗口外不打开视频流
+            context.opened.set_result(None)
+            self._suspend(context)
+            return
+        
+        evidence = None
+        evidence_task = None
+        suspended = False
+        # 实时视频流只处理最新的帧，回放按解码速度逐帧处理
+        drop_stale = is_live_source(context.detection_url or stream_url)
+        if context.detection_url:
+            # 双码流：子码流只用于抽帧推理，主码流在packet直通模式下只缓冲数据包、不解码；
+            # 主码流的帧全部用于预警视频片段，不丢弃
+            decoder = StreamDecoder(context.detection_url, drop_stale=drop_stale)
+            if settings.VIDEO_CLIP_MODE == "passthrough":
+                evidence = PacketStreamDecoder(stream_url, decode_frames=False)
+            else:
+                evidence = StreamDecoder(stream_url)
+        elif settings.VIDEO_CLIP_MODE == "passthrough":
+            decoder = PacketStreamDecoder(stream_url, drop_stale=drop_stale)
+        else:
+            decoder = StreamDecoder(stream_url, drop_stale=drop_stale)
+        context.decoder = decoder
+        context.evidence = evidence
         
         try:
+            # 阻塞的打开和解码操作都在解码线程中执行
+            await decoder.start()
+            if evidence:
+                await evidence.start()
+            context.opened.set_result(None)
+            
             frame_count = 0
-            last_process_time = 0
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
+            context.update_decoder()
+            
+            # 预警视频片段和预警图片取自主码流
+            clip_source = evidence or decoder
+            fps = context.fps = clip_source.fps
+            if isinstance(clip_source, PacketStreamDecoder):
+                # 预警视频片段直接由压缩数据包生成，不需要缓冲解码后的帧
+                self.packet_buffers[stream_url] = clip_source.packet_buffer
+            else:
+                # 初始化帧缓冲区，容量覆盖预警前后的视频（pre-roll + post-roll）；
+                # 抽样解码时缓冲区只有抽样帧，按抽样帧率计算容量，抽帧间隔变化时重新调整；
+                # 预警视频片段按缓冲帧的时间戳计算帧率
+                fps = self._buffer_fps(clip_source)
+                self.frame_buffer.create(stream_url, fps)
+                # 解码线程直接将帧写入缓冲区槽位（启用压缩时同时完成编码），事件循环只拿到帧的引用
+                clip_source.frame_sink = self.frame_buffer.writer(stream_url)
+            
+            if evidence:
+                evidence_task = asyncio.create_task(self._read_evidence(context))
             
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                backlog = [await decoder.read()]
+                if drop_stale and backlog[0] is not None:
+                    # 实时视频流只对最新的帧推理；积压的旧帧以及解码队列已满时丢弃的帧
+                    # 都已由解码线程写入帧缓冲区（packet直通模式下为数据包缓冲区）
+                    backlog.extend(decoder.drain())
+                decoded = backlog.pop()
+                context.lag.stale += len(backlog)
+                
+                if decoded is None:
                     break
                 
-                current_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                frame = decoded.image
+                current_time = decoded.timestamp
                 
-                # 更新帧缓冲区
-                self.frame_buffer[stream_id].append(frame)
-                # 保持缓冲区大小为fps * VIDEO_CHUNK_DURATION
-                max_buffer_size = fps * settings.VIDEO_CHUNK_DURATION
-                if len(self.frame_buffer[stream_id]) > max_buffer_size:
-                    self.frame_buffer[stream_id].pop(0)
+                # 订阅及其抽帧间隔可能已变化，解码线程从下一帧开始使用新的抽样参数
+                context.update_decoder()
+                if clip_source is decoder and stream_url not in self.packet_buffers:
+                    buffer_fps = self._buffer_fps(decoder)
+                    if buffer_fps != fps:
+                        fps = buffer_fps
+                        self.frame_buffer.set_fps(stream_url, fps)
                 
-                # 按照指定间隔处理帧
-                if current_time - last_process_time >= frame_interval:
-                    # 处理当前帧
-                    await self._process_frame(
-                        frame,
-                        stream_id,
-                        skill_name,
-                        alert_level,
-                        roi,
-                        fps
-                    )
-                    last_process_time = current_time
+                # post-roll采集完成后在后台生成预警视频片段，采集进度以已写入缓冲区的内容为准
+                pending = self.pending_clips.get(stream_url)
+                if pending:
+                    clip_position = self._buffered_position(stream_url, clip_source)
+                    if clip_position is not None and clip_position >= pending.due_time:
+                        self._finalize_clip(stream_url)
                 
-                frame_count += 1
+                # 所有订阅都离开调度窗口时释放解码器
+                now = time.time()
+                if not context.is_active(now):
+                    suspended = True
+                    break
+                
+                # 按照各订阅的间隔和调度选出需要处理当前帧的技能
+                due = [
+                    subscription
+                    for subscription in context.subscriptions.values()
+                    if current_time - subscription.last_process_time >= subscription.frame_interval
+                    and subscription.is_active(now)
+                ]
                 
-                # 检查是否应该继续处理（基于调度）
-                if schedule and not self._should_process(schedule):
-                    await asyncio.sleep(60)  # 休眠1分钟后再检查
-                    continue
+                # 画面变化低于阈值的技能跳过推理，沿用上次结果
+                signature = None
+                if any(s.motion_gate for s in due):
+                    signature = motion_signature(frame)
+                    skipped = [
+                        s for s in due
+                        if s.motion_gate and not s.motion_gate.should_infer(signature, current_time)
+                    ]
+                    for subscription in skipped:
+                        subscription.last_process_time = current_time
+                        subscription.record_result(subscription.last_result)
+                    due = [s for s in due if s not in skipped]
                 
-                await asyncio.sleep(0.1)  # 避免CPU过载
+                # 节点推理预算不足时推迟到后续帧，优先处理等待最久的技能，避免空闲的技能被活跃的技能饿死
+                if due and inference_budget.enabled:
+                    due.sort(key=lambda s: s.last_process_time)
+                    due = due[:inference_budget.acquire(len(due))]
                 
+                if due:
+                    # 推理输入，所有技能共用；JPEG编码的图片由需要的技能在处理时添加
+                    input_data = {"frame": frame}
+                    
+                    for subscription in due:
+                        subscription.last_process_time = current_time
+                    
+                    # 当前帧的共享推理结果，使用相同模型的技能只请求一次KServe
+                    shared_results = {}
+                    # 当前帧在主码流上对应的时间，用于截取预警视频片段和预警图片
+                    clip_time = context.evidence_time(current_time, decoded.captured_at)
+                    
+                    # 并行处理当前帧
+                    results = await asyncio.gather(
+                        *(
+                            self._process_frame(
+                                input_data,
+                                subscription,
+                                fps,
+                                clip_time,
+                                shared_results
+                            )
+                            for subscription in due
+                        ),
+                        return_exceptions=True
+                    )
+                    for subscription, result in zip(due, results):
+                        if isinstance(result, Exception):
+                            logger.error(
+                                "Error processing video frame",
+                                extra={
+                                    "stream_id": subscription.stream_id,
+                                    "error": str(result)
+                                }
+                            )
+                            continue
+                        
+                        subscription.record_result(result)
+                        if subscription.motion_gate:
+                            subscription.motion_gate.update(signature, current_time)
+                
+                frame_count += 1
+                context.lag.record(decoded.captured_at)
+                
+                # 队列中有积压的帧时read()不会挂起，主动让出事件循环
+                await asyncio.sleep(0)
+        
         except asyncio.CancelledError:
             pass
+        except Exception as e:
+            logger.error(
+                "Error processing video stream",
+                extra={"stream_url": stream_url, "error": str(e)}
+            )
+            if not context.opened.done():
+                context.opened.set_result(e)
         finally:
-            cap.release()
-            if stream_id in self.active_streams:
-                del self.active_streams[stream_id]
-            if stream_id in self.frame_buffer:
-                del self.frame_buffer[stream_id]
+            if not context.opened.done():
+                context.opened.set_result(None)
+            decoder.stop()
+            if evidence:
+                evidence.stop()
+            if evidence_task:
+                evidence_task.cancel()
+            if not suspended and self.streams.get(stream_url) is context:
+                del self.streams[stream_url]
+                for stream_id in context.subscriptions:
+                    self.active_streams.pop(stream_id, None)
+            
+            # 同一视频流可能已被重新订阅，此时缓冲区归新的处理任务所有
+            if suspended or stream_url not in self.streams:
+                # 视频流结束或休眠时用已采集的帧生成尚未完成的片段
+                self._finalize_clip(stream_url)
+                self.frame_buffer.release(stream_url)
+                self.packet_buffers.pop(stream_url, None)
+            
+            # 数据包缓冲区持有输入容器，已截取的片段封装完成后关闭
+            for source in (decoder, evidence):
+                if isinstance(source, PacketStreamDecoder):
+                    source.packet_buffer.close()
+            
+            if suspended:
+                self._suspend(context)
     
     async def _process_frame(
         self,
-        frame: np.ndarray,
-        stream_id: str,
-        skill_name: str,
-        alert_level: str,
-        roi: Optional[List[str]],
-        fps: int
-    ):
-        """处理单个视频帧"""
-        # 转换frame为bytes
-        _, buffer = cv2.imencode('.jpg', frame)
-        image_bytes = buffer.tobytes()
+        input_data: Dict,
+        subscription: Subscription,
+        fps: int,
+        clip_time: float,
+        shared_results: Optional[Dict] = None
+    ) -> Dict:
+        """使用订阅的技能处理单个视频帧，返回技能的检测结果
+        
+        clip_time为当前帧在主码流上的时间戳，单码流时即当前帧的时间戳。
+        """
+        stream_id = subscription.stream_id
+        skill_name = subscription.skill_name
+        alert_level = subscription.alert_level
+        
+        # 只有使用V1协议的模型需要JPEG编码，同一帧只编码一次
+        if "image" not in input_data and skill_manager.requires_image(skill_name):
+            input_data["image"] = self._encode_image(input_data["frame"])
         
         # 调用技能进行检测
         result = await skill_manager.invoke_skill(
             skill_name,
-            {"image": image_bytes}
+            input_data,
+            shared_results
         )
         
         # 检查是否需要报警
@@ -148,100 +583,280 @@ class VideoProcessor:
             result["detections"],
             alert_level
         ):
-            # 保存预警图片
-            image_path = await storage_manager.save_image(
-                image_bytes,
-                f"video_alert/{stream_id}"
+            # 保存预警图片，双码流时取自主码流，检测框换算到主码流分辨率
+            image, detections = await self._alert_image(
+                subscription,
+                input_data,
+                result["detections"],
+                clip_time
             )
-            
-            # 保存视频片段
-            video_path = await self._save_video_chunk(
-                stream_id,
-                fps,
-                f"video_alert/{stream_id}"
+            # 预警图片和消息写入本地预写队列，由后台上传和发送，不阻塞检测
+            image_path = storage_manager.new_object_path(f"video_alert/{stream_id}", "jpg")
+            image_record = await alert_spool.put(
+                "upload",
+                {"object_path": image_path, "content_type": "image/jpeg"},
+                image
             )
             
-            # 构建结果消息
+            # 关联预警视频片段，片段在post-roll采集完成后由后台生成
+            clip = self._attach_clip(subscription, fps, clip_time)
+            
+            # 构建结果消息，视频地址在片段生成后通过更新消息发送
             message = {
                 "id": f"{stream_id}_{datetime.now().timestamp()}",
                 "stream_id": stream_id,
                 "skill_name": skill_name,
                 "alert_level": alert_level,
                 "timestamp": datetime.now().timestamp(),
-                "image_url": storage_manager.get_object_url(image_path),
-                "video_url": storage_manager.get_object_url(video_path),
-                "detections": result["detections"]
+                "image_url": image_path,
+                "video_url": "",
+                "clip_status": "pending" if clip else "none",
+                "detections": detections
             }
             
-            # 发送到消息队列
-            await message_queue.send_detection_result(message)
+            # 发送到消息队列，在图片上传完成后投递
+            uploads = {"image_url": image_record}
+            await self._spool_message(message, uploads)
+            if clip:
+                clip.messages.append((message, uploads))
+        
+        return result
     
-    async def _save_video_chunk(self, stream_id: str, fps: int, alert_type: str) -> str:
-        """保存视频片段"""
-        if stream_id not in self.frame_buffer or not self.frame_buffer[stream_id]:
-            return None
+    async def _read_evidence(self, context: StreamContext):
+        """读取双码流接入时的主码流
+        
+        reencode模式下主码流的帧由解码线程写入帧缓冲区，预警图片按时间戳从缓冲区中查找，
+        这里只记录最新的帧，在缓冲区中找不到对应的帧时使用；
+        packet直通模式下解码线程只缓冲数据包，这里只等待视频流结束。
+        """
+        while True:
+            decoded = await context.evidence.read()
+            if decoded is None:
+                break
             
-        # 获取视频帧
-        frames = self.frame_buffer[stream_id]
+            context.evidence_frame = decoded.image
         
-        # 创建临时视频文件
-        temp_path = f"temp_{stream_id}.mp4"
-        height, width = frames[0].shape[:2]
+        logger.warning(
+            "Evidence stream ended",
+            extra={"stream_url": context.stream_url}
+        )
+    
+    async def _alert_image(
+        self,
+        subscription: Subscription,
+        input_data: Dict,
+        detections: List[Dict],
+        clip_time: float
+    ) -> Tuple[bytes, List[Dict]]:
+        """生成预警图片，返回 (JPEG数据, 图片坐标下的检测结果)
         
-        # 创建视频写入器
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_path, fourcc, fps, (width, height))
+        双码流时预警图片取自主码流中clip_time处的帧（reencode模式下为帧缓冲区中不晚于clip_time的最新帧），
+        检测框按两路视频流的分辨率缩放；主码流没有可用的帧时退回使用检测帧。
+        """
+        context = self.streams.get(subscription.stream_url)
+        evidence_frame = None
+        if context and context.evidence:
+            packet_buffer = self.packet_buffers.get(context.stream_url)
+            if packet_buffer is not None:
+                # 主码流只缓冲了数据包，从所在GOP的关键帧开始解码
+                evidence_frame = await asyncio.get_running_loop().run_in_executor(
+                    None, packet_buffer.decode_frame, clip_time
+                )
+            else:
+                frames = self.frame_buffer.get(context.stream_url)
+                if frames is not None:
+                    evidence_frame = frames.frame_at(clip_time)
+                if evidence_frame is None:
+                    # 缓冲区中没有clip_time之前的帧（如缓冲区刚创建）时使用主码流最新的帧
+                    evidence_frame = context.evidence_frame
+        
+        if evidence_frame is None:
+            # 只在需要时进行JPEG编码，同一帧上的技能共用
+            if "image" not in input_data:
+                input_data["image"] = self._encode_image(input_data["frame"])
+            return input_data["image"], detections
+        
+        height, width = input_data["frame"].shape[:2]
+        evidence_height, evidence_width = evidence_frame.shape[:2]
+        return self._encode_image(evidence_frame), self._scale_detections(
+            detections,
+            evidence_width / width,
+            evidence_height / height
+        )
+    
+    def _scale_detections(
+        self,
+        detections: List[Dict],
+        scale_x: float,
+        scale_y: float
+    ) -> List[Dict]:
+        """缩放检测框坐标，返回新的检测结果，不修改原结果"""
+        scaled = []
+        for detection in detections:
+            detection = dict(detection)
+            bbox = detection.get("bbox")
+            if bbox:
+                detection["bbox"] = {
+                    "x": bbox.get("x", 0.0) * scale_x,
+                    "y": bbox.get("y", 0.0) * scale_y,
+                    "width": bbox.get("width", 0.0) * scale_x,
+                    "height": bbox.get("height", 0.0) * scale_y
+                }
+            scaled.append(detection)
+        return scaled
+    
+    def _encode_image(self, frame: np.ndarray) -> bytes:
+        """将帧编码为JPEG"""
+        _, buffer = cv2.imencode('.jpg', frame)
+        return buffer.tobytes()
+    
+    def _buffered_position(self, stream_url: str, clip_source: StreamDecoder) -> Optional[float]:
+        """预警视频片段来源已缓冲内容的最新流内时间戳
         
+        帧缓冲区由解码线程写入，可能领先或落后于处理中的帧，取最新缓冲帧的时间戳；
+        packet直通模式下读取位置在数据包写入缓冲区后更新。
+        """
+        frames = self.frame_buffer.get(stream_url)
+        if frames is not None:
+            return frames.last_timestamp
+        return clip_source.position
+    
+    def _buffer_fps(self, decoder: StreamDecoder) -> int:
+        """帧缓冲区中视频帧的帧率"""
+        if decoder.sample_interval <= 0:
+            return decoder.fps
+        return max(1, min(decoder.fps, round(1 / decoder.sample_interval)))
+    
+    def _attach_clip(
+        self,
+        subscription: Subscription,
+        fps: int,
+        current_time: float
+    ) -> Optional[PendingClip]:
+        """获取视频流正在采集的片段，没有时新建
+        
+        post-roll期间同一视频流上各技能的后续预警共用同一片段，不延长采集窗口。
+        """
+        stream_url = subscription.stream_url
+        clip = self.pending_clips.get(stream_url)
+        if clip:
+            return clip
+        
+        if not clip_writer.try_acquire():
+            return None
+        
+        clip = PendingClip(
+            stream_url,
+            f"video_alert/{subscription.stream_id}",
+            fps,
+            current_time + settings.ALERT_POST_ROLL_SECONDS
+        )
+        self.pending_clips[stream_url] = clip
+        return clip
+    
+    def _finalize_clip(self, stream_url: str):
+        """截取视频流的缓冲内容，交给后台编码线程池生成片段"""
+        clip = self.pending_clips.pop(stream_url, None)
+        if not clip:
+            return
+        
+        packet_buffer = self.packet_buffers.get(stream_url)
+        if packet_buffer is not None:
+            # packet直通模式：在内存中将压缩数据包封装为MP4，不重新编码；
+            # 数据包在此时截取，封装完成前输入容器保持打开
+            remux = packet_buffer.remux_job()
+            if remux is None:
+                clip_writer.release()
+                return
+            job = (remux,)
+            snapshot = None
+        else:
+            # 缓冲区会继续写入新帧，编码前先截取快照，快照在编码完成前计入帧缓冲区的内存预算；
+            # 抽帧间隔变化后缓冲帧的间隔不均匀，按时间戳计算的平均帧率编码
+            snapshot = self.frame_buffer.snapshot(stream_url)
+            if snapshot is None:
+                clip_writer.release()
+                return
+            job = (encode_frames, snapshot.frames, snapshot.fps or clip.fps)
+        
+        asyncio.create_task(self._save_video_chunk(clip, job, snapshot))
+    
+    async def _save_video_chunk(
+        self,
+        clip: PendingClip,
+        job: tuple,
+        snapshot: Optional[FrameSnapshot] = None
+    ):
+        """生成并保存视频片段，完成后发送预警更新消息"""
         try:
-            # 写入帧
-            for frame in frames:
-                out.write(frame)
-            
-            # 释放视频写入器
-            out.release()
-            
-            # 读取临时文件
-            with open(temp_path, 'rb') as f:
-                video_data = f.read()
-            
-            # 删除临时文件
-            import os
-            os.remove(temp_path)
+            video_data = await clip_writer.run(*job)
+            if not video_data:
+                return
             
-            # 保存到MinIO
-            return await storage_manager.save_video(video_data, alert_type)
+            # 保存到MinIO，更新消息在片段上传完成后发送
+            video_path = storage_manager.new_object_path(clip.alert_type, "mp4")
+            video_record = await alert_spool.put(
+                "upload",
+                {"object_path": video_path, "content_type": "video/mp4"},
+                video_data
+            )
             
+            for message, uploads in clip.messages:
+                await self._spool_message(
+                    {**message, "video_url": video_path, "clip_status": "ready"},
+                    {**uploads, "video_url": video_record}
+                )
+        
         except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
+            logger.error(
+                "Error saving alert video clip",
+                extra={"stream_url": clip.stream_url, "error": str(e)}
+            )
+        finally:
+            if snapshot is not None:
+                snapshot.release()
+            clip_writer.release()
     
-    def _should_process(self, schedule: str) -> bool:
-        """检查当前时间是否在处理调度范围内"""
-        if not schedule:
-            return True
-            
-        # 简单的时间范围检查实现
-        # 格式: "HH:MM-HH:MM"
-        try:
-            current_time = datetime.now().time()
-            start_time, end_time = schedule.split('-')
-            start_hour, start_minute = map(int, start_time.split(':'))
-            end_hour, end_minute = map(int, end_time.split(':'))
-            
-            start = datetime.now().replace(
-                hour=start_hour,
-                minute=start_minute
-            ).time()
-            end = datetime.now().replace(
-                hour=end_hour,
-                minute=end_minute
-            ).time()
-            
-            return start <= current_time <= end
-            
-        except:
-            return True  # 如果解析失败，默认总是处理
+    async def _spool_message(self, message: Dict, uploads: Optional[Dict] = None):
+        """将预警消息写入本地预写队列，image_url和video_url为对象路径
+        
+        Args:
+            uploads: 消息字段到上传记录标识的映射，消息在这些上传完成后投递
+        """
+        uploads = {field: record for field, record in (uploads or {}).items() if record}
+        await alert_spool.put(
+            "message",
+            {"message": message, "uploads": uploads},
+            after=list(uploads.values())
+        )
+    
+    async def _deliver_upload(self, header: Dict, payload: bytes):
+        """预写队列的上传处理函数"""
+        await storage_manager.upload(header["object_path"], payload, header["content_type"])
+    
+    async def _deliver_messages(self, records: List[Tuple[Dict, bytes]]) -> List[Optional[Exception]]:
+        """预写队列的消息批量处理函数，一批消息一起提交后等待发送结果
+        
+        发送时才生成访问URL，避免排队期间URL过期。
+        """
+        return await message_queue.send_many([
+            self._resolve_message(header) for header, _ in records
+        ])
+    
+    def _resolve_message(self, header: Dict) -> Dict:
+        """将预警消息中的对象路径转换为访问URL"""
+        message = header["message"]
+        # 上传最终失败的对象不能访问，消息不带该地址发送
+        failed = {tuple(record) for record in header.get("failed_after", [])}
+        for field, record in header.get("uploads", {}).items():
+            if tuple(record) in failed:
+                message[field] = ""
+                if field == "video_url":
+                    message["clip_status"] = "none"
+        for field in ("image_url", "video_url"):
+            if message.get(field):
+                message[field] = storage_manager.get_object_url(message[field])
+        return message
 
 # 全局视频处理器实例
 video_processor = VideoProcessor() 
\ No newline at end of file
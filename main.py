@@ -1,9 +1,12 @@
 import asyncio
 import logging
+import multiprocessing
+import os
+import signal
+import time
 from logging.config import dictConfig
 from pythonjsonlogger import jsonlogger
 
-from service.vision_service import serve
 from config.config import settings
 
 # 配置日志
@@ -34,17 +37,56 @@ logging_config = {
 dictConfig(logging_config)
 logger = logging.getLogger(__name__)
 
+# 工作进程停止gRPC服务后释放资源（投递队列、消息发送等）的最长时间（秒）
+_WORKER_CLEANUP_TIMEOUT = 30
+
 async def main():
+    # 服务模块在导入时创建全局实例，多进程模式下只在工作进程中导入
+    from service.vision_service import serve
+    from core.kserve_client import kserve_client_pool
+    from core.spool import alert_spool
+    from core.message_queue import message_queue
+    from core.placement import placement_manager
+    from core.batch_job import batch_job_manager
+    from core.stats_reporter import stats_reporter
+    
+    loop = asyncio.get_running_loop()
+    stop_task = None
+    
     try:
         # 启动gRPC服务器
         server = serve()
         await server.start()
         
+        # 收到SIGTERM或SIGINT时停止接收新请求，进行中的请求在宽限期内完成
+        def shutdown():
+            nonlocal stop_task
+            if stop_task is None:
+                logger.info(
+                    "Stopping Vision AI Engine",
+                    extra={"grace": settings.GRPC_SHUTDOWN_GRACE}
+                )
+                stop_task = asyncio.ensure_future(server.stop(settings.GRPC_SHUTDOWN_GRACE))
+        
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, shutdown)
+        
+        # 启动预警数据的后台投递
+        alert_spool.start()
+        
+        # 启用集群放置时恢复并领取视频流
+        if placement_manager is not None:
+            placement_manager.start()
+        
+        # 定期输出视频流处理统计和资源占用
+        stats_reporter.start()
+        
         logger.info(
             "Vision AI Engine started",
             extra={
                 "port": settings.GRPC_PORT,
-                "workers": settings.GRPC_MAX_WORKERS
+                "workers": settings.GRPC_MAX_WORKERS,
+                "worker_index": settings.GRPC_WORKER_INDEX
             }
         )
         
@@ -57,6 +99,88 @@ async def main():
             extra={"error": str(e)}
         )
         raise
+    
+    finally:
+        # 服务器异常退出时同样释放资源，单个步骤失败不影响后续步骤
+        cleanup = [
+            ("stats", stats_reporter.stop),
+            # 释放视频流租约，由其他节点接管
+            ("placement", placement_manager.stop if placement_manager is not None else None),
+            # 停止后台投递，未投递的数据保留在本地，重启后继续投递
+            ("spool", alert_spool.stop),
+            # 发送剩余的消息
+            ("message_queue", message_queue.close),
+            # 停止离线批量任务的进程池
+            ("batch_jobs", batch_job_manager.close),
+            # 关闭推理服务连接
+            ("kserve", kserve_client_pool.close)
+        ]
+        for name, close in cleanup:
+            if close is None:
+                continue
+            try:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(
+                    "Error stopping Vision AI Engine component",
+                    extra={"component": name, "error": str(e)}
+                )
+
+def run_worker():
+    """工作进程入口"""
+    asyncio.run(main())
+
+def start_worker(index: int) -> multiprocessing.Process:
+    """启动工作进程，进程序号通过环境变量传递给子进程的配置"""
+    os.environ["GRPC_WORKER_INDEX"] = str(index)
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_worker,
+        name=f"vision-worker-{index}"
+    )
+    process.start()
+    return process
+
+def run_workers():
+    """启动多个工作进程，异常退出的工作进程被重新启动"""
+    workers = {index: start_worker(index) for index in range(settings.GRPC_WORKERS)}
+    stopping = False
+    
+    def shutdown(signum, frame):
+        # 工作进程收到SIGTERM后在宽限期内完成进行中的请求并释放资源
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            process.terminate()
+    
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    
+    while not stopping:
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                logger.error(
+                    "Worker process exited, restarting",
+                    extra={"worker_index": index, "exitcode": process.exitcode}
+                )
+                workers[index] = start_worker(index)
+        time.sleep(1)
+    
+    # 超过宽限期和清理时间仍未退出的工作进程被强制结束
+    deadline = time.monotonic() + settings.GRPC_SHUTDOWN_GRACE + _WORKER_CLEANUP_TIMEOUT
+    for process in workers.values():
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            logger.error(
+                "Worker process did not stop in time, killing",
+                extra={"pid": process.pid}
+            )
+            process.kill()
+            process.join()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    if settings.GRPC_WORKERS > 1:
+        run_workers()
+    else:
+        asyncio.run(main())
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14vision_service.proto\x12\x0evision_service\"\xae\x01\n\x0f\x44\x65tectionResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12-\n\ndetections\x18\x03 \x03(\x0b\x32\x19.vision_service.Detection\x12\x11\n\timage_url\x18\x04 \x01(\t\x12\x11\n\tvideo_url\x18\x05 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x06 \x01(\t\x12\x11\n\ttimestamp\x18\x07 \x01(\x03\"\xd0\x01\n\tDetection\x12\x12\n\nclass_name\x18\x01 \x01(\t\x12\x12\n\nconfidence\x18\x02 \x01(\x02\x12)\n\x04\x62\x62ox\x18\x03 \x01(\x0b\x32\x1b.vision_service.BoundingBox\x12=\n\nattributes\x18\x04 \x03(\x0b\x32).vision_service.Detection.AttributesEntry\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"B\n\x0b\x42oundingBox\x12\t\n\x01x\x18\x01 \x01(\x02\x12\t\n\x01y\x18\x02 \x01(\x02\x12\r\n\x05width\x18\x03 \x01(\x02\x12\x0e\n\x06height\x18\x04 \x01(\x02\"a\n\x15ImageDetectionRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x03 \x01(\t\x12\x0b\n\x03roi\x18\x04 \x03(\t\"\x88\x01\n\x12VideoStreamRequest\x12\x12\n\nstream_url\x18\x01 \x01(\t\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x03 \x01(\t\x12\x16\n\x0e\x66rame_interval\x18\x04 \x01(\x05\x12\x0b\n\x03roi\x18\x05 \x03(\t\x12\x10\n\x08schedule\x18\x06 \x01(\t\"H\n\x11\x44\x65tectionResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t2\xc8\x01\n\rVisionService\x12Y\n\x0b\x44\x65tectImage\x12%.vision_service.ImageDetectionRequest\x1a!.vision_service.DetectionResponse\"\x00\x12\\\n\x11\x44\x65tectVideoStream\x12\".vision_service.VideoStreamRequest\x1a!.vision_service.DetectionResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14vision_service.proto\x12\x0evision_service\"\xd6\x01\n\x0f\x44\x65tectionResult\x12\n\n\x02id\x18\x01 \x01(\t\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12-\n\ndetections\x18\x03 \x03(\x0b\x32\x19.vision_service.Detection\x12\x11\n\timage_url\x18\x04 \x01(\t\x12\x11\n\tvideo_url\x18\x05 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x06 \x01(\t\x12\x11\n\ttimestamp\x18\x07 \x01(\x03\x12\x11\n\tstream_id\x18\x08 \x01(\t\x12\x13\n\x0b\x63lip_status\x18\t \x01(\t\"\xd0\x01\n\tDetection\x12\x12\n\nclass_name\x18\x01 \x01(\t\x12\x12\n\nconfidence\x18\x02 \x01(\x02\x12)\n\x04\x62\x62ox\x18\x03 \x01(\x0b\x32\x1b.vision_service.BoundingBox\x12=\n\nattributes\x18\x04 \x03(\x0b\x32).vision_service.Detection.AttributesEntry\x1a\x31\n\x0f\x41ttributesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"B\n\x0b\x42oundingBox\x12\t\n\x01x\x18\x01 \x01(\x02\x12\t\n\x01y\x18\x02 \x01(\x02\x12\r\n\x05width\x18\x03 \x01(\x02\x12\x0e\n\x06height\x18\x04 \x01(\x02\"\xa1\x01\n\x15ImageDetectionRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x03 \x01(\t\x12\x0b\n\x03roi\x18\x04 \x03(\t\x12\x12\n\nrequest_id\x18\x05 \x01(\t\x12\x14\n\x0cskip_storage\x18\x06 \x01(\x08\x12\x14\n\x0cskip_publish\x18\x07 \x01(\x08\"U\n\x1a\x42\x61tchImageDetectionRequest\x12\x37\n\x08requests\x18\x01 \x03(\x0b\x32%.vision_service.ImageDetectionRequest\"|\n\x16ImageDetectionResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12-\n\ndetections\x18\x04 \x03(\x0b\x32\x19.vision_service.Detection\"X\n\x1b\x42\x61tchImageDetectionResponse\x12\x39\n\tresponses\x18\x01 \x03(\x0b\x32&.vision_service.ImageDetectionResponse\"\x86\x02\n\x12VideoStreamRequest\x12\x12\n\nstream_url\x18\x01 \x01(\t\x12\x12\n\nskill_name\x18\x02 \x01(\t\x12\x13\n\x0b\x61lert_level\x18\x03 \x01(\t\x12\x16\n\x0e\x66rame_interval\x18\x04 \x01(\x05\x12\x0b\n\x03roi\x18\x05 \x03(\t\x12\x10\n\x08schedule\x18\x06 \x01(\t\x12\x18\n\x10motion_threshold\x18\x07 \x01(\x02\x12\x1a\n\x12min_frame_interval\x18\x08 \x01(\x02\x12\x1a\n\x12max_frame_interval\x18\t \x01(\x02\x12\x13\n\x0b\x64\x65\x63ode_mode\x18\n \x01(\t\x12\x15\n\rdetection_url\x18\x0b \x01(\t\"y\n\x11\x44\x65tectionResponse\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12/\n\x06result\x18\x04 \x01(\x0b\x32\x1f.vision_service.DetectionResult\"{\n\x0f\x42\x61tchJobRequest\x12\x12\n\nvideo_path\x18\x01 \x01(\t\x12\x13\n\x0bskill_names\x18\x02 \x03(\t\x12\x16\n\x0e\x66rame_interval\x18\x03 \x01(\x02\x12\x17\n\x0fsegment_seconds\x18\x04 \x01(\x02\x12\x0e\n\x06job_id\x18\x05 \x01(\t\"\x1f\n\rBatchJobQuery\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"\xe6\x01\n\x0e\x42\x61tchJobStatus\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x16\n\x0esegments_total\x18\x04 \x01(\x05\x12\x15\n\rsegments_done\x18\x05 \x01(\x05\x12\x0e\n\x06\x66rames\x18\x06 \x01(\x03\x12\x17\n\x0finferred_frames\x18\x07 \x01(\x03\x12\x19\n\x11\x66rames_per_second\x18\x08 \x01(\x02\x12\x30\n\x07results\x18\t \x03(\x0b\x32\x1f.vision_service.DetectionResult2\x9e\x05\n\rVisionService\x12Y\n\x0b\x44\x65tectImage\x12%.vision_service.ImageDetectionRequest\x1a!.vision_service.DetectionResponse\"\x00\x12h\n\x11\x44\x65tectImageStream\x12%.vision_service.ImageDetectionRequest\x1a&.vision_service.ImageDetectionResponse\"\x00(\x01\x30\x01\x12i\n\x0c\x44\x65tectImages\x12*.vision_service.BatchImageDetectionRequest\x1a+.vision_service.BatchImageDetectionResponse\"\x00\x12\\\n\x11\x44\x65tectVideoStream\x12\".vision_service.VideoStreamRequest\x1a!.vision_service.DetectionResponse\"\x00\x12Z\n\x0fStopVideoStream\x12\".vision_service.VideoStreamRequest\x1a!.vision_service.DetectionResponse\"\x00\x12S\n\x0eSubmitBatchJob\x12\x1f.vision_service.BatchJobRequest\x1a\x1e.vision_service.BatchJobStatus\"\x00\x12N\n\x0bGetBatchJob\x12\x1d.vision_service.BatchJobQuery\x1a\x1e.vision_service.BatchJobStatus\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -34,19 +34,31 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_DETECTION_ATTRIBUTESENTRY']._loaded_options = None
   _globals['_DETECTION_ATTRIBUTESENTRY']._serialized_options = b'8\001'
   _globals['_DETECTIONRESULT']._serialized_start=41
-  _globals['_DETECTIONRESULT']._serialized_end=215
-  _globals['_DETECTION']._serialized_start=218
-  _globals['_DETECTION']._serialized_end=426
-  _globals['_DETECTION_ATTRIBUTESENTRY']._serialized_start=377
-  _globals['_DETECTION_ATTRIBUTESENTRY']._serialized_end=426
-  _globals['_BOUNDINGBOX']._serialized_start=428
-  _globals['_BOUNDINGBOX']._serialized_end=494
-  _globals['_IMAGEDETECTIONREQUEST']._serialized_start=496
-  _globals['_IMAGEDETECTIONREQUEST']._serialized_end=593
-  _globals['_VIDEOSTREAMREQUEST']._serialized_start=596
-  _globals['_VIDEOSTREAMREQUEST']._serialized_end=732
-  _globals['_DETECTIONRESPONSE']._serialized_start=734
-  _globals['_DETECTIONRESPONSE']._serialized_end=806
-  _globals['_VISIONSERVICE']._serialized_start=809
-  _globals['_VISIONSERVICE']._serialized_end=1009
+  _globals['_DETECTIONRESULT']._serialized_end=255
+  _globals['_DETECTION']._serialized_start=258
+  _globals['_DETECTION']._serialized_end=466
+  _globals['_DETECTION_ATTRIBUTESENTRY']._serialized_start=417
+  _globals['_DETECTION_ATTRIBUTESENTRY']._serialized_end=466
+  _globals['_BOUNDINGBOX']._serialized_start=468
+  _globals['_BOUNDINGBOX']._serialized_end=534
+  _globals['_IMAGEDETECTIONREQUEST']._serialized_start=537
+  _globals['_IMAGEDETECTIONREQUEST']._serialized_end=698
+  _globals['_BATCHIMAGEDETECTIONREQUEST']._serialized_start=700
+  _globals['_BATCHIMAGEDETECTIONREQUEST']._serialized_end=785
+  _globals['_IMAGEDETECTIONRESPONSE']._serialized_start=787
+  _globals['_IMAGEDETECTIONRESPONSE']._serialized_end=911
+  _globals['_BATCHIMAGEDETECTIONRESPONSE']._serialized_start=913
+  _globals['_BATCHIMAGEDETECTIONRESPONSE']._serialized_end=1001
+  _globals['_VIDEOSTREAMREQUEST']._serialized_start=1004
+  _globals['_VIDEOSTREAMREQUEST']._serialized_end=1266
+  _globals['_DETECTIONRESPONSE']._serialized_start=1268
+  _globals['_DETECTIONRESPONSE']._serialized_end=1389
+  _globals['_BATCHJOBREQUEST']._serialized_start=1391
+  _globals['_BATCHJOBREQUEST']._serialized_end=1514
+  _globals['_BATCHJOBQUERY']._serialized_start=1516
+  _globals['_BATCHJOBQUERY']._serialized_end=1547
+  _globals['_BATCHJOBSTATUS']._serialized_start=1550
+  _globals['_BATCHJOBSTATUS']._serialized_end=1780
+  _globals['_VISIONSERVICE']._serialized_start=1783
+  _globals['_VISIONSERVICE']._serialized_end=2453
 # @@protoc_insertion_point(module_scope)
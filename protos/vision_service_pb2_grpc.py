@@ -40,11 +40,36 @@ class VisionServiceStub(object):
                 request_serializer=vision__service__pb2.ImageDetectionRequest.SerializeToString,
                 response_deserializer=vision__service__pb2.DetectionResponse.FromString,
                 _registered_method=True)
+        self.DetectImageStream = channel.stream_stream(
+                '/vision_service.VisionService/DetectImageStream',
+                request_serializer=vision__service__pb2.ImageDetectionRequest.SerializeToString,
+                response_deserializer=vision__service__pb2.ImageDetectionResponse.FromString,
+                _registered_method=True)
+        self.DetectImages = channel.unary_unary(
+                '/vision_service.VisionService/DetectImages',
+                request_serializer=vision__service__pb2.BatchImageDetectionRequest.SerializeToString,
+                response_deserializer=vision__service__pb2.BatchImageDetectionResponse.FromString,
+                _registered_method=True)
         self.DetectVideoStream = channel.unary_unary(
                 '/vision_service.VisionService/DetectVideoStream',
                 request_serializer=vision__service__pb2.VideoStreamRequest.SerializeToString,
                 response_deserializer=vision__service__pb2.DetectionResponse.FromString,
                 _registered_method=True)
+        self.StopVideoStream = channel.unary_unary(
+                '/vision_service.VisionService/StopVideoStream',
+                request_serializer=vision__service__pb2.VideoStreamRequest.SerializeToString,
+                response_deserializer=vision__service__pb2.DetectionResponse.FromString,
+                _registered_method=True)
+        self.SubmitBatchJob = channel.unary_unary(
+                '/vision_service.VisionService/SubmitBatchJob',
+                request_serializer=vision__service__pb2.BatchJobRequest.SerializeToString,
+                response_deserializer=vision__service__pb2.BatchJobStatus.FromString,
+                _registered_method=True)
+        self.GetBatchJob = channel.unary_unary(
+                '/vision_service.VisionService/GetBatchJob',
+                request_serializer=vision__service__pb2.BatchJobQuery.SerializeToString,
+                response_deserializer=vision__service__pb2.BatchJobStatus.FromString,
+                _registered_method=True)
 
 
 class VisionServiceServicer(object):
@@ -58,6 +83,20 @@ class VisionServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def DetectImageStream(self, request_iterator, context):
+        """图片流检测，每个请求返回一个响应，响应顺序可能与请求不同
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def DetectImages(self, request, context):
+        """批量图片检测
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def DetectVideoStream(self, request, context):
         """视频流检测
         """
@@ -65,6 +104,27 @@ class VisionServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StopVideoStream(self, request, context):
+        """停止视频流上的技能检测，只需stream_url和skill_name
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitBatchJob(self, request, context):
+        """提交离线批量视频处理任务
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetBatchJob(self, request, context):
+        """查询批量任务状态及结果
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_VisionServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -73,11 +133,36 @@ def add_VisionServiceServicer_to_server(servicer, server):
                     request_deserializer=vision__service__pb2.ImageDetectionRequest.FromString,
                     response_serializer=vision__service__pb2.DetectionResponse.SerializeToString,
             ),
+            'DetectImageStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.DetectImageStream,
+                    request_deserializer=vision__service__pb2.ImageDetectionRequest.FromString,
+                    response_serializer=vision__service__pb2.ImageDetectionResponse.SerializeToString,
+            ),
+            'DetectImages': grpc.unary_unary_rpc_method_handler(
+                    servicer.DetectImages,
+                    request_deserializer=vision__service__pb2.BatchImageDetectionRequest.FromString,
+                    response_serializer=vision__service__pb2.BatchImageDetectionResponse.SerializeToString,
+            ),
             'DetectVideoStream': grpc.unary_unary_rpc_method_handler(
                     servicer.DetectVideoStream,
                     request_deserializer=vision__service__pb2.VideoStreamRequest.FromString,
                     response_serializer=vision__service__pb2.DetectionResponse.SerializeToString,
             ),
+            'StopVideoStream': grpc.unary_unary_rpc_method_handler(
+                    servicer.StopVideoStream,
+                    request_deserializer=vision__service__pb2.VideoStreamRequest.FromString,
+                    response_serializer=vision__service__pb2.DetectionResponse.SerializeToString,
+            ),
+            'SubmitBatchJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitBatchJob,
+                    request_deserializer=vision__service__pb2.BatchJobRequest.FromString,
+                    response_serializer=vision__service__pb2.BatchJobStatus.SerializeToString,
+            ),
+            'GetBatchJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetBatchJob,
+                    request_deserializer=vision__service__pb2.BatchJobQuery.FromString,
+                    response_serializer=vision__service__pb2.BatchJobStatus.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'vision_service.VisionService', rpc_method_handlers)
@@ -117,6 +202,60 @@ class VisionService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def DetectImageStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/vision_service.VisionService/DetectImageStream',
+            vision__service__pb2.ImageDetectionRequest.SerializeToString,
+            vision__service__pb2.ImageDetectionResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def DetectImages(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vision_service.VisionService/DetectImages',
+            vision__service__pb2.BatchImageDetectionRequest.SerializeToString,
+            vision__service__pb2.BatchImageDetectionResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def DetectVideoStream(request,
             target,
@@ -143,3 +282,84 @@ class VisionService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StopVideoStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vision_service.VisionService/StopVideoStream',
+            vision__service__pb2.VideoStreamRequest.SerializeToString,
+            vision__service__pb2.DetectionResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SubmitBatchJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vision_service.VisionService/SubmitBatchJob',
+            vision__service__pb2.BatchJobRequest.SerializeToString,
+            vision__service__pb2.BatchJobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetBatchJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/vision_service.VisionService/GetBatchJob',
+            vision__service__pb2.BatchJobQuery.SerializeToString,
+            vision__service__pb2.BatchJobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,55 +1,61 @@
+import asyncio
 import grpc
+import logging
 import uuid
 from concurrent import futures
 from datetime import datetime
+from typing import Dict, Optional
 
 from core.skill_manager import skill_manager
 from core.storage_manager import storage_manager
-from core.message_queue import message_queue
+from core.spool import alert_spool
 from core.video_processor import video_processor
+from core.message_codec import add_detections, to_detection_result
+from core.hash_ring import HashRing
+from core.placement import StreamDefinition, placement_manager
+from core.batch_job import BatchJob, batch_job_manager
 from config.config import settings
 
 # 导入生成的gRPC代码
 import vision_service_pb2
 import vision_service_pb2_grpc
 
+logger = logging.getLogger(__name__)
+
 class VisionServiceServicer(vision_service_pb2_grpc.VisionServiceServicer):
+    def __init__(self):
+        # 节点上同时处理的图片检测数上限，所有图片接口共享
+        self._image_slots = asyncio.Semaphore(settings.GRPC_MAX_CONCURRENT_IMAGES)
+        # 视频流到工作进程的分配
+        self._workers = HashRing(range(settings.GRPC_WORKERS), settings.HASH_RING_VNODES)
+        self._worker_stubs = {}
+    
     async def DetectImage(self, request, context):
         """处理单张图片检测请求"""
         try:
             # 生成请求ID
             request_id = str(uuid.uuid4())
             
-            # 调用技能进行检测
-            result = await skill_manager.invoke_skill(
-                request.skill_name,
-                {"image": request.image_data}
+            result = await self._detect_image(
+                request,
+                request_id,
+                timeout=context.time_remaining()
             )
             
-            # 如果检测到目标，保存图片
-            if result.get("detections"):
-                image_path = await storage_manager.save_image(
-                    request.image_data,
-                    "image_alert"
-                )
-                
-                # 构建结果消息
-                message = {
-                    "id": request_id,
-                    "skill_name": request.skill_name,
-                    "alert_level": request.alert_level,
-                    "timestamp": datetime.now().timestamp(),
-                    "image_url": storage_manager.get_object_url(image_path),
-                    "detections": result["detections"]
-                }
-                
-                # 发送到消息队列
-                await message_queue.send_detection_result(message)
-            
             return vision_service_pb2.DetectionResponse(
                 request_id=request_id,
                 status="success",
-                message="Detection completed successfully"
+                message="Detection completed successfully",
+                result=to_detection_result(result)
+            )
+            
+        except asyncio.TimeoutError:
+            context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+            context.set_details("Deadline exceeded before detection completed")
+            return vision_service_pb2.DetectionResponse(
+                request_id="",
+                status="error",
+                message="Deadline exceeded"
             )
             
         except Exception as e:
@@ -61,9 +67,215 @@ class VisionServiceServicer(vision_service_pb2_grpc.VisionServiceServicer):
                 message=str(e)
             )
     
+    async def DetectImageStream(self, request_iterator, context):
+        """处理图片流检测请求
+        
+        请求并发处理，完成后立即返回响应。未返回的响应数达到上限时暂停读取请求，
+        由gRPC流量控制使客户端降低发送速度。
+        """
+        window = asyncio.Semaphore(settings.GRPC_STREAM_MAX_INFLIGHT)
+        responses = asyncio.Queue()
+        tasks = set()
+        
+        async def handle(request):
+            await responses.put(await self._image_response(request, context))
+        
+        async def read_requests():
+            try:
+                async for request in request_iterator:
+                    await window.acquire()
+                    task = asyncio.create_task(handle(request))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+            finally:
+                # 通知发送端请求已处理完
+                await responses.put(None)
+        
+        reader = asyncio.create_task(read_requests())
+        try:
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                window.release()
+                yield response
+            # 读取请求出错时抛出异常
+            await reader
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+    
+    async def DetectImages(self, request, context):
+        """处理批量图片检测请求，响应顺序与请求一致"""
+        if len(request.requests) > settings.GRPC_MAX_BATCH_IMAGES:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"Batch size exceeds {settings.GRPC_MAX_BATCH_IMAGES} images"
+            )
+        
+        # 同一图片的多个技能请求共享相同模型的推理结果
+        shared_results = {}
+        responses = await asyncio.gather(
+            *(
+                self._image_response(
+                    image_request,
+                    context,
+                    shared_results.setdefault(image_request.image_data, {})
+                )
+                for image_request in request.requests
+            )
+        )
+        return vision_service_pb2.BatchImageDetectionResponse(responses=responses)
+    
+    async def _image_response(
+        self,
+        request,
+        context,
+        shared_results: Optional[Dict] = None
+    ):
+        """检测单张图片并构建响应，检测失败时返回错误状态"""
+        request_id = request.request_id or str(uuid.uuid4())
+        try:
+            result = await self._detect_image(
+                request,
+                request_id,
+                shared_results,
+                timeout=context.time_remaining()
+            )
+        except asyncio.TimeoutError:
+            return vision_service_pb2.ImageDetectionResponse(
+                request_id=request_id,
+                status="error",
+                message="Deadline exceeded"
+            )
+        except Exception as e:
+            return vision_service_pb2.ImageDetectionResponse(
+                request_id=request_id,
+                status="error",
+                message=str(e)
+            )
+        
+        response = vision_service_pb2.ImageDetectionResponse(
+            request_id=request_id,
+            status="success",
+            message="Detection completed successfully"
+        )
+        add_detections(response.detections, result["detections"])
+        return response
+    
+    async def _detect_image(
+        self,
+        request,
+        request_id: str,
+        shared_results: Optional[Dict] = None,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """调用技能检测图片，触发预警时按请求保存图片并发送结果消息
+        
+        Args:
+            request: 图片检测请求
+            request_id: 请求ID
+            shared_results: 同一图片的共享推理结果表
+            timeout: 客户端剩余的截止时间（秒），包括等待处理名额的时间，
+                超时后放弃推理并抛出asyncio.TimeoutError
+        
+        Returns:
+            Dict: 检测结果，字段与结果消息相同
+        """
+        # 等待处理名额的时间计入截止时间，节点繁忙时超时返回而不是无限排队
+        result = await asyncio.wait_for(
+            self._invoke_skill(request, shared_results),
+            timeout
+        )
+        
+        # 构建结果消息
+        message = {
+            "id": request_id,
+            "skill_name": request.skill_name,
+            "alert_level": request.alert_level,
+            "timestamp": datetime.now().timestamp(),
+            "image_url": "",
+            "detections": result.get("detections", [])
+        }
+        
+        # 只在触发预警时保存图片和发送消息
+        if not message["detections"] or not skill_manager.check_alert(
+            request.skill_name,
+            message["detections"],
+            request.alert_level
+        ):
+            return message
+        
+        image_path = ""
+        if not request.skip_storage:
+            # 上传完成后才生成访问URL，避免发布尚不存在的对象地址；
+            # 上传失败时不附带图片地址，检测结果和预警消息照常返回和发送
+            image_path = storage_manager.new_object_path("image_alert", "jpg")
+            try:
+                await storage_manager.upload(image_path, request.image_data, "image/jpeg")
+                message["image_url"] = storage_manager.get_object_url(image_path)
+            except Exception as e:
+                image_path = ""
+                logger.error(
+                    "Error saving alert image, publishing without image",
+                    extra={"request_id": request_id, "error": str(e)}
+                )
+        
+        if not request.skip_publish:
+            # 结果消息经本地预写队列发送，不等待消息队列确认；消息队列不可用时检测结果照常返回。
+            # 队列中的图片地址为对象路径，发送时再生成访问URL
+            try:
+                await alert_spool.put("message", {"message": {**message, "image_url": image_path}})
+            except Exception as e:
+                logger.error(
+                    "Error queueing detection result",
+                    extra={"request_id": request_id, "error": str(e)}
+                )
+        
+        return message
+    
+    async def _invoke_skill(self, request, shared_results: Optional[Dict]) -> Dict:
+        """取得图片处理名额后调用技能检测，推理请求由批处理调度器与其他请求合并"""
+        async with self._image_slots:
+            return await skill_manager.invoke_skill(
+                request.skill_name,
+                {"image": request.image_data},
+                shared_results
+            )
+    
     async def DetectVideoStream(self, request, context):
         """处理视频流检测请求"""
         try:
+            if placement_manager is not None:
+                # 保存视频流定义，由集群中持有租约的节点处理
+                stream_id = await placement_manager.add_stream(StreamDefinition(
+                    stream_id=video_processor.stream_id(request.stream_url, request.skill_name),
+                    stream_url=request.stream_url,
+                    skill_name=request.skill_name,
+                    alert_level=request.alert_level,
+                    frame_interval=request.frame_interval or None,
+                    roi=list(request.roi),
+                    schedule=request.schedule or None,
+                    motion_threshold=request.motion_threshold or None,
+                    min_frame_interval=request.min_frame_interval or None,
+                    max_frame_interval=request.max_frame_interval or None,
+                    decode_mode=request.decode_mode or None,
+                    detection_url=request.detection_url or None
+                ))
+                return vision_service_pb2.DetectionResponse(
+                    request_id=stream_id,
+                    status="success",
+                    message="Video stream scheduled"
+                )
+            
+            # 多进程模式下视频流由所属的工作进程处理
+            stub = self._owner_stub(request.stream_url)
+            if stub is not None:
+                return await self._forward(stub.DetectVideoStream, request, context)
+            
             # 启动视频流处理
             stream_id = await video_processor.process_stream(
                 stream_url=request.stream_url,
@@ -71,7 +283,12 @@ class VisionServiceServicer(vision_service_pb2_grpc.VisionServiceServicer):
                 alert_level=request.alert_level,
                 frame_interval=request.frame_interval,
                 roi=list(request.roi),
-                schedule=request.schedule
+                schedule=request.schedule,
+                motion_threshold=request.motion_threshold or None,
+                min_frame_interval=request.min_frame_interval or None,
+                max_frame_interval=request.max_frame_interval or None,
+                decode_mode=request.decode_mode or None,
+                detection_url=request.detection_url or None
             )
             
             return vision_service_pb2.DetectionResponse(
@@ -88,21 +305,172 @@ class VisionServiceServicer(vision_service_pb2_grpc.VisionServiceServicer):
                 status="error",
                 message=str(e)
             )
+    
+    async def StopVideoStream(self, request, context):
+        """停止视频流检测"""
+        try:
+            stream_id = video_processor.stream_id(request.stream_url, request.skill_name)
+            if placement_manager is not None:
+                # 删除视频流定义，持有租约的节点在下次协调时停止处理
+                await placement_manager.remove_stream(stream_id)
+                return vision_service_pb2.DetectionResponse(
+                    request_id=stream_id,
+                    status="success",
+                    message="Video stream processing stopped"
+                )
+            
+            stub = self._owner_stub(request.stream_url)
+            if stub is not None:
+                return await self._forward(stub.StopVideoStream, request, context)
+            
+            await video_processor.stop_stream(stream_id)
+            
+            return vision_service_pb2.DetectionResponse(
+                request_id=stream_id,
+                status="success",
+                message="Video stream processing stopped"
+            )
+            
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return vision_service_pb2.DetectionResponse(
+                request_id="",
+                status="error",
+                message=str(e)
+            )
+    
+    async def SubmitBatchJob(self, request, context):
+        """提交离线批量视频处理任务"""
+        try:
+            # 任务按job_id的一致性哈希分配到工作进程，查询请求由同一进程处理
+            if not request.job_id:
+                request.job_id = str(uuid.uuid4())
+            stub = self._owner_stub(request.job_id)
+            if stub is not None:
+                return await self._forward(
+                    stub.SubmitBatchJob,
+                    request,
+                    context,
+                    vision_service_pb2.BatchJobStatus
+                )
+            
+            for skill_name in request.skill_names:
+                if skill_manager.get_skill(skill_name) is None:
+                    raise ValueError(f"Skill {skill_name} not found")
+            
+            job = batch_job_manager.submit(
+                request.video_path,
+                list(request.skill_names),
+                request.frame_interval or None,
+                request.segment_seconds or None,
+                request.job_id
+            )
+            return self._batch_job_status(job)
+            
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return vision_service_pb2.BatchJobStatus(status="error", message=str(e))
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return vision_service_pb2.BatchJobStatus(status="error", message=str(e))
+    
+    async def GetBatchJob(self, request, context):
+        """查询批量任务状态，任务完成后返回检测结果"""
+        stub = self._owner_stub(request.job_id)
+        if stub is not None:
+            return await self._forward(
+                stub.GetBatchJob,
+                request,
+                context,
+                vision_service_pb2.BatchJobStatus
+            )
+        
+        job = batch_job_manager.get(request.job_id)
+        if job is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(f"Batch job {request.job_id} not found")
+            return vision_service_pb2.BatchJobStatus(
+                job_id=request.job_id,
+                status="error",
+                message="Batch job not found"
+            )
+        return self._batch_job_status(job)
+    
+    def _batch_job_status(self, job: BatchJob):
+        """构建批量任务状态响应"""
+        return vision_service_pb2.BatchJobStatus(
+            job_id=job.job_id,
+            status=job.status,
+            message=job.message,
+            segments_total=job.segments_total,
+            segments_done=job.segments_done,
+            frames=job.frames,
+            inferred_frames=job.inferred_frames,
+            frames_per_second=job.frames_per_second,
+            results=[to_detection_result(result) for result in job.results]
+        )
+    
+    async def _forward(self, method, request, context, response_type=None):
+        """将请求转发到所属工作进程，透传其返回的状态"""
+        try:
+            return await method(request, timeout=context.time_remaining())
+        except grpc.aio.AioRpcError as e:
+            context.set_code(e.code())
+            context.set_details(e.details())
+            response_type = response_type or vision_service_pb2.DetectionResponse
+            return response_type(status="error", message=e.details())
+    
+    def _owner_stub(self, stream_url: str):
+        """获取视频流所属工作进程的客户端，视频流属于当前进程时返回None
+        
+        视频流按stream_url的一致性哈希分配到工作进程，
+        同一视频流的所有控制请求都由同一进程处理。批量任务同样按job_id分配。
+        """
+        owner = self._workers.get(stream_url)
+        if owner == settings.GRPC_WORKER_INDEX:
+            return None
+        
+        stub = self._worker_stubs.get(owner)
+        if stub is None:
+            channel = grpc.aio.insecure_channel(worker_address(owner))
+            stub = vision_service_pb2_grpc.VisionServiceStub(channel)
+            self._worker_stubs[owner] = stub
+        return stub
+
+def worker_address(index: int) -> str:
+    """工作进程的内部地址"""
+    return f"127.0.0.1:{settings.GRPC_WORKER_BASE_PORT + index}"
 
 def serve():
-    """启动gRPC服务器"""
+    """启动gRPC服务器
+    
+    多进程模式下各工作进程通过SO_REUSEPORT共享服务端口，
+    并额外监听一个内部端口，接收其他进程转发的视频流请求。
+    """
+    max_message_length = settings.GRPC_MAX_MESSAGE_MB * 1024 * 1024
+    options = [
+        ("grpc.max_receive_message_length", max_message_length),
+        ("grpc.max_send_message_length", max_message_length)
+    ]
+    if settings.GRPC_WORKERS > 1:
+        options.append(("grpc.so_reuseport", 1))
+    
     server = grpc.aio.server(
-        futures.ThreadPoolExecutor(max_workers=settings.GRPC_MAX_WORKERS)
+        futures.ThreadPoolExecutor(max_workers=settings.GRPC_MAX_WORKERS),
+        options=options
     )
     vision_service_pb2_grpc.add_VisionServiceServicer_to_server(
         VisionServiceServicer(), server
     )
     server.add_insecure_port(f'[::]:{settings.GRPC_PORT}')
+    if settings.GRPC_WORKERS > 1:
+        server.add_insecure_port(worker_address(settings.GRPC_WORKER_INDEX))
     return server
 
 if __name__ == '__main__':
-    import asyncio
-    
     async def main():
         server = serve()
         await server.start()
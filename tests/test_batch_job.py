@@ -0,0 +1,60 @@
+import asyncio
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from core.batch_job import _run_segment, sample_grid_time, split_segments
+
+FPS = 25
+DURATION = 10.0
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, (64, 48))
+    for i in range(int(FPS * DURATION)):
+        writer.write(np.full((48, 64, 3), i % 256, dtype=np.uint8))
+    writer.release()
+    return path
+
+@pytest.fixture
+def skill_stub(monkeypatch):
+    """替换技能管理，每次推理都返回检测结果"""
+    async def invoke_skill(skill_name, input_data, shared_results=None):
+        return {"detections": [{"class_name": "person"}]}
+    
+    skill_manager = types.SimpleNamespace(
+        requires_image=lambda skill_name: False,
+        invoke_skill=invoke_skill
+    )
+    module = types.ModuleType("core.skill_manager")
+    module.skill_manager = skill_manager
+    monkeypatch.setitem(sys.modules, "core.skill_manager", module)
+
+def _sampled(video_path, start, end, frame_interval):
+    result = asyncio.run(_run_segment(video_path, ["person_detection"], start, end, frame_interval))
+    assert result["inferred"] == len(result["results"])
+    return [item["timestamp"] for item in result["results"]]
+
+def test_sampling_does_not_depend_on_segmentation(video_path, skill_stub):
+    for frame_interval in (0.1, 0.3, 1.0, 2.5):
+        whole = _sampled(video_path, 0.0, DURATION, frame_interval)
+        for segment_seconds in (3.0, 4.3):
+            split = [
+                timestamp
+                for start, end in split_segments(DURATION, segment_seconds)
+                for timestamp in _sampled(video_path, start, end, frame_interval)
+            ]
+            assert split == pytest.approx(whole)
+    
+    assert _sampled(video_path, 0.0, DURATION, 1.0) == pytest.approx([float(i) for i in range(10)])
+    assert _sampled(video_path, 0.0, 1.3, 0.3) == pytest.approx([0.0, 0.32, 0.6, 0.92, 1.2])
+
+def test_grid_time_on_grid_point():
+    assert sample_grid_time(0.3, 0.1) == pytest.approx(0.3)
+    assert sample_grid_time(0.3, 0.1, after=True) == pytest.approx(0.4)
+    assert sample_grid_time(0.31, 0.1) == pytest.approx(0.4)
+    assert sample_grid_time(5.0, 0) == 5.0
@@ -0,0 +1,97 @@
+import numpy as np
+
+from core.frame_buffer import CompressedFrameBuffer, FrameBufferManager, FrameRingBuffer
+
+def _frame(value):
+    return np.full((8, 8, 3), value, dtype=np.uint8)
+
+def test_frame_rate_follows_timestamps_after_interval_change():
+    buffer = FrameRingBuffer(6)
+    # 抽帧间隔从0.5秒变为0.25秒
+    for i, timestamp in enumerate((0.0, 0.5, 1.0, 1.25, 1.5, 1.75, 2.0)):
+        buffer.append(_frame(i), timestamp)
+    
+    assert [frame[0, 0, 0] for frame in buffer.snapshot()] == [1, 2, 3, 4, 5, 6]
+    assert buffer.frame_rate() == 5 / 1.5
+    
+    buffer.resize(3)
+    assert buffer.frame_rate() == 4.0
+    
+    compressed = CompressedFrameBuffer(3, codec="png")
+    for i, timestamp in enumerate((0.0, 1.0, 2.0, 2.5)):
+        compressed.append(_frame(i), timestamp)
+    assert compressed.frame_rate() == 2 / 1.5
+
+def test_set_fps_resizes_buffer():
+    manager = FrameBufferManager()
+    manager.budget = 0
+    manager.create("stream", 2)
+    write = manager.writer("stream")
+    for i in range(4):
+        write(_frame(i), i * 0.5)
+    capacity = manager.get_usage("stream")["capacity"]
+    
+    manager.set_fps("stream", 4)
+    usage = manager.get_usage("stream")
+    assert usage["capacity"] == usage["target_capacity"] == capacity * 2
+    assert usage["frames"] == 4
+    assert manager.get_usage()["total_bytes"] == usage["bytes"]
+
+def test_last_timestamp():
+    buffer = FrameRingBuffer(2)
+    assert buffer.last_timestamp is None
+    for i in range(3):
+        buffer.append(_frame(i), i * 0.5)
+    assert buffer.last_timestamp == 1.0
+    
+    compressed = CompressedFrameBuffer(2)
+    assert compressed.last_timestamp is None
+    compressed.append(_frame(0), 3.0)
+    assert compressed.last_timestamp == 3.0
+
+def test_snapshot_is_charged_to_budget():
+    manager = FrameBufferManager()
+    frame_nbytes = _frame(0).nbytes
+    manager.create("stream", 2)
+    capacity = manager.get_usage("stream")["capacity"]
+    manager.budget = frame_nbytes * capacity * 2
+    write = manager.writer("stream")
+    for i in range(capacity):
+        write(_frame(i), i * 0.5)
+    
+    snapshot = manager.snapshot("stream")
+    assert [frame[0, 0, 0] for frame in snapshot.frames] == list(range(capacity))
+    assert snapshot.fps == 2.0
+    usage = manager.get_usage()
+    assert usage["snapshot_bytes"] == snapshot.nbytes == frame_nbytes * capacity
+    assert usage["total_bytes"] == usage["snapshot_bytes"] + usage["streams"]["stream"]["bytes"]
+    
+    # 剩余预算只够截取部分帧，只截取最新的帧
+    partial = manager.snapshot("stream")
+    assert len(partial.frames) < capacity
+    assert partial.frames[-1][0, 0, 0] == capacity - 1
+    assert manager.get_usage()["total_bytes"] <= manager.budget
+    
+    # 预算不足最小深度时不截取
+    assert manager.snapshot("stream") is None
+    
+    snapshot.release()
+    partial.release()
+    snapshot.release()
+    usage = manager.get_usage()
+    assert usage["snapshot_bytes"] == 0
+    assert usage["total_bytes"] == usage["streams"]["stream"]["bytes"]
+
+def test_frame_at_timestamp():
+    buffer = FrameRingBuffer(3)
+    compressed = CompressedFrameBuffer(3, codec="png")
+    for i in range(5):
+        buffer.append(_frame(i), i * 0.5)
+        compressed.append(_frame(i), i * 0.5)
+    
+    for frames in (buffer, compressed):
+        # 缓冲区中为1.0、1.5、2.0秒的帧
+        assert frames.frame_at(0.9) is None
+        assert frames.frame_at(1.0)[0, 0, 0] == 2
+        assert frames.frame_at(1.7)[0, 0, 0] == 3
+        assert frames.frame_at(5.0)[0, 0, 0] == 4
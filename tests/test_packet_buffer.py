@@ -0,0 +1,73 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+
+av = pytest.importorskip("av")
+
+from core.stream_decoder import PacketStreamDecoder
+
+def _write_video(path: str, seconds: int = 3, fps: int = 10):
+    """生成H.264测试视频，每秒一个关键帧"""
+    with av.open(path, mode="w") as container:
+        stream = container.add_stream("libx264", rate=fps)
+        stream.width = 64
+        stream.height = 48
+        stream.pix_fmt = "yuv420p"
+        stream.options = {"g": str(fps)}
+        for i in range(seconds * fps):
+            image = np.full((48, 64, 3), i % 256, dtype=np.uint8)
+            frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+async def _decode_to_eof(decoder: PacketStreamDecoder):
+    await decoder.start()
+    # 解码线程在放入结束标记前已结束读取输入容器
+    while await decoder.read() is not None:
+        pass
+
+def _count_frames(data: bytes) -> int:
+    with av.open(io.BytesIO(data)) as container:
+        return sum(1 for _ in container.decode(video=0))
+
+def test_remux_after_decoder_eof(tmp_path):
+    path = str(tmp_path / "input.mp4")
+    _write_video(path)
+    
+    decoder = PacketStreamDecoder(path)
+    asyncio.run(_decode_to_eof(decoder))
+    
+    buffer = decoder.packet_buffer
+    assert len(buffer) > 0
+    
+    # 解码线程结束后输入容器仍由缓冲区持有
+    data = buffer.remux_to_mp4()
+    assert data
+    assert _count_frames(data) == len(buffer)
+    
+    # 释放缓冲区前截取的片段在释放后仍可封装
+    remux = buffer.remux_job()
+    buffer.close()
+    data = remux()
+    assert data
+    assert _count_frames(data) > 0
+    
+    # 释放后不再截取新的片段
+    assert buffer.remux_job() is None
+    assert buffer.decode_frame(0.0) is None
+
+def test_decode_frame_after_decoder_eof(tmp_path):
+    path = str(tmp_path / "input.mp4")
+    _write_video(path)
+    
+    decoder = PacketStreamDecoder(path, decode_frames=False)
+    asyncio.run(_decode_to_eof(decoder))
+    
+    image = decoder.packet_buffer.decode_frame(2.5)
+    assert image is not None
+    assert image.shape == (48, 64, 3)
+    decoder.packet_buffer.close()
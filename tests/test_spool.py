@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import struct
+
+from config.config import settings
+from core.spool import Spool
+
+def _read_records(path):
+    records = []
+    with open(path, "rb") as f:
+        while True:
+            prefix = f.read(8)
+            if len(prefix) < 8:
+                return records
+            header_length, payload_length = struct.unpack(">II", prefix)
+            header = json.loads(f.read(header_length))
+            records.append((header, f.read(payload_length)))
+
+async def _wait_for(condition, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+def test_failed_uploads_do_not_block_messages(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SPOOL_RETRY_INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(settings, "SPOOL_RETRY_MAX_DELAY", 0.01)
+    monkeypatch.setattr(settings, "SPOOL_MAX_ATTEMPTS", 3)
+    
+    async def run():
+        spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 20)
+        uploads = []
+        messages = []
+        
+        async def upload(header, payload):
+            if header["object_path"] == "broken.jpg":
+                raise ConnectionError("MinIO is unavailable")
+            uploads.append(header["object_path"])
+        
+        async def message(header, payload):
+            messages.append(header)
+        
+        spool.register_handler("upload", upload)
+        spool.register_handler("message", message)
+        spool.start()
+        
+        broken = await spool.put("upload", {"object_path": "broken.jpg"}, b"image")
+        await spool.put("message", {"id": "independent"})
+        await spool.put("message", {"id": "waits"}, after=[broken])
+        ok = await spool.put("upload", {"object_path": "ok.jpg"}, b"image")
+        await spool.put("message", {"id": "uploaded"}, after=[ok])
+        await spool.put("unknown", {})
+        
+        await _wait_for(lambda: len(messages) == 3 and not spool.get_usage()["in_flight_records"])
+        
+        # 不依赖失败上传的消息不被阻塞，依赖失败上传的消息带有failed_after
+        assert messages[0] == {"id": "independent"}
+        by_id = {header["id"]: header for header in messages}
+        assert by_id["waits"]["failed_after"] == [list(broken)]
+        assert "failed_after" not in by_id["uploaded"]
+        assert uploads == ["ok.jpg"]
+        
+        usage = spool.get_usage()
+        assert usage["dead_lettered_records"] == 2
+        await spool.stop()
+        
+        dead_letters = _read_records(os.path.join(str(tmp_path), "dead_letter"))
+        by_kind = {header["kind"]: (header, payload) for header, payload in dead_letters}
+        assert sorted(by_kind) == ["unknown", "upload"]
+        assert by_kind["upload"][0]["attempts"] == 3
+        assert by_kind["upload"][1] == b"image"
+        
+        # 所有记录已完成，重启后不再投递
+        spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 20)
+        spool.register_handler("upload", upload)
+        spool.register_handler("message", message)
+        spool.start()
+        await spool.put("message", {"id": "after-restart"})
+        await _wait_for(lambda: len(messages) == 4)
+        await spool.stop()
+        assert messages[-1] == {"id": "after-restart"}
+    
+    asyncio.run(run())
+
+def test_corrupt_record_is_skipped(tmp_path):
+    async def run():
+        spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 20)
+        delivered = []
+        
+        async def message(header, payload):
+            delivered.append(header["id"])
+        
+        spool.register_handler("message", message)
+        await spool.put("message", {"id": "first"})
+        await spool.put("message", {"id": "second"})
+        await spool.stop()
+        
+        # 破坏第一条记录的JSON头
+        path = os.path.join(str(tmp_path), "000000000001.seg")
+        with open(path, "r+b") as f:
+            f.seek(8)
+            f.write(b"#")
+        
+        spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 20)
+        spool.register_handler("message", message)
+        spool.start()
+        await _wait_for(lambda: delivered == ["second"])
+        assert spool.get_usage()["dropped_records"] == 1
+        await spool.stop()
+    
+    asyncio.run(run())
+
+def test_batch_handler_retries_only_failed_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SPOOL_RETRY_INITIAL_DELAY", 0.01)
+    monkeypatch.setattr(settings, "SPOOL_DELIVERY_CONCURRENCY", 1)
+    
+    async def run():
+        spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 20)
+        batches = []
+        failed_once = set()
+        
+        async def messages(records):
+            batches.append([header["id"] for header, _ in records])
+            errors = []
+            for header, _ in records:
+                if header["id"] % 3 == 0 and header["id"] not in failed_once:
+                    failed_once.add(header["id"])
+                    errors.append(ConnectionError("RocketMQ is unavailable"))
+                else:
+                    errors.append(None)
+            return errors
+        
+        spool.register_batch_handler("message", messages, 4)
+        for i in range(10):
+            await spool.put("message", {"id": i})
+        spool.start()
+        
+        await _wait_for(lambda: not spool.get_usage()["in_flight_records"] and batches)
+        await spool.stop()
+        
+        delivered = [i for batch in batches for i in batch]
+        assert all(len(batch) <= 4 for batch in batches)
+        assert len(batches[0]) > 1
+        # 失败的记录被单独重试，其他记录只投递一次
+        assert sorted(delivered) == sorted(list(range(10)) + [0, 3, 6, 9])
+    
+    asyncio.run(run())
@@ -0,0 +1,43 @@
+import asyncio
+
+import cv2
+import numpy as np
+
+from core.stream_decoder import StreamDecoder
+
+def _write_video(path, frames, fps=25):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (64, 48))
+    for i in range(frames):
+        writer.write(np.full((48, 64, 3), i, dtype=np.uint8))
+    writer.release()
+
+def test_drop_stale_still_writes_every_frame_to_sink(tmp_path):
+    path = str(tmp_path / "live.mp4")
+    _write_video(path, 60)
+    
+    async def run():
+        buffered = []
+        decoder = StreamDecoder(
+            path,
+            queue_size=2,
+            frame_sink=lambda frame, timestamp: buffered.append(timestamp),
+            drop_stale=True
+        )
+        await decoder.start()
+        
+        # 慢速消费，解码队列持续溢出
+        processed = 0
+        while True:
+            decoded = await decoder.read()
+            if decoded is None:
+                break
+            processed += 1
+            await asyncio.sleep(0.01)
+        
+        assert decoder.dropped > 0
+        assert processed + decoder.dropped == 60
+        # 被丢弃的帧在入队前已写入帧缓冲区
+        assert len(buffered) == 60
+        assert buffered == sorted(buffered)
+    
+    asyncio.run(run())